@@ -1,6 +1,6 @@
 from fastapi import FastAPI
 
-from . import admin, agent_groups, agents, auth, auth_sso, chat_proxy, dashboard, demo, models
+from . import admin, agent_groups, agents, auth, auth_sso, chat_proxy, dashboard, demo, metrics, models
 
 API_ROUTERS = (
     auth.router,
@@ -12,6 +12,7 @@ API_ROUTERS = (
     models.router,
     demo.router,
     agent_groups.router,
+    metrics.router,
 )
 
 
@@ -1,7 +1,9 @@
+from .chat_audit import router as chat_audit_router
 from .permissions import router as permissions_router
 from .resources import router as resources_router
 from .sso_settings import router as sso_settings_router
 from .system_settings import router as system_settings_router
+from .upstreams import router as upstreams_router
 from .sync_configs import router as sync_configs_router
 from .sync_tasks import router as sync_tasks_router
 from .users_roles_groups import router as users_roles_groups_router
@@ -14,6 +16,8 @@ ADMIN_MODULE_ROUTERS = (
     sync_tasks_router,
     sso_settings_router,
     system_settings_router,
+    upstreams_router,
+    chat_audit_router,
 )
 
 __all__ = ["ADMIN_MODULE_ROUTERS"]
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ... import models, schemas
+from ...auth import get_current_user
+from ...db import get_db
+from ...permissions import require_menu_action_async
+from ...services.chat_audit import (
+    BUCKET_SIZES,
+    list_chat_access,
+    resolve_time_range,
+    summarize_chat_access,
+)
+
+router = APIRouter(prefix="/chat-audit", tags=["admin_chat_audit"])
+
+_MAX_BUCKETS = 2000
+_DEFAULT_SPAN = timedelta(days=1)
+
+
+@router.get("/summary", response_model=list[schemas.ChatAccessBucket])
+async def summarize_chat_audit(
+    bucket: Literal["minute", "hour", "day"] = Query(default="hour"),
+    start: datetime | None = Query(default=None),
+    end: datetime | None = Query(default=None),
+    agent_id: str | None = Query(default=None),
+    user_id: int | None = Query(default=None),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.ChatAccessBucket]:
+    await require_menu_action_async(db, current_user, action="view", menu_id="admin")
+    start, end = resolve_time_range(start, end, default_span=_DEFAULT_SPAN)
+    if (end - start) / BUCKET_SIZES[bucket] > _MAX_BUCKETS:
+        raise HTTPException(status_code=400, detail="Time range has too many buckets")
+    rows = await summarize_chat_access(
+        db, start=start, end=end, bucket=bucket, agent_id=agent_id, user_id=user_id
+    )
+    return [schemas.ChatAccessBucket(**row) for row in rows]
+
+
+@router.get("/logs", response_model=list[schemas.ChatAccessLogOut])
+async def list_chat_audit_logs(
+    start: datetime | None = Query(default=None),
+    end: datetime | None = Query(default=None),
+    agent_id: str | None = Query(default=None),
+    user_id: int | None = Query(default=None),
+    before_id: int | None = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=1000),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.ChatAccessLogOut]:
+    await require_menu_action_async(db, current_user, action="view", menu_id="admin")
+    start, end = resolve_time_range(start, end, default_span=_DEFAULT_SPAN)
+    rows = await list_chat_access(
+        db,
+        start=start,
+        end=end,
+        agent_id=agent_id,
+        user_id=user_id,
+        before_id=before_id,
+        limit=limit,
+    )
+    return [
+        schemas.ChatAccessLogOut(
+            id=row.id,
+            occurred_at=row.occurred_at,
+            user_id=row.user_id,
+            agent_id=row.agent_id,
+            proxy_id=row.proxy_id,
+            transport=row.transport,
+            method=row.method,
+            path=row.path,
+            status_code=row.status_code,
+            bytes_sent=row.bytes_sent,
+            duration_ms=row.duration_ms,
+        )
+        for row in rows
+    ]
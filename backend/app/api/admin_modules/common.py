@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import os
+import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from uuid import uuid4
 
@@ -20,6 +21,7 @@ from ...permissions import (
 )
 from ...services.chat_links import build_proxy_chat_url, parse_upstream_chat_url
 from ...services.http_client import get_shared_async_client
+from ...services.upstream_health import is_upstream_failure_status, upstream_circuit
 
 
 def require_menu_view(user: models.User, db: Session, menu_id: str) -> None:
@@ -201,20 +203,20 @@ def expand_agent_group_permissions(
     if not group_actions:
         return {}
 
-    all_group_actions = group_actions.get(None, set())
     derived: dict[tuple[str, str | None], set[str]] = {}
-
-    agents = db.query(models.Agent).all()
-    for agent in agents:
-        groups = list(agent.groups or [])
-        if not groups and agent.group_name:
-            groups = [agent.group_name]
-        actions_for_agent: set[str] = set(all_group_actions)
-        for name in groups:
-            if name in group_actions:
-                actions_for_agent.update(group_actions[name])
-        if actions_for_agent:
-            derived.setdefault(("agent", agent.id), set()).update(actions_for_agent)
+    all_group_actions = group_actions.pop(None, None)
+    if all_group_actions:
+        for (agent_id,) in db.query(models.Agent.id).all():
+            derived[("agent", agent_id)] = set(all_group_actions)
+    if group_actions:
+        member = models.AgentGroupMember
+        rows = (
+            db.query(member.agent_id, member.group_name)
+            .join(models.Agent, models.Agent.id == member.agent_id)
+            .filter(member.group_name.in_(list(group_actions)))
+        )
+        for agent_id, name in rows.all():
+            derived.setdefault(("agent", agent_id), set()).update(group_actions[name])
     return derived
 
 
@@ -327,13 +329,36 @@ async def fit2cloud_request_async(
     accept: str = "application/json",
 ) -> dict:
     headers = {"accept": accept, "Authorization": fit2cloud_auth_header(token)}
+    circuit = upstream_circuit(base_url)
+    if circuit is not None and not circuit.allow_request():
+        raise HTTPException(
+            status_code=503,
+            detail=f"Upstream {base_url} is temporarily unavailable",
+            headers={"Retry-After": str(circuit.retry_after())},
+        )
     client = get_shared_async_client()
-    resp = await client.request(
-        method.upper(),
-        f"{base_url}{path}",
-        headers=headers,
-        json=json_body,
-    )
+    started = time.perf_counter()
+    try:
+        resp = await client.request(
+            method.upper(),
+            f"{base_url}{path}",
+            headers=headers,
+            json=json_body,
+        )
+    except BaseException as exc:
+        if circuit is not None:
+            if isinstance(exc, httpx.HTTPError):
+                circuit.record(False, time.perf_counter() - started, error=type(exc).__name__)
+            else:
+                circuit.record(None)
+        raise
+    if circuit is not None:
+        circuit.record(
+            not is_upstream_failure_status(resp.status_code),
+            time.perf_counter() - started,
+            error=f"HTTP {resp.status_code}",
+            judge_latency=method.upper() == "GET",
+        )
     resp.raise_for_status()
     data = resp.json()
     if isinstance(data, dict) and data.get("code") == 200:
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy import or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -9,8 +9,8 @@ from ...auth import get_current_user
 from ...db import get_db
 from ...permissions import (
     ACTION_ORDER,
-    expand_agent_group_permissions_async,
-    expand_resource_wildcards_async,
+    covered_actions_async,
+    effective_resources_async,
     get_user_role_names_async,
     is_super_admin,
     require_manage_menu_async,
@@ -21,6 +21,7 @@ from .common import (
     build_permission_items,
     collect_actions,
     expand_actions,
+    sorted_actions,
 )
 
 router = APIRouter()
@@ -39,23 +40,12 @@ def _permission_grant_out(grant: models.PermissionGrant) -> schemas.PermissionGr
     )
 
 
-async def _build_subject_permissions_summary(
-    *,
-    subject_type: str,
-    subject_id: str,
-    scope: str,
-    current_user: models.User,
-    db: AsyncSession,
-) -> schemas.PermissionSubjectSummary:
+async def _resolve_subject(
+    db: AsyncSession, subject_type: str, subject_id: str
+) -> tuple[models.User | None, list[str]]:
+    """The subject's user (None for a role subject) and the role names whose grants apply to it."""
     if subject_type not in {"user", "role"}:
         raise HTTPException(status_code=400, detail="Invalid subject type")
-    if scope not in {"menu", "resource"}:
-        raise HTTPException(status_code=400, detail="Invalid scope")
-
-    read_only = False
-    role_name: str | None = None
-    role_names: list[str] = []
-
     if subject_type == "user":
         try:
             user_id = int(subject_id)
@@ -64,98 +54,81 @@ async def _build_subject_permissions_summary(
         user = await db.get(models.User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
+        return user, await get_user_role_names_async(db, user)
+
+    role = (
+        await db.execute(select(models.Role).where(models.Role.name == subject_id))
+    ).scalar_one_or_none()
+    if not role:
+        raise HTTPException(status_code=404, detail="Role not found")
+    return None, [subject_id]
 
-        role_names = await get_user_role_names_async(db, user)
+
+async def _subject_action_maps(
+    db: AsyncSession,
+    *,
+    user: models.User | None,
+    role_names: list[str],
+    scope: str,
+) -> tuple[dict[tuple[str, str | None], set[str]], dict[tuple[str, str | None], set[str]]]:
+    """(direct, inherited) action maps of a subject, wildcards and group grants left symbolic.
+
+    A role subject (``user=None``) has only direct grants: those of ``role_names``.
+    """
+    grant = models.PermissionGrant
+    role_clause = (grant.subject_type == "role") & (grant.subject_id.in_(role_names)) & (grant.scope == scope)
+    if user is None:
+        role_grants = (await db.execute(select(grant).where(role_clause))).scalars().all()
+        return collect_actions(role_grants), {}
+
+    clause = [(grant.subject_type == "user") & (grant.subject_id == str(user.id)) & (grant.scope == scope)]
+    if role_names:
+        clause.append(role_clause)
+    grants = (await db.execute(select(grant).where(or_(*clause)))).scalars().all()
+    direct_map = collect_actions([item for item in grants if item.subject_type == "user"])
+    inherited_map = collect_actions([item for item in grants if item.subject_type == "role"])
+    return direct_map, inherited_map
+
+
+def _merge_action_maps(
+    *action_maps: dict[tuple[str, str | None], set[str]],
+) -> dict[tuple[str, str | None], set[str]]:
+    merged: dict[tuple[str, str | None], set[str]] = {}
+    for action_map in action_maps:
+        for key, actions in action_map.items():
+            merged.setdefault(key, set()).update(actions)
+    return merged
+
+
+async def _build_subject_permissions_summary(
+    *,
+    subject_type: str,
+    subject_id: str,
+    scope: str,
+    current_user: models.User,
+    db: AsyncSession,
+) -> schemas.PermissionSubjectSummary:
+    """The subject's grants as editor rows.
+
+    Resource grants stay symbolic: a wildcard grant is one item with ``resource_id=None`` and an
+    agent_group grant is not repeated on its member agents, so the summary grows with the grants
+    rather than the catalog. ``/permissions/effective-resources`` lists the concrete resources.
+    """
+    if scope not in {"menu", "resource"}:
+        raise HTTPException(status_code=400, detail="Invalid scope")
+
+    user, role_names = await _resolve_subject(db, subject_type, subject_id)
+    if user is not None:
         role_name = role_names[0] if role_names else None
-        if user.account == "admin" and not is_super_admin(current_user):
-            read_only = True
-
-        clause = [
-            (models.PermissionGrant.subject_type == "user")
-            & (models.PermissionGrant.subject_id == str(user_id))
-            & (models.PermissionGrant.scope == scope)
-        ]
-        if role_names:
-            clause.append(
-                (models.PermissionGrant.subject_type == "role")
-                & (models.PermissionGrant.subject_id.in_(role_names))
-                & (models.PermissionGrant.scope == scope)
-            )
-        grants = (await db.execute(select(models.PermissionGrant).where(or_(*clause)))).scalars().all()
-        user_grants = [grant for grant in grants if grant.subject_type == "user"]
-        role_grants = [grant for grant in grants if grant.subject_type == "role"]
-
-        direct_map = collect_actions(user_grants)
-        inherited_map = collect_actions(role_grants)
-
-        if scope == "resource":
-            direct_map = await expand_resource_wildcards_async(db, direct_map)
-            inherited_map = await expand_resource_wildcards_async(db, inherited_map)
-            direct_map = {key: set(actions) for key, actions in direct_map.items() if key[1] is not None}
-            inherited_map = {
-                key: set(actions) for key, actions in inherited_map.items() if key[1] is not None
-            }
-
-        effective_map: dict[tuple[str, str | None], set[str]] = {}
-        for key, actions in inherited_map.items():
-            effective_map.setdefault(key, set()).update(actions)
-        for key, actions in direct_map.items():
-            effective_map.setdefault(key, set()).update(actions)
-
-        if scope == "resource":
-            derived_from_direct = await expand_agent_group_permissions_async(db, direct_map)
-            derived_from_inherited = await expand_agent_group_permissions_async(db, inherited_map)
-            for key, actions in derived_from_direct.items():
-                effective_map.setdefault(key, set()).update(actions)
-            for key, actions in derived_from_inherited.items():
-                effective_map.setdefault(key, set()).update(actions)
-
-            inherited_display: dict[tuple[str, str | None], set[str]] = {}
-            for key, actions in inherited_map.items():
-                inherited_display.setdefault(key, set()).update(actions)
-            for key, actions in derived_from_inherited.items():
-                inherited_display.setdefault(key, set()).update(actions)
-            items = build_permission_items(effective_map, inherited_display)
-        else:
-            items = build_permission_items(effective_map, inherited_map)
+        read_only = user.account == "admin" and not is_super_admin(current_user)
     else:
-        role = (
-            await db.execute(select(models.Role).where(models.Role.name == subject_id))
-        ).scalar_one_or_none()
-        if not role:
-            raise HTTPException(status_code=404, detail="Role not found")
-
         role_name = subject_id
-        role_names = [subject_id]
-        if subject_id == "user":
-            read_only = True
-        elif subject_id == "admin" and not is_super_admin(current_user):
-            read_only = True
-
-        role_grants = (
-            await db.execute(
-                select(models.PermissionGrant).where(
-                    models.PermissionGrant.subject_type == "role",
-                    models.PermissionGrant.subject_id == subject_id,
-                    models.PermissionGrant.scope == scope,
-                )
-            )
-        ).scalars().all()
-        effective_map = collect_actions(role_grants)
-        if scope == "resource":
-            effective_map = await expand_resource_wildcards_async(db, effective_map)
-            effective_map = {
-                key: set(actions) for key, actions in effective_map.items() if key[1] is not None
-            }
-            derived_from_groups = await expand_agent_group_permissions_async(db, effective_map)
-            for key, actions in derived_from_groups.items():
-                effective_map.setdefault(key, set()).update(actions)
-            items = build_permission_items(effective_map, derived_from_groups)
-        else:
-            items = build_permission_items(effective_map, {})
+        read_only = subject_id == "user" or (subject_id == "admin" and not is_super_admin(current_user))
 
-    if scope == "resource":
-        items = [item for item in items if item.resource_id is not None]
+    direct_map, inherited_map = await _subject_action_maps(
+        db, user=user, role_names=role_names, scope=scope
+    )
+    effective_map = _merge_action_maps(inherited_map, direct_map)
 
     return schemas.PermissionSubjectSummary(
         subject_type=subject_type,
@@ -164,7 +137,7 @@ async def _build_subject_permissions_summary(
         role=role_name,
         roles=role_names,
         read_only=read_only,
-        items=items,
+        items=build_permission_items(effective_map, inherited_map),
     )
 
 
@@ -198,6 +171,52 @@ async def get_subject_permissions(
     )
 
 
+@router.get("/permissions/effective-resources", response_model=list[schemas.PermissionSubjectMatrixItem])
+async def list_effective_resources(
+    subject_type: str,
+    subject_id: str,
+    resource_type: str,
+    response: Response,
+    cursor: str | None = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=1000),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.PermissionSubjectMatrixItem]:
+    """Concrete resources of one type a subject reaches, wildcard and agent group grants applied.
+
+    Ordered by resource id; the next page's ``cursor`` is returned in ``X-Next-Cursor``.
+    """
+    await require_menu_action_async(db, current_user, action="view", menu_id="admin")
+    if resource_type not in {"agent", "model", "agent_group"}:
+        raise HTTPException(status_code=400, detail="Invalid resource type")
+    user, role_names = await _resolve_subject(db, subject_type, subject_id)
+    direct_map, inherited_map = await _subject_action_maps(
+        db, user=user, role_names=role_names, scope="resource"
+    )
+    effective_map = _merge_action_maps(inherited_map, direct_map)
+
+    page, next_cursor = await effective_resources_async(
+        db, effective_map, resource_type, cursor=cursor, limit=limit
+    )
+    inherited = await covered_actions_async(
+        db, inherited_map, [(resource_type, resource_id) for resource_id, _ in page]
+    )
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [
+        schemas.PermissionSubjectMatrixItem(
+            resource_type=resource_type,
+            resource_id=resource_id,
+            actions=sorted_actions(actions),
+            inherited_actions=sorted_actions(
+                inherited_map.get((resource_type, resource_id), set())
+                | inherited.get((resource_type, resource_id), set())
+            ),
+        )
+        for resource_id, actions in page
+    ]
+
+
 @router.put("/permissions/subject", response_model=schemas.PermissionSubjectSummary)
 async def update_subject_permissions(
     payload: schemas.PermissionSubjectUpdate,
@@ -209,48 +228,13 @@ async def update_subject_permissions(
     subject_id = payload.subject_id
     scope = payload.scope
 
-    if subject_type == "user":
-        try:
-            user_id = int(subject_id)
-        except ValueError as exc:
-            raise HTTPException(status_code=400, detail="Invalid user id") from exc
-        user = await db.get(models.User, user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    user, role_names = await _resolve_subject(db, subject_type, subject_id)
+    if user is not None:
         assert_permission_editable(current_user, target_user=user)
-        role_names = await get_user_role_names_async(db, user)
-        role_grants = []
-        if role_names:
-            role_grants = (
-                await db.execute(
-                    select(models.PermissionGrant).where(
-                        models.PermissionGrant.subject_type == "role",
-                        models.PermissionGrant.subject_id.in_(role_names),
-                        models.PermissionGrant.scope == scope,
-                    )
-                )
-            ).scalars().all()
-        role_map_raw = collect_actions(role_grants)
-        if scope == "resource":
-            role_map_raw = await expand_resource_wildcards_async(db, role_map_raw)
-            role_map_raw = {
-                key: set(actions) for key, actions in role_map_raw.items() if key[1] is not None
-            }
-            role_map_effective = {key: set(actions) for key, actions in role_map_raw.items()}
-            derived_from_role = await expand_agent_group_permissions_async(db, role_map_effective)
-            for key, actions in derived_from_role.items():
-                role_map_effective.setdefault(key, set()).update(actions)
-        else:
-            role_map_effective = role_map_raw
+        _, role_map = await _subject_action_maps(db, user=user, role_names=role_names, scope=scope)
     else:
-        role = (
-            await db.execute(select(models.Role).where(models.Role.name == subject_id))
-        ).scalar_one_or_none()
-        if not role:
-            raise HTTPException(status_code=404, detail="Role not found")
         assert_permission_editable(current_user, target_role=subject_id)
-        role_map_raw = {}
-        role_map_effective = {}
+        role_map = {}
 
     desired_map: dict[tuple[str, str | None], set[str]] = {}
     for item in payload.items:
@@ -264,28 +248,26 @@ async def update_subject_permissions(
             raise HTTPException(status_code=400, detail="Invalid menu id")
         if scope == "resource" and item.resource_type not in {"agent", "model", "agent_group"}:
             raise HTTPException(status_code=400, detail="Invalid resource type")
-        if scope == "resource" and not item.resource_id:
+        if scope == "resource" and item.resource_id == "":
             raise HTTPException(status_code=400, detail="Resource scope requires resource_id")
+        # resource_id=None is a wildcard item, as returned by the summary.
         desired_map[(item.resource_type, item.resource_id)] = actions
 
-    direct_map: dict[tuple[str, str | None], set[str]] = {}
-    group_derived_from_desired = (
-        await expand_agent_group_permissions_async(db, desired_map) if scope == "resource" else {}
-    )
+    role_covered: dict[tuple[str, str | None], set[str]] = {}
+    group_covered: dict[tuple[str, str | None], set[str]] = {}
+    if scope == "resource":
+        role_covered = await covered_actions_async(db, role_map, desired_map)
+        desired_groups = {key: actions for key, actions in desired_map.items() if key[0] == "agent_group"}
+        group_covered = await covered_actions_async(db, desired_groups, desired_map)
 
+    direct_map: dict[tuple[str, str | None], set[str]] = {}
     for key, actions in desired_map.items():
-        resource_type, resource_id = key
         remaining = set(actions)
-
         if subject_type == "user":
-            inherited_actions = set(role_map_effective.get(key, set()))
-            if resource_id is None:
-                inherited_actions.update(role_map_raw.get((resource_type, None), set()))
-            remaining -= inherited_actions
-
-        if scope == "resource" and resource_type == "agent":
-            remaining -= group_derived_from_desired.get(key, set())
-
+            remaining -= role_map.get(key, set())
+            remaining -= role_covered.get(key, set())
+        if key[0] == "agent":
+            remaining -= group_covered.get(key, set())
         if remaining:
             direct_map[key] = remaining
 
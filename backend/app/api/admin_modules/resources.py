@@ -22,6 +22,7 @@ from ...permissions import (
 )
 from ...services.chat_user_sync import create_agent_chat_user_sync_task, sync_task_out
 from ...services.chat_user_sync import update_agent_chat_user_accesses
+from ...services.proxy_routes import invalidate_proxy_routes
 from ...services.serializers import agent_detail, model_detail
 from ...tasks import enqueue_agent_chat_user_sync
 from .common import (
@@ -383,6 +384,7 @@ async def create_agent(
     )
     db.add(agent)
     await db.commit()
+    invalidate_proxy_routes(agent.proxy_id)
     await db.refresh(agent)
     return agent_detail(agent)
 
@@ -417,9 +419,7 @@ async def update_agent(
                 detail="Synced agents only allow status updates",
             )
 
-    groups = list(agent.groups or [])
-    if not groups and agent.group_name:
-        groups = [agent.group_name]
+    groups = models.agent_group_names(agent)
     has_group_permission = False
     for group in groups:
         if await has_permission_async(
@@ -480,6 +480,7 @@ async def update_agent(
         agent.group_name = groups[0] if groups else ""
 
     await db.commit()
+    invalidate_proxy_routes(agent.proxy_id)
     await db.refresh(agent)
     return agent_detail(agent)
 
@@ -512,8 +513,10 @@ async def delete_agent(
     await db.execute(delete(models.AgentChatUserAccess).where(models.AgentChatUserAccess.agent_id == agent_id))
     await db.execute(delete(models.SyncTask).where(models.SyncTask.agent_id == agent_id))
 
+    proxy_id = agent.proxy_id
     await db.delete(agent)
     await db.commit()
+    invalidate_proxy_routes(proxy_id)
     return {"status": "deleted"}
 
 
@@ -569,9 +572,7 @@ async def update_agent_chat_users(
     if not agent.sync_config_id:
         raise HTTPException(status_code=400, detail="智能体缺少同步配置")
 
-    agent_groups = list(agent.groups or [])
-    if not agent_groups and agent.group_name:
-        agent_groups = [agent.group_name]
+    agent_groups = models.agent_group_names(agent)
     decision = await evaluate_permission_async(
         db,
         current_user,
@@ -626,7 +627,9 @@ async def import_agents(
     if not isinstance(items, list):
         raise HTTPException(status_code=400, detail="Unexpected response format")
 
-    return await db.run_sync(lambda sync_db: _import_agents_sync(sync_db, current_user, items))
+    result = await db.run_sync(lambda sync_db: _import_agents_sync(sync_db, current_user, items))
+    invalidate_proxy_routes()
+    return result
 
 
 @router.post("/agents/sync-fit2cloud", response_model=schemas.AgentSyncResponse)
@@ -689,5 +692,6 @@ async def sync_fit2cloud_agents(
         errors.extend(workspace_errors)
 
     await db.commit()
+    invalidate_proxy_routes()
     total = imported + updated
     return schemas.AgentSyncResponse(imported=imported, updated=updated, total=total, errors=errors)
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from urllib.parse import urlparse
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ... import models, schemas
+from ...auth import get_current_user
+from ...db import get_db
+from ...permissions import require_menu_action_async
+from ...services.http_client import upstream_pool_stats, websocket_stats
+from ...services.proxy_routes import invalidate_proxy_routes
+from ...services.upstream_balancer import (
+    get_upstream_balancer,
+    normalize_upstream_targets,
+)
+from ...services.upstream_health import get_upstream_health
+
+router = APIRouter(prefix="/upstreams", tags=["admin_upstreams"])
+
+
+@router.get("/pools", response_model=list[schemas.UpstreamPoolStats])
+async def list_upstream_pools(
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.UpstreamPoolStats]:
+    await require_menu_action_async(db, current_user, action="view", menu_id="admin")
+    return [schemas.UpstreamPoolStats(**item) for item in upstream_pool_stats()]
+
+
+@router.get("/websockets", response_model=list[schemas.UpstreamWebSocketStats])
+async def list_upstream_websockets(
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.UpstreamWebSocketStats]:
+    await require_menu_action_async(db, current_user, action="view", menu_id="admin")
+    return [schemas.UpstreamWebSocketStats(**item) for item in websocket_stats()]
+
+
+@router.get("/breakers", response_model=list[schemas.UpstreamBreakerStats])
+async def list_upstream_breakers(
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.UpstreamBreakerStats]:
+    await require_menu_action_async(db, current_user, action="view", menu_id="admin")
+    return [schemas.UpstreamBreakerStats(**item) for item in get_upstream_health().snapshot()]
+
+
+@router.post("/breakers/reset", response_model=list[schemas.UpstreamBreakerStats])
+async def reset_upstream_breakers(
+    base_url: str | None = Query(default=None),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.UpstreamBreakerStats]:
+    await require_menu_action_async(db, current_user, action="edit", menu_id="admin")
+    registry = get_upstream_health()
+    registry.reset(base_url)
+    return [schemas.UpstreamBreakerStats(**item) for item in registry.snapshot()]
+
+
+@router.get("/balancer", response_model=list[schemas.UpstreamBalancerStats])
+async def list_upstream_balancer(
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.UpstreamBalancerStats]:
+    await require_menu_action_async(db, current_user, action="view", menu_id="admin")
+    return [schemas.UpstreamBalancerStats(**item) for item in get_upstream_balancer().snapshot()]
+
+
+def _agent_upstream_targets(agent: models.Agent) -> schemas.AgentUpstreamTargets:
+    targets = normalize_upstream_targets(agent.upstream_base_url or "", agent.upstream_targets)
+    return schemas.AgentUpstreamTargets(
+        agent_id=agent.id,
+        targets=[
+            schemas.UpstreamTargetItem(base_url=item.base_url, weight=item.weight, health_path=item.health_path)
+            for item in targets
+        ],
+    )
+
+
+async def _get_agent_or_404(db: AsyncSession, agent_id: str) -> models.Agent:
+    agent = (await db.execute(select(models.Agent).where(models.Agent.id == agent_id))).scalar_one_or_none()
+    if not agent:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return agent
+
+
+@router.get("/agents/{agent_id}/targets", response_model=schemas.AgentUpstreamTargets)
+async def get_agent_upstream_targets(
+    agent_id: str,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> schemas.AgentUpstreamTargets:
+    await require_menu_action_async(db, current_user, action="view", menu_id="admin")
+    return _agent_upstream_targets(await _get_agent_or_404(db, agent_id))
+
+
+@router.put("/agents/{agent_id}/targets", response_model=schemas.AgentUpstreamTargets)
+async def update_agent_upstream_targets(
+    agent_id: str,
+    payload: schemas.AgentUpstreamTargetsUpdate,
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> schemas.AgentUpstreamTargets:
+    await require_menu_action_async(db, current_user, action="edit", menu_id="admin")
+    agent = await _get_agent_or_404(db, agent_id)
+    targets = []
+    for item in payload.targets:
+        base_url = item.base_url.strip().rstrip("/")
+        parsed = urlparse(base_url)
+        if parsed.scheme not in {"http", "https"} or not parsed.netloc:
+            raise HTTPException(status_code=400, detail=f"Invalid upstream URL: {item.base_url}")
+        health_path = item.health_path.strip()
+        if health_path and not health_path.startswith("/"):
+            raise HTTPException(status_code=400, detail=f"Health path must start with '/': {item.health_path}")
+        target = {"base_url": base_url, "weight": item.weight}
+        if health_path:
+            target["health_path"] = health_path
+        targets.append(target)
+    agent.upstream_targets = targets
+    await db.commit()
+    invalidate_proxy_routes(agent.proxy_id)
+    await db.refresh(agent)
+    return _agent_upstream_targets(agent)
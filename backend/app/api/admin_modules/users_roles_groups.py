@@ -8,6 +8,7 @@ from ... import models, schemas, security
 from ...auth import get_current_user
 from ...db import get_db
 from ...permissions import get_user_role_names_async, require_manage_menu_async, require_menu_action_async
+from ...services.proxy_routes import invalidate_proxy_routes
 from .common import normalize_roles
 
 router = APIRouter()
@@ -472,11 +473,21 @@ async def delete_agent_group(
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     group_name = group.name
-    agents = (await db.execute(select(models.Agent))).scalars().all()
+    agents = (
+        await db.execute(
+            select(models.Agent).where(
+                models.Agent.id.in_(
+                    select(models.AgentGroupMember.agent_id).where(
+                        models.AgentGroupMember.group_name == group_name
+                    )
+                )
+            )
+        )
+    ).scalars().all()
     for agent in agents:
-        if group_name in (agent.groups or []):
-            agent.groups = [g for g in (agent.groups or []) if g != group_name]
-            agent.group_name = agent.groups[0] if agent.groups else ""
+        agent.groups = [g for g in models.agent_group_names(agent) if g != group_name]
+        agent.group_name = agent.groups[0] if agent.groups else ""
     await db.delete(group)
     await db.commit()
+    invalidate_proxy_routes()
     return {"status": "deleted"}
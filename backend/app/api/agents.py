@@ -1,37 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import JSONResponse
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import load_only
 
 from .. import models, schemas
 from ..auth import get_current_user
 from ..db import get_db
 from ..permissions import evaluate_permission_async, is_super_admin, require_menu_action_async
+from ..services.agent_catalog import AGENT_SUMMARY_COLUMNS, list_agent_rows
 from ..services.chat_user_sync import build_agent_chat_user_view, user_can_view_synced_agent_async
 from ..services.serializers import agent_detail, agent_summary
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
 
-def _resolve_agent_groups(agent: models.Agent) -> list[str]:
-    groups = list(agent.groups or [])
-    if not groups and agent.group_name:
-        groups = [agent.group_name]
-    normalized: list[str] = []
-    seen: set[str] = set()
-    for item in groups:
-        name = str(item or "").strip()
-        if not name or name in seen:
-            continue
-        seen.add(name)
-        normalized.append(name)
-    return normalized
-
-
 async def _can_view_agent_async(db: AsyncSession, user: models.User, agent: models.Agent) -> bool:
     if is_super_admin(user):
         return True
-    groups = _resolve_agent_groups(agent)
+    groups = models.agent_group_names(agent)
     permission = await evaluate_permission_async(
         db,
         user,
@@ -55,7 +41,7 @@ async def _can_manage_agent_chat_users_async(
 ) -> bool:
     if is_super_admin(user):
         return True
-    groups = _resolve_agent_groups(agent)
+    groups = models.agent_group_names(agent)
     permission = await evaluate_permission_async(
         db,
         user,
@@ -70,36 +56,46 @@ async def _can_manage_agent_chat_users_async(
 
 @router.get("", response_model=list[schemas.AgentSummary])
 async def list_agents(
+    response: Response,
     include_description: bool = True,
+    q: str = Query(default="", max_length=255),
+    fields: str | None = Query(default=None),
+    cursor: str | None = Query(default=None),
+    limit: int | None = Query(default=None, ge=1, le=1000),
     current_user: models.User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
-) -> list[schemas.AgentSummary]:
+):
+    """Visible agents, newest first.
+
+    ``limit`` enables keyset paging: the next page's ``cursor`` is returned in ``X-Next-Cursor``.
+    ``fields`` (comma separated AgentSummary fields) returns only those keys and loads only their
+    columns.
+    """
     await require_menu_action_async(db, current_user, action="view", menu_id="agents")
-    statement = select(models.Agent)
+    selected = list(AGENT_SUMMARY_COLUMNS)
+    if fields is not None:
+        selected = [item.strip() for item in fields.split(",") if item.strip()]
+        unknown = sorted(set(selected) - set(AGENT_SUMMARY_COLUMNS))
+        if unknown or not selected:
+            raise HTTPException(status_code=400, detail=f"Invalid fields: {', '.join(unknown)}")
     if not include_description:
-        statement = statement.options(
-            load_only(
-                models.Agent.id,
-                models.Agent.name,
-                models.Agent.status,
-                models.Agent.owner,
-                models.Agent.last_run,
-                models.Agent.url,
-                models.Agent.group_name,
-                models.Agent.groups,
-                models.Agent.source_type,
-                models.Agent.is_synced,
-            )
+        selected = [item for item in selected if item != "description"]
+    try:
+        rows, next_cursor = await list_agent_rows(
+            db, current_user, fields=selected, search=q.strip(), cursor=cursor, limit=limit
         )
-    agents = (await db.execute(statement.order_by(models.Agent.created_at.desc()))).scalars().all()
-    if is_super_admin(current_user):
-        return [agent_summary(agent, include_description=include_description) for agent in agents]
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-    visible: list[schemas.AgentSummary] = []
-    for agent in agents:
-        if await _can_view_agent_async(db, current_user, agent):
-            visible.append(agent_summary(agent, include_description=include_description))
-    return visible
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    summaries = [agent_summary(row, include_description="description" in selected) for row in rows]
+    if fields is not None:
+        include = set(selected)
+        return JSONResponse(
+            [summary.model_dump(include=include) for summary in summaries], headers=headers
+        )
+    response.headers.update(headers)
+    return summaries
 
 
 @router.get("/{agent_id}", response_model=schemas.AgentDetail)
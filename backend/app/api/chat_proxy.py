@@ -1,23 +1,101 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-
+import tempfile
+import time
+import weakref
+from collections.abc import AsyncIterator, Callable
+from functools import partial
+from urllib.parse import parse_qsl, quote, urlencode, urlparse
+
+import anyio
 import httpx
-from fastapi import APIRouter, Depends, HTTPException, Request, Response
-from fastapi.responses import RedirectResponse
-from sqlalchemy import select
+from anyio import AsyncFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+    WebSocket,
+    status,
+)
+from fastapi.responses import RedirectResponse, StreamingResponse
+from jose import JWTError, jwt
 from sqlalchemy.ext.asyncio import AsyncSession
-from urllib.parse import parse_qsl, quote, urlencode
-from urllib.parse import urlparse
+from starlette.requests import HTTPConnection
+from starlette.websockets import WebSocketState
+from websockets.asyncio.client import ClientConnection
+from websockets.asyncio.client import connect as websocket_connect
+from websockets.exceptions import InvalidStatus, WebSocketException
 
 from .. import models
 from ..auth import get_user_from_token
 from ..config import settings
-from ..db import get_db
-from ..permissions import evaluate_permission_async, require_menu_action_async
+from ..db import get_db, release_session
+from ..permissions import (
+    evaluate_permission_async,
+    get_permission_decision_cache,
+    require_menu_action_async,
+)
+from ..services.admission import (
+    AdmissionPermit,
+    AdmissionRejected,
+    chat_admission_scopes,
+    get_admission_controller,
+)
+from ..services.asset_cache import (
+    CachedAsset,
+    asset_cache_key,
+    freshness_lifetime,
+    get_asset_cache,
+    is_cacheable_asset_request,
+)
+from ..services.chat_audit import get_chat_audit_log
 from ..services.chat_links import build_proxy_chat_url, build_upstream_chat_url
+from ..services.chat_usage import UsageTap, usage_tap_for
 from ..services.chat_user_sync import user_can_view_synced_agent_async
+from ..services.coalescing import Flight, SharedResponse, get_request_coalescer
+from ..services.compression import (
+    accepted_encodings,
+    compress_bytes,
+    encode_stream,
+    is_compressible,
+    negotiate_encoding,
+    supported_encodings,
+    upstream_accept_encoding,
+)
+from ..services.hedging import CHAT_PROXY_HEDGES, HEDGEABLE_METHODS, get_hedge_policy
+from ..services.http_client import (
+    get_upstream_client,
+    get_websocket_tracker,
+    upstream_pool_key,
+)
+from ..services.metrics import (
+    CHAT_PROXY_DB_HOLD_SECONDS,
+    CHAT_PROXY_FALLBACKS,
+    CHAT_PROXY_REQUEST_SECONDS,
+    CHAT_PROXY_TTFB_SECONDS,
+)
+from ..services.proxy_routes import (
+    ProxyRoute,
+    get_upstream_path_preferences,
+    resolve_proxy_route,
+    resolve_proxy_routes,
+)
+from ..services.upstream_balancer import (
+    UpstreamLease,
+    UpstreamTarget,
+    get_upstream_balancer,
+    upstream_target_key,
+)
+from ..services.upstream_health import (
+    CircuitBreaker,
+    is_upstream_failure_status,
+    upstream_circuit,
+)
 
 router = APIRouter(tags=["chat_proxy"])
 logger = logging.getLogger(__name__)
@@ -52,8 +130,17 @@ _RESPONSE_HEADER_BLOCKLIST = {
     "transfer-encoding",
     "upgrade",
 }
+_FALLBACK_STATUS_CODES = {400, 401, 403, 404, 405}
 _PROXY_ID_COOKIE = "chat_proxy_id"
 _AUTH_COOKIE = "chat_proxy_auth"
+_UPSTREAM_COOKIE = "chat_proxy_upstream"
+_CHAT_ACCESS_ACTION = "chat"
+_REWRITABLE_CONTENT_TYPES = ("application/json", "application/x-www-form-urlencoded")
+_BODY_REPLAY_CHUNK_SIZE = 64 * 1024
+_TOKEN_REWRITE_RESPONSE_TYPES = ("json", "text/event-stream")
+_CONDITIONAL_REQUEST_HEADERS = ("if-none-match", "if-modified-since", "if-match", "if-unmodified-since")
+_ASSET_CACHE_HEADER = "x-chat-proxy-cache"
+_ASSET_READ_CHUNK_SIZE = 64 * 1024
 _AUTH_QUERY_KEY = "_auth"
 _AUTH_REQUIRED_DETAIL = "访问需要登录"
 _PERMISSION_REQUIRED_DETAIL = "访问需要权限"
@@ -61,23 +148,26 @@ _TOKEN_QUERY_KEYS = {"accesstoken", "acesstoken", "token"}
 _TOKEN_JSON_KEYS = {"accesstoken", "acesstoken", "token"}
 _CHAT_COOKIE_MAX_AGE = max(int(settings.ACCESS_TOKEN_EXPIRE_MINUTES or 1) * 60, 60)
 
+# Proxy helpers accept ORM agents as well as cached route snapshots.
+_ChatTarget = models.Agent | ProxyRoute
+
 
 def _normalize_token_key(raw_key: str) -> str:
     return str(raw_key).replace("_", "").replace("-", "").lower()
 
 
-def _proxy_request_headers(request: Request) -> dict[str, str]:
+def _proxy_request_headers(request: HTTPConnection) -> dict[str, str]:
     headers: dict[str, str] = {}
     for key, value in request.headers.items():
         if key.lower() in _REQUEST_HEADER_BLOCKLIST:
             continue
         headers[key] = value
-    # Keep payload deterministic and avoid compression/header mismatch on proxy responses.
-    headers["accept-encoding"] = "identity"
+    # Only advertise codings the proxy can decode when a response body has to be rewritten.
+    headers["accept-encoding"] = upstream_accept_encoding() if settings.CHAT_PROXY_COMPRESSION else "identity"
     return headers
 
 
-def _rewrite_location(location: str, agent: models.Agent) -> str:
+def _rewrite_location(location: str, agent: _ChatTarget) -> str:
     token = agent.upstream_token or ""
     proxy_id = agent.proxy_id or ""
     if not token or not proxy_id:
@@ -95,7 +185,7 @@ def _rewrite_location(location: str, agent: models.Agent) -> str:
     return location
 
 
-def _proxy_response_headers(headers: httpx.Headers, agent: models.Agent) -> dict[str, str]:
+def _proxy_response_headers(headers: httpx.Headers, agent: _ChatTarget) -> dict[str, str]:
     forwarded: dict[str, str] = {}
     for key, value in headers.items():
         lower = key.lower()
@@ -108,7 +198,7 @@ def _proxy_response_headers(headers: httpx.Headers, agent: models.Agent) -> dict
     return forwarded
 
 
-async def _agent_from_referer(db: AsyncSession, referer: str) -> models.Agent | None:
+async def _agent_from_referer(db: AsyncSession, referer: str) -> ProxyRoute | None:
     if not referer:
         return None
     try:
@@ -121,19 +211,17 @@ async def _agent_from_referer(db: AsyncSession, referer: str) -> models.Agent |
     referer_proxy_id = parts[1]
     if not referer_proxy_id:
         return None
-    return (
-        await db.execute(select(models.Agent).where(models.Agent.proxy_id == referer_proxy_id))
-    ).scalar_one_or_none()
+    return await resolve_proxy_route(db, referer_proxy_id)
 
 
-async def _agent_from_cookie(db: AsyncSession, request: Request) -> models.Agent | None:
+async def _agent_from_cookie(db: AsyncSession, request: HTTPConnection) -> ProxyRoute | None:
     proxy_id = (request.cookies.get(_PROXY_ID_COOKIE) or "").strip()
     if not proxy_id:
         return None
-    return (await db.execute(select(models.Agent).where(models.Agent.proxy_id == proxy_id))).scalar_one_or_none()
+    return await resolve_proxy_route(db, proxy_id)
 
 
-async def _agent_from_query(db: AsyncSession, query: str) -> models.Agent | None:
+async def _agent_from_query(db: AsyncSession, query: str) -> ProxyRoute | None:
     if not query:
         return None
     params = parse_qsl(query, keep_blank_values=True)
@@ -153,41 +241,44 @@ async def _agent_from_query(db: AsyncSession, query: str) -> models.Agent | None
     if not candidates:
         return None
 
-    agents = (
-        await db.execute(select(models.Agent).where(models.Agent.proxy_id.in_(candidates)))
-    ).scalars().all()
-    if not agents:
+    by_proxy_id = await resolve_proxy_routes(db, candidates)
+    if not by_proxy_id:
         return None
 
-    by_proxy_id = {agent.proxy_id: agent for agent in agents}
     for candidate in candidates:
         if candidate in by_proxy_id:
             return by_proxy_id[candidate]
     return None
 
 
-def _build_upstream_paths(agent: models.Agent, rest: str) -> list[str]:
+def _build_upstream_paths(agent: _ChatTarget, rest: str) -> list[str]:
     rest = rest.lstrip("/")
     if not rest:
         return [f"/chat/{agent.upstream_token}"]
     return [f"/chat/{rest}", f"/chat/{agent.upstream_token}/{rest}"]
 
 
-def _is_chat_available(agent: models.Agent) -> bool:
+def _upstream_path_prefix(upstream_paths: list[str]) -> str:
+    # Preferences are learned per first segment after /chat/ (e.g. "api", "assets").
+    rest = upstream_paths[0].removeprefix("/chat/") if upstream_paths else ""
+    return rest.split("/", 1)[0]
+
+
+def _is_chat_available(agent: _ChatTarget) -> bool:
     if not bool(getattr(agent, "is_synced", False)):
         return True
     return (agent.status or "").strip().lower() == "active"
 
 
 async def _resolve_proxy_target(
-    db: AsyncSession, request: Request, request_path: str
-) -> tuple[models.Agent, list[str]]:
+    db: AsyncSession, request: HTTPConnection, request_path: str
+) -> tuple[ProxyRoute, list[str]]:
     parts = [part for part in request_path.split("/") if part]
     if not parts:
         raise HTTPException(status_code=404, detail="Chat endpoint not found")
 
     first = parts[0]
-    agent = (await db.execute(select(models.Agent).where(models.Agent.proxy_id == first))).scalar_one_or_none()
+    agent = await resolve_proxy_route(db, first)
     if agent:
         rest = "/".join(parts[1:])
         return agent, _build_upstream_paths(agent, rest)
@@ -210,7 +301,7 @@ async def _resolve_proxy_target(
     raise HTTPException(status_code=404, detail="Chat endpoint not found")
 
 
-def _rewrite_query_for_upstream(agent: models.Agent, query: str) -> str:
+def _rewrite_query_for_upstream(agent: _ChatTarget, query: str) -> str:
     if not query:
         return ""
     params = parse_qsl(query, keep_blank_values=True)
@@ -239,7 +330,7 @@ def _rewrite_query_for_upstream(agent: models.Agent, query: str) -> str:
     return urlencode(next_params, doseq=True)
 
 
-def _extract_bearer_token(request: Request) -> str:
+def _extract_bearer_token(request: HTTPConnection) -> str:
     raw = (request.headers.get("authorization") or "").strip()
     if not raw:
         return ""
@@ -251,18 +342,27 @@ def _extract_bearer_token(request: Request) -> str:
     return parts[1].strip()
 
 
-async def _resolve_authenticated_context(request: Request, db: AsyncSession) -> tuple[str, models.User]:
-    token_candidates = [
-        _extract_bearer_token(request),
-        (request.cookies.get(_AUTH_COOKIE) or "").strip(),
-    ]
-
-    checked: set[str] = set()
-    for candidate in token_candidates:
+def _auth_token_candidates(request: HTTPConnection) -> list[str]:
+    tokens: list[str] = []
+    for candidate in (_extract_bearer_token(request), request.cookies.get(_AUTH_COOKIE) or ""):
         token = (candidate or "").strip()
-        if not token or token in checked:
-            continue
-        checked.add(token)
+        if token and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def _token_max_age(token: str) -> float | None:
+    try:
+        exp = jwt.get_unverified_claims(token).get("exp")
+    except JWTError:
+        return None
+    if exp is None:
+        return None
+    return float(exp) - time.time()
+
+
+async def _resolve_authenticated_context(request: HTTPConnection, db: AsyncSession) -> tuple[str, models.User]:
+    for token in _auth_token_candidates(request):
         try:
             user = await get_user_from_token(token, db)
             return token, user
@@ -302,24 +402,9 @@ def _login_redirect_url(request: Request) -> str:
     return f"/login?redirect={quote(target, safe='')}"
 
 
-def _resolve_agent_groups(agent: models.Agent) -> list[str]:
-    groups = list(agent.groups or [])
-    if not groups and agent.group_name:
-        groups = [agent.group_name]
-    normalized: list[str] = []
-    seen: set[str] = set()
-    for item in groups:
-        name = str(item or "").strip()
-        if not name or name in seen:
-            continue
-        seen.add(name)
-        normalized.append(name)
-    return normalized
-
-
-async def _require_agent_chat_access(db: AsyncSession, user: models.User, agent: models.Agent) -> None:
+async def _require_agent_chat_access(db: AsyncSession, user: models.User, agent: _ChatTarget) -> None:
     await require_menu_action_async(db, user, action="view", menu_id="agents")
-    groups = _resolve_agent_groups(agent)
+    groups = models.agent_group_names(agent)
     decision = await evaluate_permission_async(
         db,
         user,
@@ -336,6 +421,40 @@ async def _require_agent_chat_access(db: AsyncSession, user: models.User, agent:
     raise HTTPException(status_code=403, detail=_PERMISSION_REQUIRED_DETAIL)
 
 
+async def _authorize_chat_request(
+    request: HTTPConnection, db: AsyncSession, request_path: str
+) -> tuple[str, int, ProxyRoute, list[str]]:
+    """Authenticate the caller and check chat access, reusing recent decisions for the same token."""
+    decisions = get_permission_decision_cache()
+    tokens = _auth_token_candidates(request)
+    target: tuple[ProxyRoute, list[str]] | None = None
+    if tokens and decisions.enabled:
+        try:
+            target = await _resolve_proxy_target(db, request, request_path)
+        except HTTPException:
+            target = None
+        if target is not None:
+            agent, upstream_paths = target
+            for token in tokens:
+                user_id = decisions.get(token, str(agent.id), _CHAT_ACCESS_ACTION)
+                if user_id is not None:
+                    return token, user_id, agent, upstream_paths
+
+    auth_token, current_user = await _resolve_authenticated_context(request, db)
+    if target is None:
+        target = await _resolve_proxy_target(db, request, request_path)
+    agent, upstream_paths = target
+    await _require_agent_chat_access(db, current_user, agent)
+    decisions.put(
+        auth_token,
+        str(agent.id),
+        _CHAT_ACCESS_ACTION,
+        current_user.id,
+        max_age=_token_max_age(auth_token),
+    )
+    return auth_token, current_user.id, agent, upstream_paths
+
+
 @router.post("/chat/session")
 async def create_chat_session(
     request: Request,
@@ -354,6 +473,7 @@ async def create_chat_session(
 def clear_chat_session(response: Response) -> dict[str, str]:
     response.delete_cookie(key=_AUTH_COOKIE, path="/chat")
     response.delete_cookie(key=_PROXY_ID_COOKIE, path="/chat")
+    response.delete_cookie(key=_UPSTREAM_COOKIE, path="/chat")
     return {"status": "ok"}
 
 
@@ -384,7 +504,7 @@ def _rewrite_json_tokens(value: object, *, proxy_id: str, upstream_token: str) -
     return value
 
 
-def _rewrite_payload_for_upstream(agent: models.Agent, request: Request, payload: bytes) -> bytes:
+def _rewrite_payload_for_upstream(agent: _ChatTarget, request: Request, payload: bytes) -> bytes:
     if not payload:
         return payload
 
@@ -427,8 +547,91 @@ def _rewrite_payload_for_upstream(agent: models.Agent, request: Request, payload
     return payload
 
 
+def _should_buffer_request_body(request: Request) -> bool:
+    """Only bodies that can carry proxy tokens are read into memory; the rest are streamed."""
+    if "content-length" not in request.headers and "transfer-encoding" not in request.headers:
+        return True
+    content_type = (request.headers.get("content-type") or "").lower()
+    if any(item in content_type for item in _REWRITABLE_CONTENT_TYPES):
+        return True
+    if content_type and not content_type.startswith("text/"):
+        return False
+    try:
+        size = int(request.headers.get("content-length") or "")
+    except ValueError:
+        return False
+    return size <= settings.CHAT_PROXY_REWRITE_MAX_BYTES
+
+
+class _ReplayableRequestBody:
+    """Stream the client body upstream once, spooling it when a fallback path may resend it.
+
+    The spool stays in memory up to CHAT_PROXY_BODY_SPOOL_BYTES; past that it is a temporary file,
+    which is only written and read in worker threads.
+    """
+
+    def __init__(self, source: AsyncIterator[bytes], *, replayable: bool) -> None:
+        self._source = source
+        self._memory_limit = max(0, settings.CHAT_PROXY_BODY_SPOOL_BYTES)
+        # Lives across attempts and is closed by close(), so it cannot be a with-block.
+        self._spool = (
+            tempfile.SpooledTemporaryFile(max_size=self._memory_limit)  # noqa: SIM115
+            if replayable
+            else None
+        )
+        self._spooled = 0
+        self._started = False
+        self._exhausted = False
+
+    def attempt(self) -> AsyncIterator[bytes]:
+        if not self._started:
+            self._started = True
+            return self._pass_through()
+        return self._replay()
+
+    @property
+    def _on_disk(self) -> bool:
+        return self._spooled > self._memory_limit
+
+    async def _write(self, chunk: bytes) -> None:
+        self._spooled += len(chunk)
+        if self._on_disk:
+            # Also covers the chunk that rolls the spool over to disk.
+            await anyio.to_thread.run_sync(self._spool.write, chunk)
+        else:
+            self._spool.write(chunk)
+
+    async def _pass_through(self) -> AsyncIterator[bytes]:
+        async for chunk in self._source:
+            if self._spool is not None:
+                await self._write(chunk)
+            yield chunk
+        self._exhausted = True
+
+    async def _replay(self) -> AsyncIterator[bytes]:
+        if self._spool is None:
+            raise RuntimeError("Request body can only be sent once")
+        if not self._exhausted:
+            # The upstream may answer before reading the whole body; keep the rest for the retry.
+            async for chunk in self._source:
+                await self._write(chunk)
+            self._exhausted = True
+        if not self._on_disk:
+            self._spool.seek(0)
+            while chunk := self._spool.read(_BODY_REPLAY_CHUNK_SIZE):
+                yield chunk
+            return
+        await anyio.to_thread.run_sync(self._spool.seek, 0)
+        while chunk := await anyio.to_thread.run_sync(self._spool.read, _BODY_REPLAY_CHUNK_SIZE):
+            yield chunk
+
+    def close(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+
+
 def _should_try_fallback_path(response: httpx.Response) -> bool:
-    if response.status_code in {400, 401, 403, 404, 405}:
+    if response.status_code in _FALLBACK_STATUS_CODES:
         return True
 
     content_type = (response.headers.get("content-type") or "").lower()
@@ -451,68 +654,839 @@ def _should_try_fallback_path(response: httpx.Response) -> bool:
     return code_text not in {"", "0", "200"}
 
 
+async def _needs_fallback_path(response: httpx.Response) -> bool:
+    if response.status_code in _FALLBACK_STATUS_CODES:
+        return True
+    content_type = (response.headers.get("content-type") or "").lower()
+    if "application/json" not in content_type:
+        return False
+    # Only JSON bodies are inspected; everything else stays unread so it can be streamed.
+    await response.aread()
+    return _should_try_fallback_path(response)
+
+
+class _TokenStreamRewriter:
+    """Replace the upstream token with the proxy id across chunk boundaries.
+
+    Only a tail that could still grow into the token is held back, so memory stays bounded by
+    the token length and SSE frames ending in a newline are forwarded without delay.
+    """
+
+    def __init__(self, token: str, replacement: str) -> None:
+        self._needle = token.encode("utf-8")
+        self._replacement = replacement.encode("utf-8")
+        self._pending = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._pending + chunk if self._pending else chunk
+        needle = self._needle
+        parts: list[bytes] = []
+        start = 0
+        while True:
+            idx = data.find(needle, start)
+            if idx < 0:
+                break
+            parts.append(data[start:idx])
+            parts.append(self._replacement)
+            start = idx + len(needle)
+        hold = 0
+        for size in range(min(len(needle) - 1, len(data) - start), 0, -1):
+            if needle.startswith(data[len(data) - size :]):
+                hold = size
+                break
+        end = len(data) - hold
+        parts.append(data[start:end])
+        self._pending = data[end:]
+        return b"".join(parts)
+
+    def flush(self) -> bytes:
+        pending, self._pending = self._pending, b""
+        return pending
+
+
+def _response_token_rewriter(upstream: httpx.Response, agent: _ChatTarget) -> _TokenStreamRewriter | None:
+    if not settings.CHAT_PROXY_REWRITE_RESPONSES:
+        return None
+    token = agent.upstream_token or ""
+    if not token or not agent.proxy_id or token == agent.proxy_id:
+        return None
+    content_type = (upstream.headers.get("content-type") or "").lower()
+    if not any(item in content_type for item in _TOKEN_REWRITE_RESPONSE_TYPES):
+        return None
+    return _TokenStreamRewriter(token, agent.proxy_id)
+
+
+async def _relay_upstream_body(
+    upstream: httpx.Response,
+    rewriter: _TokenStreamRewriter | None = None,
+    *,
+    decode: bool = False,
+    usage_tap: UsageTap | None = None,
+) -> AsyncIterator[bytes]:
+    try:
+        chunks = upstream.aiter_bytes() if decode else upstream.aiter_raw()
+        async for chunk in chunks:
+            if usage_tap is not None:
+                usage_tap.feed(chunk)
+            if rewriter is not None:
+                chunk = rewriter.feed(chunk)
+                if not chunk:
+                    continue
+            yield chunk
+        if rewriter is not None:
+            tail = rewriter.flush()
+            if tail:
+                yield tail
+    finally:
+        # Runs on normal completion as well as when the browser disconnects mid-stream,
+        # returning the connection to the shared upstream pool.
+        if usage_tap is not None:
+            usage_tap.finish()
+        await upstream.aclose()
+
+
+async def _iter_cached_asset(handle: AsyncFile[bytes]) -> AsyncIterator[bytes]:
+    try:
+        while chunk := await handle.read(_ASSET_READ_CHUNK_SIZE):
+            yield chunk
+    finally:
+        with anyio.CancelScope(shield=True):
+            await handle.aclose()
+
+
+async def _cached_asset_response(request: Request, entry: CachedAsset, outcome: str) -> Response | None:
+    headers = entry.header_dict()
+    headers[_ASSET_CACHE_HEADER] = outcome
+    if entry.matches_conditional(request.headers):
+        kept = {
+            name: value
+            for name, value in headers.items()
+            if name in {"etag", "last-modified", "cache-control", "expires", "vary", _ASSET_CACHE_HEADER}
+        }
+        return Response(status_code=304, headers=kept)
+    asset_cache = get_asset_cache()
+    handle = await asset_cache.open(entry) if asset_cache is not None else None
+    if handle is None:
+        return None
+    headers["content-length"] = str(entry.size)
+    return StreamingResponse(_iter_cached_asset(handle), status_code=200, headers=headers)
+
+
+def _response_encoding(upstream: httpx.Response, accept_encoding: str, *, size: int | None) -> str:
+    """Pick the coding for a body the proxy re-emits itself (decoded, rewritten or uncompressed)."""
+    if not settings.CHAT_PROXY_COMPRESSION or upstream.status_code in {204, 304}:
+        return "identity"
+    if not is_compressible(upstream.headers.get("content-type") or ""):
+        return "identity"
+    if size is not None and size < settings.CHAT_PROXY_COMPRESSION_MIN_BYTES:
+        return "identity"
+    return negotiate_encoding(accept_encoding)
+
+
+def _set_content_encoding(headers: dict[str, str], encoding: str) -> None:
+    for name in [key for key in headers if key.lower() == "content-encoding"]:
+        del headers[name]
+    if encoding == "identity":
+        return
+    headers["content-encoding"] = encoding
+    vary_keys = [key for key in headers if key.lower() == "vary"]
+    vary = headers.pop(vary_keys[0]) if vary_keys else ""
+    if "accept-encoding" not in vary.lower():
+        vary = f"{vary}, Accept-Encoding" if vary else "Accept-Encoding"
+    headers["vary"] = vary
+
+
+def _asset_lifetime(
+    upstream: httpx.Response, asset_key: str | None, rewriter: _TokenStreamRewriter | None
+) -> float | None:
+    asset_cache = get_asset_cache()
+    if asset_key is None or asset_cache is None or rewriter is not None or upstream.status_code != 200:
+        return None
+    return freshness_lifetime(upstream.headers)
+
+
+async def _single_chunk(content: bytes) -> AsyncIterator[bytes]:
+    yield content
+
+
+async def _build_proxy_response(
+    upstream: httpx.Response,
+    agent: _ChatTarget,
+    *,
+    accept_encoding: str = "",
+    asset_key: str | None = None,
+    usage_tap: UsageTap | None = None,
+) -> Response:
+    headers = _proxy_response_headers(upstream.headers, agent)
+    rewriter = _response_token_rewriter(upstream, agent)
+    upstream_encoding = (upstream.headers.get("content-encoding") or "identity").strip().lower()
+    if upstream.is_stream_consumed or not settings.CHAT_PROXY_STREAM_RESPONSES:
+        # aread() returns the decoded body, so the proxy chooses the outgoing coding itself.
+        content = await upstream.aread()
+        await upstream.aclose()
+        if usage_tap is not None:
+            usage_tap.feed(content)
+            usage_tap.finish()
+        if rewriter is not None:
+            content = rewriter.feed(content) + rewriter.flush()
+        encoding = _response_encoding(upstream, accept_encoding, size=len(content))
+        _set_content_encoding(headers, encoding)
+        content = compress_bytes(content, encoding)
+        lifetime = _asset_lifetime(upstream, asset_key, rewriter)
+        if lifetime is not None:
+            # A body read up front (e.g. one coalesced for several callers) still fills the cache.
+            headers[_ASSET_CACHE_HEADER] = "MISS"
+            body = get_asset_cache().tee(asset_key, headers, lifetime, _single_chunk(content))
+            return StreamingResponse(body, status_code=upstream.status_code, headers=headers)
+        return Response(content=content, status_code=upstream.status_code, headers=headers)
+
+    if rewriter is None and usage_tap is None and upstream_encoding in accepted_encodings(accept_encoding):
+        # Compressed and untouched: hand the upstream bytes to the browser as-is.
+        body = _relay_upstream_body(upstream)
+    else:
+        decode = upstream_encoding != "identity"
+        size = None
+        if not decode and rewriter is None and upstream.headers.get("content-length", "").isdigit():
+            size = int(upstream.headers["content-length"])
+        encoding = _response_encoding(upstream, accept_encoding, size=size)
+        _set_content_encoding(headers, encoding)
+        body = _relay_upstream_body(upstream, rewriter, decode=decode, usage_tap=usage_tap)
+        if encoding != "identity":
+            body = encode_stream(body, encoding)
+
+    lifetime = _asset_lifetime(upstream, asset_key, rewriter)
+    if lifetime is not None:
+        body = get_asset_cache().tee(asset_key, headers, lifetime, body)
+        headers[_ASSET_CACHE_HEADER] = "MISS"
+    return StreamingResponse(body, status_code=upstream.status_code, headers=headers)
+
+
+def _asset_encoding_variant(request: Request) -> str:
+    # Cached bodies are stored in the coding they were sent with, so browsers that accept the
+    # same codings share an entry.
+    if not settings.CHAT_PROXY_COMPRESSION:
+        return "identity"
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    return ",".join(name for name in supported_encodings() if name in accepted) or "identity"
+
+
+def _finalize_chat_response(
+    response: Response,
+    request: Request,
+    agent: _ChatTarget,
+    auth_token: str,
+    *,
+    user_id: int,
+    db_hold: float,
+    started: float,
+) -> Response:
+    response.headers.append("server-timing", f"db;dur={db_hold * 1000:.1f}")
+    _after_body(
+        response,
+        partial(_record_chat_request, request, agent, user_id, response.status_code, started),
+    )
+    response.set_cookie(
+        key=_PROXY_ID_COOKIE,
+        value=agent.proxy_id,
+        path="/chat",
+        samesite="lax",
+    )
+    _set_chat_auth_cookie(response, auth_token, secure=request.url.scheme == "https")
+    return response
+
+
+def _coalescing_key(
+    request: Request,
+    agent: _ChatTarget,
+    upstream_paths: list[str],
+    query_string: str,
+    headers: dict[str, str],
+    cached_asset: CachedAsset | None,
+    auth_token: str,
+) -> str | None:
+    """Key for sharing one upstream GET among concurrent callers, or None if the request is personal."""
+    if not settings.CHAT_PROXY_COALESCE or request.method != "GET" or cached_asset is not None:
+        return None
+    lowered = {name.lower() for name in headers}
+    if lowered & {"range", "content-length", *_CONDITIONAL_REQUEST_HEADERS}:
+        return None
+    # Our own bearer token only authenticates against the proxy; any other credential is the upstream's.
+    if "authorization" in lowered and _extract_bearer_token(request) != auth_token:
+        return None
+    if any(name not in {_PROXY_ID_COOKIE, _AUTH_COOKIE, _UPSTREAM_COOKIE} for name in request.cookies):
+        return None
+    return "|".join(
+        (
+            agent.upstream_base_url.rstrip("/"),
+            agent.proxy_id,
+            *upstream_paths,
+            query_string,
+            request.headers.get("accept", ""),
+            request.headers.get("accept-language", ""),
+        )
+    )
+
+
+def _is_shareable_response(upstream: httpx.Response) -> bool:
+    if "set-cookie" in upstream.headers:
+        return False
+    if "private" in (upstream.headers.get("cache-control") or "").lower():
+        return False
+    vary = (upstream.headers.get("vary") or "").lower()
+    if any(item.strip() not in {"", "accept-encoding"} for item in vary.split(",")):
+        return False
+    if upstream.is_stream_consumed:
+        return True
+    length = upstream.headers.get("content-length", "")
+    return length.isdigit() and int(length) <= settings.CHAT_PROXY_COALESCE_MAX_BYTES
+
+
+async def _share_upstream_response(upstream: httpx.Response, flight: Flight) -> httpx.Response:
+    """Read a shareable upstream response once and hand it to every waiter of the flight."""
+    if not _is_shareable_response(upstream):
+        return upstream
+    body = await upstream.aread()
+    await upstream.aclose()
+    shared = SharedResponse(
+        status_code=upstream.status_code,
+        headers=tuple(
+            (name, value)
+            for name, value in upstream.headers.multi_items()
+            if name.lower() not in {"content-encoding", "content-length", "transfer-encoding"}
+        ),
+        body=body,
+    )
+    flight.publish(shared)
+    return shared.to_response()
+
+
+def _circuit_open_error(circuit: CircuitBreaker) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Chat upstream is temporarily unavailable",
+        headers={"Retry-After": str(circuit.retry_after())},
+    )
+
+
+def _upstream_request_url(agent: _ChatTarget, upstream_path: str, query_string: str) -> str:
+    upstream_url = f"{agent.upstream_base_url.rstrip('/')}{upstream_path}"
+    if query_string:
+        upstream_url = f"{upstream_url}?{query_string}"
+    return upstream_url
+
+
+def _build_upstream_request(
+    client: httpx.AsyncClient,
+    agent: _ChatTarget,
+    *,
+    method: str,
+    upstream_path: str,
+    query_string: str,
+    headers: dict[str, str],
+    content: bytes,
+) -> httpx.Request:
+    return client.build_request(
+        method,
+        _upstream_request_url(agent, upstream_path, query_string),
+        headers=headers,
+        content=content,
+    )
+
+
+def _discard_attempt(task: asyncio.Future) -> None:
+    """Cancel a losing upstream attempt and close its response should it still arrive."""
+
+    def close(done: asyncio.Future) -> None:
+        if not done.cancelled() and done.exception() is None:
+            asyncio.ensure_future(done.result().aclose())
+
+    if task.done():
+        close(task)
+    else:
+        task.cancel()
+        task.add_done_callback(close)
+
+
+async def _send_hedged(
+    build: Callable[[httpx.AsyncClient, _ChatTarget], httpx.Request],
+    client: httpx.AsyncClient,
+    agent: _ChatTarget,
+    circuit: CircuitBreaker | None,
+    candidates: list[UpstreamTarget],
+    delay: float,
+) -> tuple[httpx.Response, tuple[_ChatTarget, CircuitBreaker | None, UpstreamLease, httpx.AsyncClient] | None]:
+    """Send an idempotent request; if it has not answered after ``delay``, race a second copy.
+
+    The copy goes to the next healthy node when the agent has one, otherwise to the same node.
+    Returns the winning response and, when the copy won, the node binding it was sent on.
+    """
+    primary = asyncio.ensure_future(client.send(build(client, agent), stream=True))
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+    except BaseException:
+        _discard_attempt(primary)
+        raise
+    if done:
+        return primary.result(), None
+    if not get_hedge_policy().try_hedge():
+        CHAT_PROXY_HEDGES.labels(agent.proxy_id, "skipped").inc()
+        return await primary, None
+
+    claimed = _claim_upstream(agent, candidates)
+    if claimed is not None:
+        hedge_agent, hedge_circuit = claimed
+        hedge_client = get_upstream_client(hedge_agent.upstream_base_url)
+    else:
+        hedge_agent, hedge_circuit, hedge_client = agent, circuit, client
+    hedge_lease = get_upstream_balancer().acquire(hedge_agent.upstream_base_url)
+    hedge = asyncio.ensure_future(hedge_client.send(build(hedge_client, hedge_agent), stream=True))
+    winner: asyncio.Future | None = None
+    try:
+        pending = {primary, hedge}
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in (primary, hedge):
+                if task in done and task.exception() is None:
+                    winner = task
+                    break
+    finally:
+        for task in (primary, hedge):
+            if task is not winner:
+                _discard_attempt(task)
+        if winner is not hedge:
+            hedge_lease.release()
+            if hedge_circuit is not None and hedge_circuit is not circuit:
+                hedge_circuit.record(None)
+    if winner is None:
+        CHAT_PROXY_HEDGES.labels(agent.proxy_id, "failed").inc()
+        raise primary.exception()
+    if winner is hedge:
+        CHAT_PROXY_HEDGES.labels(agent.proxy_id, "won").inc()
+        return hedge.result(), (hedge_agent, hedge_circuit, hedge_lease, hedge_client)
+    CHAT_PROXY_HEDGES.labels(agent.proxy_id, "lost").inc()
+    return primary.result(), None
+
+
+def _release_upstream_claims(permit: AdmissionPermit, lease: UpstreamLease, _sent: int) -> None:
+    permit.release()
+    lease.release()
+
+
+def _upstream_candidates(connection: HTTPConnection, agent: _ChatTarget) -> list[UpstreamTarget]:
+    targets = getattr(agent, "upstream_targets", ())
+    if len(targets) <= 1:
+        if targets and isinstance(targets[0], UpstreamTarget):
+            return [targets[0]]
+        return [UpstreamTarget(agent.upstream_base_url)]
+    sticky = connection.cookies.get(_UPSTREAM_COOKIE, "") if settings.CHAT_PROXY_STICKY_UPSTREAM else ""
+    return get_upstream_balancer().order(targets, sticky=sticky)
+
+
+def _claim_upstream(
+    agent: _ChatTarget, candidates: list[UpstreamTarget]
+) -> tuple[_ChatTarget, CircuitBreaker | None] | None:
+    """Bind the route to the next candidate whose circuit lets a call through; consumes ``candidates``."""
+    while candidates:
+        target = candidates.pop(0)
+        circuit = upstream_circuit(target.base_url, health_path=target.health_path)
+        if circuit is None or circuit.allow_request():
+            if isinstance(agent, ProxyRoute):
+                agent = agent.on_upstream(target.base_url)
+            return agent, circuit
+    return None
+
+
+def _set_upstream_cookie(response: Response, request: Request, agent: _ChatTarget) -> None:
+    if not settings.CHAT_PROXY_STICKY_UPSTREAM or len(getattr(agent, "upstream_targets", ())) <= 1:
+        return
+    key = upstream_target_key(agent.upstream_base_url)
+    if request.cookies.get(_UPSTREAM_COOKIE) != key:
+        response.set_cookie(key=_UPSTREAM_COOKIE, value=key, path="/chat", httponly=True, samesite="lax")
+
+
+async def _admit_chat_request(user_id: int, agent: _ChatTarget) -> AdmissionPermit:
+    scopes = chat_admission_scopes(user_id, agent.proxy_id, upstream_pool_key(agent.upstream_base_url))
+    try:
+        return await get_admission_controller().admit(scopes)
+    except AdmissionRejected as exc:
+        logger.warning(
+            "chat_proxy.admission_rejected proxy_id=%s user_id=%s scope=%s reason=%s",
+            agent.proxy_id,
+            user_id,
+            exc.scope.name,
+            exc.reason,
+        )
+        raise HTTPException(
+            status_code=exc.status_code,
+            detail="Too many chat requests" if exc.status_code == 429 else "Chat upstream is busy",
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+
+
+def _after_body(response: Response, callback: Callable[[int], None]) -> Response:
+    """Run ``callback(bytes_sent)`` once the body is fully sent (or the client goes away).
+
+    Buffered responses run it at once with the body length.
+    """
+    if not isinstance(response, StreamingResponse):
+        callback(len(response.body or b""))
+        return response
+    body = response.body_iterator
+    pending = [callback]
+    sent = [0]
+
+    def run_once() -> None:
+        if pending:
+            pending.pop()(sent[0])
+
+    async def guarded() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in body:
+                sent[0] += len(chunk)
+                yield chunk
+        finally:
+            run_once()
+
+    response.body_iterator = guarded()
+    # A response that is never iterated (client gone before the first byte) still runs it.
+    weakref.finalize(response, run_once)
+    return response
+
+
+def _record_chat_request(
+    request: Request,
+    agent: _ChatTarget,
+    user_id: int | None,
+    status_code: int,
+    started: float,
+    bytes_sent: int,
+) -> None:
+    duration = time.perf_counter() - started
+    CHAT_PROXY_REQUEST_SECONDS.labels(agent.proxy_id, str(status_code)).observe(duration)
+    audit_log = get_chat_audit_log()
+    if audit_log is not None:
+        audit_log.record(
+            user_id=user_id,
+            agent_id=agent.id,
+            proxy_id=agent.proxy_id,
+            transport="http",
+            method=request.method,
+            path=request.url.path,
+            status_code=status_code,
+            bytes_sent=bytes_sent,
+            duration=duration,
+        )
+
+
 @router.api_route("/chat/{request_path:path}", methods=_PROXY_METHODS)
 async def proxy_chat(
     request_path: str,
     request: Request,
     db: AsyncSession = Depends(get_db),
 ) -> Response:
+    started = time.perf_counter()
     try:
-        auth_token, current_user = await _resolve_authenticated_context(request, db)
+        auth_token, user_id, agent, upstream_paths = await _authorize_chat_request(
+            request, db, request_path
+        )
     except HTTPException as exc:
         if exc.status_code == 401 and _is_browser_navigation(request):
             return RedirectResponse(url=_login_redirect_url(request), status_code=307)
         raise
-    agent, upstream_paths = await _resolve_proxy_target(db, request, request_path)
-    if not agent:
-        raise HTTPException(status_code=404, detail="Chat endpoint not found")
-    await _require_agent_chat_access(db, current_user, agent)
+    # Everything below works on the route snapshot; return the connection before any upstream I/O.
+    db_hold = await release_session(db)
+    CHAT_PROXY_DB_HOLD_SECONDS.observe(db_hold)
     if not _is_chat_available(agent):
         raise HTTPException(status_code=403, detail="当前智能体不可用")
     if not agent.upstream_base_url or not agent.upstream_token:
         raise HTTPException(status_code=404, detail="Chat upstream is not configured")
 
     query_string = _rewrite_query_for_upstream(agent, request.url.query)
-    payload = _rewrite_payload_for_upstream(agent, request, await request.body())
     headers = _proxy_request_headers(request)
+    asset_cache = get_asset_cache()
+    asset_key: str | None = None
+    cached_asset: CachedAsset | None = None
+    if asset_cache is not None and asset_cache.enabled and is_cacheable_asset_request(
+        request.method, upstream_paths[0], request.headers
+    ):
+        asset_key = asset_cache_key(
+            agent.upstream_base_url,
+            upstream_paths[0],
+            query_string,
+            _asset_encoding_variant(request),
+        )
+        cached_asset = asset_cache.lookup(asset_key)
+        if cached_asset is not None and cached_asset.is_fresh():
+            response = await _cached_asset_response(request, cached_asset, "HIT")
+            if response is not None:
+                return _finalize_chat_response(
+                    response,
+                    request,
+                    agent,
+                    auth_token,
+                    user_id=user_id,
+                    db_hold=db_hold,
+                    started=started,
+                )
+            cached_asset = None
+        # Browser validators are answered from the cache; upstream only sees our own.
+        for name in list(headers):
+            if name.lower() in _CONDITIONAL_REQUEST_HEADERS:
+                del headers[name]
+        if cached_asset is not None:
+            headers.update(cached_asset.validators())
+
+    flight: Flight | None = None
+    coalescing_key = _coalescing_key(
+        request, agent, upstream_paths, query_string, headers, cached_asset, auth_token
+    )
+    if coalescing_key is not None:
+        flight = get_request_coalescer().join(coalescing_key)
+        if not flight.leader:
+            shared = await flight.wait(settings.CHAT_PROXY_TIMEOUT)
+            if shared is not None:
+                logger.info(
+                    "chat_proxy.coalesced proxy_id=%s user_id=%s path=/chat/%s",
+                    agent.proxy_id,
+                    user_id,
+                    request_path,
+                )
+                response = await _build_proxy_response(
+                    shared.to_response(),
+                    agent,
+                    accept_encoding=request.headers.get("accept-encoding", ""),
+                )
+                return _finalize_chat_response(
+                    response,
+                    request,
+                    agent,
+                    auth_token,
+                    user_id=user_id,
+                    db_hold=db_hold,
+                    started=started,
+                )
+            flight = None
+        else:
+            # The only credentials left are the proxy's own; the shared upstream request goes without them.
+            headers.pop("cookie", None)
+            headers.pop("authorization", None)
+
+    try:
+        response = await _forward_chat_request(
+            request,
+            request_path,
+            agent,
+            user_id,
+            upstream_paths,
+            headers,
+            query_string,
+            asset_key=asset_key,
+            cached_asset=cached_asset,
+            flight=flight,
+            db_hold=db_hold,
+        )
+    except HTTPException as exc:
+        _record_chat_request(request, agent, user_id, exc.status_code, started, 0)
+        raise
+    finally:
+        if flight is not None:
+            flight.finish()
+    return _finalize_chat_response(
+        response,
+        request,
+        agent,
+        auth_token,
+        user_id=user_id,
+        db_hold=db_hold,
+        started=started,
+    )
+
+
+async def _forward_chat_request(
+    request: Request,
+    request_path: str,
+    agent: _ChatTarget,
+    user_id: int,
+    upstream_paths: list[str],
+    headers: dict[str, str],
+    query_string: str,
+    *,
+    asset_key: str | None,
+    cached_asset: CachedAsset | None,
+    flight: Flight | None,
+    db_hold: float,
+) -> Response:
+    # Checked after the asset cache so cached static files keep serving while the upstream is down.
+    candidates = _upstream_candidates(request, agent)
+    claimed = _claim_upstream(agent, candidates)
+    if claimed is None:
+        logger.warning("chat_proxy.circuit_open proxy_id=%s", agent.proxy_id)
+        raise _circuit_open_error(upstream_circuit(agent.upstream_base_url))
+    agent, circuit = claimed
+
+    path_preferences = get_upstream_path_preferences()
+    path_prefix = _upstream_path_prefix(upstream_paths)
+    attempt_order = path_preferences.order(agent.proxy_id, path_prefix, len(upstream_paths))
+    payload = b""
+    streamed_body: _ReplayableRequestBody | None = None
+    if _should_buffer_request_body(request):
+        payload = _rewrite_payload_for_upstream(agent, request, await request.body())
+    else:
+        streamed_body = _ReplayableRequestBody(
+            request.stream(), replayable=len(attempt_order) > 1 or bool(candidates)
+        )
+        if request.headers.get("content-length"):
+            headers["content-length"] = request.headers["content-length"]
     logger.info(
-        "chat_proxy.request proxy_id=%s method=%s path=/chat/%s candidates=%s",
+        "chat_proxy.request proxy_id=%s user_id=%s method=%s path=/chat/%s candidates=%s streamed=%s "
+        "db_hold_ms=%.1f",
         agent.proxy_id,
+        user_id,
         request.method,
         request_path,
         len(upstream_paths),
+        streamed_body is not None,
+        db_hold * 1000,
     )
 
     try:
-        async with httpx.AsyncClient(follow_redirects=False, timeout=60.0) as client:
-            upstream: httpx.Response | None = None
-            for idx, upstream_path in enumerate(upstream_paths):
-                upstream_url = f"{agent.upstream_base_url.rstrip('/')}{upstream_path}"
-                if query_string:
-                    upstream_url = f"{upstream_url}?{query_string}"
-                candidate = await client.request(
-                    request.method,
-                    upstream_url,
-                    headers=headers,
-                    content=payload,
-                )
-                # Some upstream endpoints require /chat/{token}/..., others /chat/... .
-                # Try fallback path before returning a 404.
-                if _should_try_fallback_path(candidate) and idx + 1 < len(upstream_paths):
-                    logger.info(
-                        "chat_proxy.fallback proxy_id=%s method=%s path=/chat/%s attempt=%s status=%s",
+        permit = await _admit_chat_request(user_id, agent)
+    except BaseException:
+        if circuit is not None:
+            circuit.record(None)
+        if streamed_body is not None:
+            streamed_body.close()
+        raise
+    balancer = get_upstream_balancer()
+    lease = balancer.acquire(agent.upstream_base_url)
+    client = get_upstream_client(agent.upstream_base_url)
+    hedge_policy = get_hedge_policy()
+    hedge_delay = hedge_policy.delay(agent.proxy_id, request.method) if streamed_body is None else None
+    upstream: httpx.Response | None = None
+    candidate: httpx.Response | None = None
+    response: Response | None = None
+    circuit_judged = False
+    started = time.perf_counter()
+    try:
+        for idx, style in enumerate(attempt_order):
+            upstream_path = upstream_paths[style]
+            while True:
+                upstream_url = _upstream_request_url(agent, upstream_path, query_string)
+                sent_at = time.perf_counter()
+                try:
+                    if hedge_delay is None:
+                        candidate = await client.send(
+                            client.build_request(
+                                request.method,
+                                upstream_url,
+                                headers=headers,
+                                content=payload if streamed_body is None else streamed_body.attempt(),
+                            ),
+                            stream=True,
+                        )
+                        break
+                    candidate, hedged = await _send_hedged(
+                        partial(
+                            _build_upstream_request,
+                            method=request.method,
+                            upstream_path=upstream_path,
+                            query_string=query_string,
+                            headers=headers,
+                            content=payload,
+                        ),
+                        client,
+                        agent,
+                        circuit,
+                        candidates,
+                        hedge_delay,
+                    )
+                    if hedged is not None:
+                        lease.release()
+                        if circuit is not None and circuit is not hedged[1]:
+                            circuit.record(None)
+                        agent, circuit, lease, client = hedged
+                    break
+                except (httpx.ConnectError, httpx.ConnectTimeout) as exc:
+                    # Nothing reached the node, so even a POST can move to the next one.
+                    failover = _claim_upstream(agent, candidates)
+                    if failover is None:
+                        raise
+                    logger.warning(
+                        "chat_proxy.failover proxy_id=%s from=%s to=%s error=%s",
                         agent.proxy_id,
-                        request.method,
-                        request_path,
-                        idx + 1,
-                        candidate.status_code,
+                        upstream_pool_key(agent.upstream_base_url),
+                        upstream_pool_key(failover[0].upstream_base_url),
+                        type(exc).__name__,
                     )
-                    continue
-                upstream = candidate
-                break
-            if upstream is None:
-                raise HTTPException(status_code=502, detail="Failed to proxy chat request")
+                    if circuit is not None:
+                        circuit.record(False, time.perf_counter() - sent_at, error=type(exc).__name__)
+                    lease.release(failed=True)
+                    agent, circuit = failover
+                    lease = balancer.acquire(agent.upstream_base_url)
+                    client = get_upstream_client(agent.upstream_base_url)
+            # Some upstream endpoints require /chat/{token}/..., others /chat/... .
+            # Try fallback path before returning a 404.
+            is_last = idx + 1 >= len(attempt_order)
+            if not is_last and await _needs_fallback_path(candidate):
+                logger.info(
+                    "chat_proxy.fallback proxy_id=%s method=%s path=/chat/%s attempt=%s status=%s",
+                    agent.proxy_id,
+                    request.method,
+                    request_path,
+                    idx + 1,
+                    candidate.status_code,
+                )
+                CHAT_PROXY_FALLBACKS.labels(agent.proxy_id, "http").inc()
+                await candidate.aclose()
+                continue
+            # The last candidate is not inspected, so only learn from it on a clean status.
+            if len(attempt_order) > 1 and (not is_last or candidate.status_code < 400):
+                path_preferences.record(agent.proxy_id, path_prefix, style)
+            upstream = candidate
+            break
+        if upstream is None:
+            raise HTTPException(status_code=502, detail="Failed to proxy chat request")
+        CHAT_PROXY_TTFB_SECONDS.labels(agent.proxy_id, str(upstream.status_code)).observe(
+            time.perf_counter() - started
+        )
+        lease.observe(time.perf_counter() - sent_at)
+        if hedge_policy.enabled and request.method in HEDGEABLE_METHODS:
+            hedge_policy.observe(agent.proxy_id, time.perf_counter() - started)
+        if circuit is not None:
+            circuit.record(
+                not is_upstream_failure_status(upstream.status_code),
+                time.perf_counter() - started,
+                error=f"HTTP {upstream.status_code}",
+                # A non-streamed completion sends nothing until the reply is generated.
+                judge_latency=request.method in HEDGEABLE_METHODS or asset_key is not None,
+            )
+            circuit_judged = True
+        if flight is not None:
+            upstream = await _share_upstream_response(upstream, flight)
+        if cached_asset is not None and upstream.status_code == 304:
+            await upstream.aclose()
+            refreshed = get_asset_cache().revalidated(asset_key, upstream.headers)
+            if refreshed is not None:
+                response = await _cached_asset_response(request, refreshed, "REVALIDATED")
+        if response is None:
+            response = await _build_proxy_response(
+                upstream,
+                agent,
+                accept_encoding=request.headers.get("accept-encoding", ""),
+                asset_key=asset_key,
+                usage_tap=usage_tap_for(
+                    request.method,
+                    upstream.headers.get("content-type") or "",
+                    user_id,
+                    agent.id,
+                ),
+            )
     except httpx.HTTPError as exc:
+        if candidate is not None:
+            await candidate.aclose()
+        if circuit is not None and not circuit_judged:
+            circuit.record(False, time.perf_counter() - started, error=type(exc).__name__)
+            circuit_judged = True
         logger.exception(
             "chat_proxy.http_error proxy_id=%s method=%s path=/chat/%s",
             agent.proxy_id,
@@ -520,12 +1494,18 @@ async def proxy_chat(
             request_path,
         )
         raise HTTPException(status_code=502, detail="Failed to proxy chat request") from exc
+    finally:
+        if circuit is not None and not circuit_judged:
+            circuit.record(None)
+        if streamed_body is not None:
+            streamed_body.close()
+        if response is None:
+            permit.release()
+            lease.release()
+        else:
+            response = _after_body(response, partial(_release_upstream_claims, permit, lease))
+    _set_upstream_cookie(response, request, agent)
 
-    response = Response(
-        content=upstream.content,
-        status_code=upstream.status_code,
-        headers=_proxy_response_headers(upstream.headers, agent),
-    )
     logger.info(
         "chat_proxy.response proxy_id=%s method=%s path=/chat/%s status=%s",
         agent.proxy_id,
@@ -533,11 +1513,229 @@ async def proxy_chat(
         request_path,
         upstream.status_code,
     )
-    response.set_cookie(
-        key=_PROXY_ID_COOKIE,
-        value=agent.proxy_id,
-        path="/chat",
-        samesite="lax",
-    )
-    _set_chat_auth_cookie(response, auth_token, secure=request.url.scheme == "https")
     return response
+
+
+def _upstream_websocket_url(agent: _ChatTarget, upstream_path: str, query_string: str) -> str:
+    parsed = urlparse(agent.upstream_base_url.rstrip("/"))
+    scheme = "wss" if parsed.scheme.lower() == "https" else "ws"
+    url = f"{scheme}://{parsed.netloc}{parsed.path}{upstream_path}"
+    if query_string:
+        url = f"{url}?{query_string}"
+    return url
+
+
+def _websocket_upstream_headers(websocket: WebSocket) -> dict[str, str]:
+    headers = _proxy_request_headers(websocket)
+    # The websocket client negotiates its own handshake headers.
+    return {
+        key: value
+        for key, value in headers.items()
+        if not key.lower().startswith("sec-websocket-") and key.lower() != "accept-encoding"
+    }
+
+
+async def _connect_upstream_websocket(
+    websocket: WebSocket,
+    agent: _ChatTarget,
+    upstream_paths: list[str],
+    circuit: CircuitBreaker | None = None,
+) -> ClientConnection | None:
+    query_string = _rewrite_query_for_upstream(agent, websocket.url.query)
+    headers = _websocket_upstream_headers(websocket)
+    subprotocols = list(websocket.scope.get("subprotocols") or []) or None
+    path_preferences = get_upstream_path_preferences()
+    path_prefix = _upstream_path_prefix(upstream_paths)
+    attempt_order = path_preferences.order(agent.proxy_id, path_prefix, len(upstream_paths))
+    started = time.perf_counter()
+    for idx, style in enumerate(attempt_order):
+        upstream_url = _upstream_websocket_url(agent, upstream_paths[style], query_string)
+        try:
+            upstream = await websocket_connect(
+                upstream_url,
+                additional_headers=headers,
+                subprotocols=subprotocols,
+                open_timeout=settings.CHAT_PROXY_TIMEOUT,
+                max_size=settings.CHAT_PROXY_WS_MAX_MESSAGE_BYTES or None,
+                max_queue=max(1, settings.CHAT_PROXY_WS_MAX_QUEUE),
+            )
+        except InvalidStatus as exc:
+            status_code = exc.response.status_code
+            if idx + 1 < len(attempt_order) and status_code in _FALLBACK_STATUS_CODES:
+                logger.info(
+                    "chat_proxy.ws_fallback proxy_id=%s path=%s attempt=%s status=%s",
+                    agent.proxy_id,
+                    upstream_paths[style],
+                    idx + 1,
+                    status_code,
+                )
+                CHAT_PROXY_FALLBACKS.labels(agent.proxy_id, "websocket").inc()
+                continue
+            logger.warning("chat_proxy.ws_rejected proxy_id=%s status=%s", agent.proxy_id, status_code)
+            if circuit is not None:
+                circuit.record(
+                    not is_upstream_failure_status(status_code),
+                    time.perf_counter() - started,
+                    error=f"HTTP {status_code}",
+                )
+            return None
+        except (OSError, TimeoutError, WebSocketException) as exc:
+            logger.exception("chat_proxy.ws_connect_error proxy_id=%s", agent.proxy_id)
+            if circuit is not None:
+                circuit.record(False, time.perf_counter() - started, error=type(exc).__name__)
+            return None
+        if circuit is not None:
+            circuit.record(True, time.perf_counter() - started, judge_latency=True)
+        if len(attempt_order) > 1:
+            path_preferences.record(agent.proxy_id, path_prefix, style)
+        return upstream
+    return None
+
+
+async def _pump_client_to_upstream(
+    websocket: WebSocket, upstream: ClientConnection, agent: _ChatTarget
+) -> None:
+    # Each frame is forwarded before the next is read, so a slow upstream throttles the browser.
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        text = message.get("text")
+        if text is not None:
+            await upstream.send(text.replace(agent.proxy_id, agent.upstream_token))
+        elif message.get("bytes") is not None:
+            await upstream.send(message["bytes"])
+
+
+async def _pump_upstream_to_client(
+    websocket: WebSocket, upstream: ClientConnection, agent: _ChatTarget, sent: list[int]
+) -> None:
+    # The upstream receive queue is bounded by CHAT_PROXY_WS_MAX_QUEUE; while the browser is
+    # slow to drain, reading from the upstream socket pauses.
+    rewrite = settings.CHAT_PROXY_REWRITE_RESPONSES and agent.upstream_token != agent.proxy_id
+    async for message in upstream:
+        if isinstance(message, str):
+            if rewrite:
+                message = message.replace(agent.upstream_token, agent.proxy_id)
+            await websocket.send_text(message)
+        else:
+            await websocket.send_bytes(message)
+        sent[0] += len(message)
+
+
+# Codes an endpoint must not send in a close frame (RFC 6455 section 7.4.1). websockets reports 1006
+# when the upstream went away without a close frame and 1005 when its frame carried no code.
+_RESERVED_CLOSE_CODES = frozenset({1004, 1005, 1006, 1015})
+
+
+def _client_close_code(upstream_code: int | None) -> int:
+    """Close code to relay to the browser for the way the upstream socket ended."""
+    if upstream_code is None or upstream_code == status.WS_1005_NO_STATUS_RCVD:
+        return status.WS_1000_NORMAL_CLOSURE
+    if upstream_code in _RESERVED_CLOSE_CODES or not (
+        1000 <= upstream_code <= 1014 or 3000 <= upstream_code <= 4999
+    ):
+        return status.WS_1014_BAD_GATEWAY
+    return upstream_code
+
+
+@router.websocket("/chat/{request_path:path}")
+async def proxy_chat_websocket(
+    websocket: WebSocket,
+    request_path: str,
+    db: AsyncSession = Depends(get_db),
+) -> None:
+    started = time.perf_counter()
+    try:
+        _, user_id, agent, upstream_paths = await _authorize_chat_request(websocket, db, request_path)
+        if not _is_chat_available(agent):
+            raise HTTPException(status_code=403, detail="当前智能体不可用")
+        if not agent.upstream_base_url or not agent.upstream_token:
+            raise HTTPException(status_code=404, detail="Chat upstream is not configured")
+    except HTTPException as exc:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(exc.detail))
+        return
+    finally:
+        # Access is only checked at handshake; do not hold a database connection for the socket lifetime.
+        db_hold = await release_session(db)
+        CHAT_PROXY_DB_HOLD_SECONDS.observe(db_hold)
+
+    tracker = get_websocket_tracker()
+    agent_id = str(agent.id)
+    if not tracker.try_acquire(agent_id, settings.CHAT_PROXY_WS_MAX_PER_AGENT):
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason="Too many chat connections")
+        return
+    candidates = _upstream_candidates(websocket, agent)
+    claimed = _claim_upstream(agent, candidates)
+    if claimed is None:
+        tracker.release(agent_id)
+        await websocket.close(
+            code=status.WS_1013_TRY_AGAIN_LATER, reason="Chat upstream is temporarily unavailable"
+        )
+        return
+    agent, circuit = claimed
+    balancer = get_upstream_balancer()
+    lease = balancer.acquire(agent.upstream_base_url)
+    try:
+        while True:
+            try:
+                upstream = await _connect_upstream_websocket(websocket, agent, upstream_paths, circuit)
+            finally:
+                if circuit is not None:
+                    # No-op once an outcome was recorded; frees a half-open probe slot on cancellation.
+                    circuit.record(None)
+            failover = _claim_upstream(agent, candidates) if upstream is None else None
+            if failover is None:
+                break
+            lease.release(failed=True)
+            agent, circuit = failover
+            lease = balancer.acquire(agent.upstream_base_url)
+        if upstream is None:
+            await websocket.close(code=status.WS_1014_BAD_GATEWAY, reason="Failed to proxy chat socket")
+            return
+        logger.info(
+            "chat_proxy.ws_open proxy_id=%s user_id=%s path=/chat/%s open=%s db_hold_ms=%.1f",
+            agent.proxy_id,
+            user_id,
+            request_path,
+            tracker.count(agent_id),
+            db_hold * 1000,
+        )
+        sent = [0]
+        try:
+            await websocket.accept(subprotocol=upstream.subprotocol)
+            pumps = {
+                asyncio.create_task(_pump_client_to_upstream(websocket, upstream, agent)),
+                asyncio.create_task(_pump_upstream_to_client(websocket, upstream, agent, sent)),
+            }
+            done, pending = await asyncio.wait(pumps, return_when=asyncio.FIRST_COMPLETED)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    logger.info(
+                        "chat_proxy.ws_closed proxy_id=%s reason=%r",
+                        agent.proxy_id,
+                        task.exception(),
+                    )
+        finally:
+            await upstream.close()
+            if websocket.client_state == WebSocketState.CONNECTED:
+                await websocket.close(code=_client_close_code(upstream.close_code))
+            audit_log = get_chat_audit_log()
+            if audit_log is not None:
+                audit_log.record(
+                    user_id=user_id,
+                    agent_id=agent.id,
+                    proxy_id=agent.proxy_id,
+                    transport="websocket",
+                    method="GET",
+                    path=websocket.url.path,
+                    status_code=101,
+                    bytes_sent=sent[0],
+                    duration=time.perf_counter() - started,
+                )
+    finally:
+        tracker.release(agent_id)
+        lease.release()
@@ -1,4 +1,7 @@
-from fastapi import APIRouter, Depends
+from datetime import datetime, timedelta
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy import case, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
@@ -7,15 +10,21 @@ from .. import models, schemas
 from ..auth import get_current_user
 from ..db import get_db
 from ..permissions import (
-    can_view_agent,
+    ResourceBatch,
     can_view_menu,
-    can_view_model,
+    evaluate_many,
     get_user_access,
+    has_permission_async,
     is_super_admin,
 )
+from ..services.chat_audit import BUCKET_SIZES, resolve_time_range
+from ..services.chat_usage import usage_ranking, usage_series
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
+_MAX_USAGE_BUCKETS = 2000
+_DEFAULT_USAGE_SPAN = timedelta(days=7)
+
 
 def _get_modules_sync(db: Session, current_user: models.User) -> list[schemas.ModuleSummary]:
     if is_super_admin(current_user):
@@ -60,36 +69,32 @@ def _get_modules_sync(db: Session, current_user: models.User) -> list[schemas.Mo
             ),
         ]
 
-    agents = db.query(
-        models.Agent.id,
-        models.Agent.status,
-        models.Agent.group_name,
-        models.Agent.groups,
-    ).all()
+    agents = db.query(models.Agent.id, models.Agent.status).all()
     models_list = db.query(models.Model.id, models.Model.status).all()
 
     access = get_user_access(db, current_user)
 
-    allowed_agent_total = 0
-    allowed_agent_active = 0
-    for item in agents:
-        groups = list(item.groups or [])
-        if not groups and item.group_name:
-            groups = [item.group_name]
-        if not can_view_agent(access, str(item.id), groups):
-            continue
-        allowed_agent_total += 1
-        if item.status in {"active", "enabled"}:
-            allowed_agent_active += 1
-
-    allowed_model_total = 0
-    allowed_model_active = 0
-    for item in models_list:
-        if not can_view_model(access, str(item.id)):
-            continue
-        allowed_model_total += 1
-        if item.status in {"active", "enabled"}:
-            allowed_model_active += 1
+    agent_groups: dict[str, list[str]] = {}
+    for agent_id, group_name in db.query(
+        models.AgentGroupMember.agent_id, models.AgentGroupMember.group_name
+    ).all():
+        agent_groups.setdefault(agent_id, []).append(group_name)
+    agent_batch = ResourceBatch(
+        [str(item.id) for item in agents],
+        [agent_groups.get(item.id, []) for item in agents],
+    )
+    visible_agents = agent_batch.select(
+        agents, evaluate_many(db, current_user, agent_batch, action="view", resource_type="agent")
+    )
+    allowed_agent_total = len(visible_agents)
+    allowed_agent_active = sum(1 for item in visible_agents if item.status in {"active", "enabled"})
+
+    model_batch = ResourceBatch([str(item.id) for item in models_list])
+    visible_models = model_batch.select(
+        models_list, evaluate_many(db, current_user, model_batch, action="view", resource_type="model")
+    )
+    allowed_model_total = len(visible_models)
+    allowed_model_active = sum(1 for item in visible_models if item.status in {"active", "enabled"})
 
     menu_defs = [
         {
@@ -132,3 +137,55 @@ async def get_modules(
     db: AsyncSession = Depends(get_db),
 ) -> list[schemas.ModuleSummary]:
     return await db.run_sync(lambda sync_db: _get_modules_sync(sync_db, current_user))
+
+
+async def _usage_scope(db: AsyncSession, current_user: models.User, user_id: int | None) -> int | None:
+    """Admins may look at anyone (or everyone); other users only see their own usage."""
+    if is_super_admin(current_user) or await has_permission_async(
+        db, current_user, action="view", scope="menu", resource_type="menu", resource_id="admin"
+    ):
+        return user_id
+    return current_user.id
+
+
+@router.get("/usage", response_model=list[schemas.UsageBucket])
+async def get_usage(
+    bucket: Literal["minute", "hour", "day"] = Query(default="hour"),
+    start: datetime | None = Query(default=None),
+    end: datetime | None = Query(default=None),
+    agent_id: str | None = Query(default=None),
+    user_id: int | None = Query(default=None),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.UsageBucket]:
+    start, end = resolve_time_range(start, end, default_span=_DEFAULT_USAGE_SPAN)
+    if (end - start) / BUCKET_SIZES[bucket] > _MAX_USAGE_BUCKETS:
+        raise HTTPException(status_code=400, detail="Time range has too many buckets")
+    user_id = await _usage_scope(db, current_user, user_id)
+    rows = await usage_series(db, start=start, end=end, bucket=bucket, user_id=user_id, agent_id=agent_id)
+    return [schemas.UsageBucket(**row) for row in rows]
+
+
+@router.get("/usage/top", response_model=list[schemas.UsageRanking])
+async def get_usage_top(
+    group_by: Literal["user", "agent"] = Query(default="user"),
+    start: datetime | None = Query(default=None),
+    end: datetime | None = Query(default=None),
+    agent_id: str | None = Query(default=None),
+    user_id: int | None = Query(default=None),
+    limit: int = Query(default=20, ge=1, le=200),
+    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> list[schemas.UsageRanking]:
+    start, end = resolve_time_range(start, end, default_span=_DEFAULT_USAGE_SPAN)
+    user_id = await _usage_scope(db, current_user, user_id)
+    rows = await usage_ranking(
+        db,
+        start=start,
+        end=end,
+        group_by=group_by,
+        limit=limit,
+        user_id=user_id,
+        agent_id=agent_id,
+    )
+    return [schemas.UsageRanking(**row) for row in rows]
@@ -4,8 +4,14 @@ from sqlalchemy.orm import Session
 
 from .. import models, schemas
 from ..db import get_db
+from ..permissions import (
+    ResourceBatch,
+    can_view_model,
+    evaluate_many,
+    get_user_access,
+    is_super_admin,
+)
 from ..permissions.dependencies import require_menu_user
-from ..permissions import can_view_model, get_user_access, is_super_admin
 from ..services.serializers import model_detail, model_summary
 
 router = APIRouter(prefix="/models", tags=["models"])
@@ -17,13 +23,9 @@ def _list_models_sync(db: Session, current_user: models.User) -> list[schemas.Mo
     if is_super_admin(current_user):
         return [model_summary(model) for model in models_list]
 
-    access = get_user_access(db, current_user)
-    allowed = [
-        model_summary(model)
-        for model in models_list
-        if can_view_model(access, str(model.id))
-    ]
-    return allowed
+    batch = ResourceBatch([str(model.id) for model in models_list])
+    mask = evaluate_many(db, current_user, batch, action="view", resource_type="model")
+    return [model_summary(model) for model in batch.select(models_list, mask)]
 
 
 def _get_model_sync(db: Session, model_id: str, current_user: models.User) -> schemas.ModelDetail:
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -20,6 +21,16 @@ def _as_int(name: str, default: int) -> int:
         return default
 
 
+def _as_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
 def _as_bool(name: str, default: bool = False) -> bool:
     value = os.getenv(name)
     if value is None:
@@ -58,3 +69,79 @@ ACCESS_TOKEN_EXPIRE_MINUTES = _as_int("ACCESS_TOKEN_EXPIRE_MINUTES", 480)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", REDIS_URL)
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
+
+CHAT_PROXY_TIMEOUT = _as_float("CHAT_PROXY_TIMEOUT", 60.0)
+CHAT_PROXY_STREAM_RESPONSES = _as_bool("CHAT_PROXY_STREAM_RESPONSES", True)
+CHAT_PROXY_MAX_CONNECTIONS = _as_int("CHAT_PROXY_MAX_CONNECTIONS", 200)
+CHAT_PROXY_MAX_KEEPALIVE_CONNECTIONS = _as_int("CHAT_PROXY_MAX_KEEPALIVE_CONNECTIONS", 50)
+CHAT_PROXY_KEEPALIVE_EXPIRY = _as_float("CHAT_PROXY_KEEPALIVE_EXPIRY", 30.0)
+CHAT_PROXY_HTTP2 = _as_bool("CHAT_PROXY_HTTP2", True)
+CHAT_PROXY_ROUTE_CACHE_SIZE = _as_int("CHAT_PROXY_ROUTE_CACHE_SIZE", 4096)
+CHAT_PROXY_ROUTE_CACHE_TTL = _as_float("CHAT_PROXY_ROUTE_CACHE_TTL", 60.0)
+CHAT_PROXY_ROUTE_CACHE_NEGATIVE_TTL = _as_float("CHAT_PROXY_ROUTE_CACHE_NEGATIVE_TTL", 10.0)
+CACHE_EPOCH_POLL_INTERVAL = _as_float("CACHE_EPOCH_POLL_INTERVAL", 1.0)
+CHAT_PROXY_PATH_PREFERENCE_SIZE = _as_int("CHAT_PROXY_PATH_PREFERENCE_SIZE", 4096)
+CHAT_PROXY_PATH_REPROBE_INTERVAL = _as_float("CHAT_PROXY_PATH_REPROBE_INTERVAL", 300.0)
+CHAT_PROXY_REWRITE_MAX_BYTES = _as_int("CHAT_PROXY_REWRITE_MAX_BYTES", 1024 * 1024)
+CHAT_PROXY_BODY_SPOOL_BYTES = _as_int("CHAT_PROXY_BODY_SPOOL_BYTES", 1024 * 1024)
+CHAT_PROXY_REWRITE_RESPONSES = _as_bool("CHAT_PROXY_REWRITE_RESPONSES", True)
+CHAT_PROXY_COMPRESSION = _as_bool("CHAT_PROXY_COMPRESSION", True)
+CHAT_PROXY_COMPRESSION_MIN_BYTES = _as_int("CHAT_PROXY_COMPRESSION_MIN_BYTES", 1024)
+CHAT_PROXY_ASSET_CACHE_ENABLED = _as_bool("CHAT_PROXY_ASSET_CACHE_ENABLED", True)
+CHAT_PROXY_ASSET_CACHE_DIR = os.getenv("CHAT_PROXY_ASSET_CACHE_DIR") or os.path.join(
+    tempfile.gettempdir(), "agent-ui-asset-cache"
+)
+CHAT_PROXY_ASSET_CACHE_MAX_BYTES = _as_int("CHAT_PROXY_ASSET_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+CHAT_PROXY_ASSET_CACHE_MAX_ENTRY_BYTES = _as_int("CHAT_PROXY_ASSET_CACHE_MAX_ENTRY_BYTES", 32 * 1024 * 1024)
+CHAT_PROXY_WS_MAX_MESSAGE_BYTES = _as_int("CHAT_PROXY_WS_MAX_MESSAGE_BYTES", 16 * 1024 * 1024)
+CHAT_PROXY_WS_MAX_QUEUE = _as_int("CHAT_PROXY_WS_MAX_QUEUE", 16)
+CHAT_PROXY_WS_MAX_PER_AGENT = _as_int("CHAT_PROXY_WS_MAX_PER_AGENT", 0)
+CHAT_PROXY_COALESCE = _as_bool("CHAT_PROXY_COALESCE", True)
+CHAT_PROXY_COALESCE_MAX_BYTES = _as_int("CHAT_PROXY_COALESCE_MAX_BYTES", 4 * 1024 * 1024)
+CHAT_PROXY_BALANCER_STRATEGY = (os.getenv("CHAT_PROXY_BALANCER_STRATEGY") or "ewma").strip().lower()
+CHAT_PROXY_BALANCER_EWMA_DECAY = _as_float("CHAT_PROXY_BALANCER_EWMA_DECAY", 0.3)
+CHAT_PROXY_STICKY_UPSTREAM = _as_bool("CHAT_PROXY_STICKY_UPSTREAM", True)
+CHAT_PROXY_HEDGE_ENABLED = _as_bool("CHAT_PROXY_HEDGE_ENABLED", False)
+CHAT_PROXY_HEDGE_QUANTILE = _as_float("CHAT_PROXY_HEDGE_QUANTILE", 0.95)
+CHAT_PROXY_HEDGE_WINDOW = _as_int("CHAT_PROXY_HEDGE_WINDOW", 200)
+CHAT_PROXY_HEDGE_MIN_SAMPLES = _as_int("CHAT_PROXY_HEDGE_MIN_SAMPLES", 20)
+CHAT_PROXY_HEDGE_MIN_DELAY = _as_float("CHAT_PROXY_HEDGE_MIN_DELAY", 0.05)
+CHAT_PROXY_HEDGE_BUDGET = _as_float("CHAT_PROXY_HEDGE_BUDGET", 0.05)
+CHAT_PROXY_HEDGE_BURST = _as_float("CHAT_PROXY_HEDGE_BURST", 10.0)
+CHAT_PROXY_ADMISSION_BACKEND = (os.getenv("CHAT_PROXY_ADMISSION_BACKEND") or "memory").strip().lower()
+CHAT_PROXY_ADMISSION_REDIS_URL = os.getenv("CHAT_PROXY_ADMISSION_REDIS_URL") or REDIS_URL
+CHAT_PROXY_ADMISSION_MAX_WAIT = _as_float("CHAT_PROXY_ADMISSION_MAX_WAIT", 2.0)
+CHAT_PROXY_ADMISSION_LEASE_SECONDS = _as_int("CHAT_PROXY_ADMISSION_LEASE_SECONDS", 900)
+CHAT_PROXY_USER_RATE = _as_float("CHAT_PROXY_USER_RATE", 0.0)
+CHAT_PROXY_USER_BURST = _as_int("CHAT_PROXY_USER_BURST", 60)
+CHAT_PROXY_USER_MAX_IN_FLIGHT = _as_int("CHAT_PROXY_USER_MAX_IN_FLIGHT", 32)
+CHAT_PROXY_AGENT_RATE = _as_float("CHAT_PROXY_AGENT_RATE", 0.0)
+CHAT_PROXY_AGENT_BURST = _as_int("CHAT_PROXY_AGENT_BURST", 200)
+CHAT_PROXY_AGENT_MAX_IN_FLIGHT = _as_int("CHAT_PROXY_AGENT_MAX_IN_FLIGHT", 0)
+CHAT_PROXY_UPSTREAM_RATE = _as_float("CHAT_PROXY_UPSTREAM_RATE", 0.0)
+CHAT_PROXY_UPSTREAM_BURST = _as_int("CHAT_PROXY_UPSTREAM_BURST", 500)
+CHAT_PROXY_UPSTREAM_MAX_IN_FLIGHT = _as_int("CHAT_PROXY_UPSTREAM_MAX_IN_FLIGHT", 0)
+UPSTREAM_BREAKER_ENABLED = _as_bool("UPSTREAM_BREAKER_ENABLED", True)
+UPSTREAM_BREAKER_WINDOW = _as_int("UPSTREAM_BREAKER_WINDOW", 20)
+UPSTREAM_BREAKER_MIN_CALLS = _as_int("UPSTREAM_BREAKER_MIN_CALLS", 10)
+UPSTREAM_BREAKER_FAILURE_RATE = _as_float("UPSTREAM_BREAKER_FAILURE_RATE", 0.5)
+UPSTREAM_BREAKER_CONSECUTIVE_FAILURES = _as_int("UPSTREAM_BREAKER_CONSECUTIVE_FAILURES", 5)
+UPSTREAM_BREAKER_SLOW_CALL_SECONDS = _as_float("UPSTREAM_BREAKER_SLOW_CALL_SECONDS", 15.0)
+UPSTREAM_BREAKER_OPEN_SECONDS = _as_float("UPSTREAM_BREAKER_OPEN_SECONDS", 30.0)
+UPSTREAM_HEALTH_CHECK_INTERVAL = _as_float("UPSTREAM_HEALTH_CHECK_INTERVAL", 15.0)
+UPSTREAM_HEALTH_CHECK_TIMEOUT = _as_float("UPSTREAM_HEALTH_CHECK_TIMEOUT", 5.0)
+UPSTREAM_HEALTH_CHECK_PATH = (os.getenv("UPSTREAM_HEALTH_CHECK_PATH") or "").strip()
+METRICS_ENABLED = _as_bool("METRICS_ENABLED", False)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or ""
+CHAT_AUDIT_ENABLED = _as_bool("CHAT_AUDIT_ENABLED", True)
+CHAT_AUDIT_BUFFER_SIZE = _as_int("CHAT_AUDIT_BUFFER_SIZE", 10000)
+CHAT_AUDIT_BATCH_SIZE = _as_int("CHAT_AUDIT_BATCH_SIZE", 500)
+CHAT_AUDIT_FLUSH_INTERVAL_MS = _as_int("CHAT_AUDIT_FLUSH_INTERVAL_MS", 1000)
+CHAT_USAGE_ENABLED = _as_bool("CHAT_USAGE_ENABLED", True)
+CHAT_USAGE_FLUSH_INTERVAL = _as_float("CHAT_USAGE_FLUSH_INTERVAL", 60.0)
+CHAT_USAGE_MAX_KEYS = _as_int("CHAT_USAGE_MAX_KEYS", 100000)
+CHAT_USAGE_MAX_LINE_BYTES = _as_int("CHAT_USAGE_MAX_LINE_BYTES", 256 * 1024)
+PERMISSION_DECISION_CACHE_SIZE = _as_int("PERMISSION_DECISION_CACHE_SIZE", 10000)
+PERMISSION_DECISION_CACHE_TTL = _as_float("PERMISSION_DECISION_CACHE_TTL", 30.0)
+PERMISSION_INDEX_SIZE = _as_int("PERMISSION_INDEX_SIZE", 20000)
+PERMISSION_INDEX_TTL = _as_float("PERMISSION_INDEX_TTL", 30.0)
@@ -1,4 +1,13 @@
-from .session import AsyncSessionLocal, Base, SessionLocal, async_engine, engine, get_db, get_sync_db
+from .session import (
+    AsyncSessionLocal,
+    Base,
+    SessionLocal,
+    async_engine,
+    engine,
+    get_db,
+    get_sync_db,
+    release_session,
+)
 
 __all__ = [
     "Base",
@@ -8,4 +17,5 @@ __all__ = [
     "async_engine",
     "get_db",
     "get_sync_db",
+    "release_session",
 ]
@@ -1,10 +1,12 @@
+import time
 from collections.abc import AsyncGenerator, Generator
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
 from ..config import settings
+from ..services.metrics import DB_POOL_WAIT_SECONDS, REGISTRY
 
 
 def _engine_kwargs() -> dict:
@@ -25,6 +27,58 @@ AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expir
 
 Base = declarative_base()
 
+_CONNECTION_ACQUIRED_AT = "connection_acquired_at"
+_CONNECTION_REQUESTED_AT = "connection_requested_at"
+_POOL_WAIT = {"sync": DB_POOL_WAIT_SECONDS.labels("sync"), "async": DB_POOL_WAIT_SECONDS.labels("async")}
+
+
+def _engine_label(bind) -> str:
+    return "async" if bind is async_engine.sync_engine else "sync"
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_connection_requested(orm_execute_state) -> None:
+    session = orm_execute_state.session
+    if not session.in_transaction():
+        session.info[_CONNECTION_REQUESTED_AT] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_begin")
+def _mark_connection_acquired(session: Session, transaction, connection) -> None:
+    now = time.perf_counter()
+    session.info.setdefault(_CONNECTION_ACQUIRED_AT, now)
+    requested_at = session.info.pop(_CONNECTION_REQUESTED_AT, None)
+    if requested_at is not None:
+        _POOL_WAIT[_engine_label(connection.engine)].observe(now - requested_at)
+
+
+def _pool_samples(method: str):
+    for label, item in (("sync", engine), ("async", async_engine.sync_engine)):
+        # StaticPool/NullPool (e.g. SQLite) expose no counters.
+        reader = getattr(item.pool, method, None)
+        if reader is not None:
+            yield (label,), float(reader())
+
+
+REGISTRY.gauge_callback(
+    "agent_ui_db_pool_checked_out",
+    "Connections currently checked out of the pool.",
+    ("engine",),
+    lambda: _pool_samples("checkedout"),
+)
+REGISTRY.gauge_callback(
+    "agent_ui_db_pool_overflow",
+    "Connections open beyond pool_size (negative while the pool is still filling).",
+    ("engine",),
+    lambda: _pool_samples("overflow"),
+)
+REGISTRY.gauge_callback(
+    "agent_ui_db_pool_size",
+    "Configured pool size.",
+    ("engine",),
+    lambda: _pool_samples("size"),
+)
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     db = AsyncSessionLocal()
@@ -34,6 +88,13 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         await db.close()
 
 
+async def release_session(db: AsyncSession) -> float:
+    """Close ``db`` so its connection returns to the pool; returns seconds the connection was held."""
+    acquired_at = db.info.pop(_CONNECTION_ACQUIRED_AT, None)
+    await db.close()
+    return 0.0 if acquired_at is None else time.perf_counter() - acquired_at
+
+
 def get_sync_db() -> Generator:
     db = SessionLocal()
     try:
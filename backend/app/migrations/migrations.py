@@ -1,10 +1,11 @@
 from __future__ import annotations
 
-from sqlalchemy import inspect, text
+from sqlalchemy import delete, insert, inspect, select, text
 from sqlalchemy.orm import Session
 
 from .. import models, security
 from ..db import Base, engine
+from ..models.agent_groups import agent_group_member_rows, agent_group_names
 from ..services.chat_links import (
     build_proxy_chat_url,
     generate_proxy_id,
@@ -202,6 +203,10 @@ def ensure_schema() -> None:
                 )
             )
             conn.execute(text("ALTER TABLE agents ALTER COLUMN upstream_token SET NOT NULL"))
+            if "upstream_targets" not in columns:
+                conn.execute(text("ALTER TABLE agents ADD COLUMN upstream_targets JSON"))
+            conn.execute(text("UPDATE agents SET upstream_targets = '[]'::json WHERE upstream_targets IS NULL"))
+            conn.execute(text("ALTER TABLE agents ALTER COLUMN upstream_targets SET NOT NULL"))
             if "description" in columns:
                 desc_type = str(column_defs["description"].get("type", "")).lower()
                 # Fit2Cloud `desc/prologue` may exceed 1024 chars; keep full text instead of truncating.
@@ -341,6 +346,9 @@ def ensure_schema() -> None:
         if "users" in tables:
             conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_username_source ON users (username, source)"))
 
+        if "agents" in tables:
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_agents_created_at_id ON agents (created_at, id)"))
+
         if "chat_users" in tables:
             conn.execute(text("CREATE INDEX IF NOT EXISTS ix_chat_users_username_source ON chat_users (username, source)"))
 
@@ -410,6 +418,7 @@ def ensure_schema() -> None:
     _seed_admin_permissions()
     _seed_user_permissions()
     _seed_user_roles()
+    _backfill_agent_group_members()
     _seed_agent_groups()
 
 
@@ -668,21 +677,50 @@ def _seed_user_roles() -> None:
             session.commit()
 
 
+def _backfill_agent_group_members() -> None:
+    # Rebuilds membership rows for agents whose groups changed outside the ORM (or predate the table).
+    table = models.AgentGroupMember.__table__
+    with Session(engine) as session:
+        expected = {
+            str(row.id): agent_group_names(row)
+            for row in session.execute(select(models.Agent.id, models.Agent.groups, models.Agent.group_name))
+        }
+        existing: dict[str, list[str]] = {}
+        for agent_id, group_name in session.execute(
+            select(table.c.agent_id, table.c.group_name).order_by(table.c.agent_id, table.c.position)
+        ):
+            existing.setdefault(str(agent_id), []).append(group_name)
+
+        stale = [
+            agent_id
+            for agent_id in existing.keys() | expected.keys()
+            if existing.get(agent_id, []) != expected.get(agent_id, [])
+        ]
+        if not stale:
+            return
+        for start in range(0, len(stale), 500):
+            chunk = stale[start : start + 500]
+            session.execute(delete(table).where(table.c.agent_id.in_(chunk)))
+            rows = [
+                row
+                for agent_id in chunk
+                for row in agent_group_member_rows(agent_id, expected.get(agent_id, []))
+            ]
+            if rows:
+                session.execute(insert(table), rows)
+        session.commit()
+
+
 def _seed_agent_groups() -> None:
     with Session(engine) as session:
         existing = {group.name for group in session.query(models.AgentGroup).all()}
         created = False
-        agents = session.query(models.Agent).all()
-        for agent in agents:
-            groups = list(agent.groups or [])
-            if not groups and agent.group_name:
-                groups = [agent.group_name]
-            for name in groups:
-                name = str(name).strip()
-                if not name or name in existing:
-                    continue
-                session.add(models.AgentGroup(name=name, description=""))
-                existing.add(name)
-                created = True
+        member_groups = session.query(models.AgentGroupMember.group_name).distinct().all()
+        for (name,) in member_groups:
+            if not name or name in existing:
+                continue
+            session.add(models.AgentGroup(name=name, description=""))
+            existing.add(name)
+            created = True
         if created:
             session.commit()
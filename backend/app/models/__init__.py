@@ -1,9 +1,14 @@
+from .agent_groups import agent_group_names
 from .entities import (
     Agent,
     AgentApiConfig,
     AgentChatUserAccess,
     AgentGroup,
+    AgentGroupMember,
     AuthProviderConfig,
+    CacheEpoch,
+    ChatAccessLog,
+    ChatUsageRollup,
     ChatUser,
     ChatUserGroup,
     ChatUserGroupMember,
@@ -15,8 +20,8 @@ from .entities import (
     SystemAuthSetting,
     User,
     UserChatBinding,
-    UserSsoBinding,
     UserRole,
+    UserSsoBinding,
 )
 
 __all__ = [
@@ -24,7 +29,11 @@ __all__ = [
     "AgentApiConfig",
     "AgentChatUserAccess",
     "AgentGroup",
+    "AgentGroupMember",
     "AuthProviderConfig",
+    "CacheEpoch",
+    "ChatAccessLog",
+    "ChatUsageRollup",
     "ChatUser",
     "ChatUserGroup",
     "ChatUserGroupMember",
@@ -38,4 +47,5 @@ __all__ = [
     "UserChatBinding",
     "UserSsoBinding",
     "UserRole",
+    "agent_group_names",
 ]
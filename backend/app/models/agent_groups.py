@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+from sqlalchemy import delete, event, insert, inspect
+from sqlalchemy.orm import Session
+
+from .entities import Agent, AgentGroupMember
+
+
+def agent_group_names(agent) -> list[str]:
+    """An agent's groups in order, stripped and de-duplicated; ``group_name`` when ``groups`` is empty."""
+    raw = list(agent.groups or [])
+    if not raw and agent.group_name:
+        raw = [agent.group_name]
+    names: list[str] = []
+    seen: set[str] = set()
+    for item in raw:
+        name = str(item or "").strip()
+        if not name or name in seen:
+            continue
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def agent_group_member_rows(agent_id: str, groups: list[str]) -> list[dict]:
+    return [
+        {"agent_id": agent_id, "group_name": name, "position": position}
+        for position, name in enumerate(groups)
+    ]
+
+
+def _groups_changed(agent: Agent) -> bool:
+    attrs = inspect(agent).attrs
+    return attrs.groups.history.has_changes() or attrs.group_name.history.has_changes()
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_agent_group_members(session: Session, flush_context) -> None:
+    changed: dict[str, list[str]] = {}
+    for obj in session.new:
+        if isinstance(obj, Agent):
+            changed[obj.id] = agent_group_names(obj)
+    for obj in session.dirty:
+        if isinstance(obj, Agent) and _groups_changed(obj):
+            changed[obj.id] = agent_group_names(obj)
+    removed = [obj.id for obj in session.deleted if isinstance(obj, Agent)]
+    if not changed and not removed:
+        return
+
+    table = AgentGroupMember.__table__
+    connection = session.connection()
+    connection.execute(delete(table).where(table.c.agent_id.in_([*changed, *removed])))
+    rows = [row for agent_id, groups in changed.items() for row in agent_group_member_rows(agent_id, groups)]
+    if rows:
+        connection.execute(insert(table), rows)
@@ -1,6 +1,18 @@
 from uuid import uuid4
 
-from sqlalchemy import JSON, Boolean, Column, DateTime, Index, Integer, String, Text, UniqueConstraint, func
+from sqlalchemy import (
+    JSON,
+    BigInteger,
+    Boolean,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+    func,
+)
 
 from ..db import Base
 
@@ -147,6 +159,8 @@ class Agent(Base):
     proxy_id = Column(String(64), unique=True, nullable=False, index=True, default=lambda: uuid4().hex)
     upstream_base_url = Column(String(255), nullable=False, default="")
     upstream_token = Column(String(1024), nullable=False, default="")
+    # Extra upstream nodes serving the same application: [{"base_url": ..., "weight": ...}, ...]
+    upstream_targets = Column(JSON, nullable=False, default=list)
     url = Column(String(1024), nullable=False)
     description = Column(Text, nullable=False, default="")
     group_name = Column(String(255), nullable=False, default="")
@@ -162,6 +176,9 @@ class Agent(Base):
     sync_config_id = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
+    # Keyset order of the agent catalog listing.
+    __table_args__ = (Index("ix_agents_created_at_id", "created_at", "id"),)
+
 
 class AgentGroup(Base):
     __tablename__ = "agent_groups"
@@ -172,6 +189,17 @@ class AgentGroup(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 
+class AgentGroupMember(Base):
+    # Normalised copy of Agent.groups (group_name fallback), kept in sync by app.models.agent_groups.
+    __tablename__ = "agent_group_members"
+
+    agent_id = Column(String(64), primary_key=True)
+    group_name = Column(String(255), primary_key=True)
+    position = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (Index("ix_agent_group_members_group", "group_name", "agent_id"),)
+
+
 class AgentApiConfig(Base):
     __tablename__ = "agent_api_configs"
 
@@ -302,6 +330,54 @@ class SyncTask(Base):
     finished_at = Column(DateTime(timezone=True), nullable=True)
 
 
+class ChatAccessLog(Base):
+    __tablename__ = "chat_access_logs"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    occurred_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    user_id = Column(Integer, nullable=True)
+    agent_id = Column(String(64), nullable=False, default="")
+    proxy_id = Column(String(64), nullable=False, default="")
+    transport = Column(String(16), nullable=False, default="http")
+    method = Column(String(16), nullable=False, default="")
+    path = Column(String(512), nullable=False, default="")
+    status_code = Column(Integer, nullable=False, default=0)
+    bytes_sent = Column(BigInteger, nullable=False, default=0)
+    duration_ms = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_chat_access_log_agent_time", "agent_id", "occurred_at"),
+        Index("ix_chat_access_log_user_time", "user_id", "occurred_at"),
+    )
+
+
+class ChatUsageRollup(Base):
+    __tablename__ = "chat_usage_rollups"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    bucket_start = Column(DateTime(timezone=True), nullable=False, index=True)
+    user_id = Column(Integer, nullable=False)
+    agent_id = Column(String(64), nullable=False)
+    requests = Column(BigInteger, nullable=False, default=0)
+    prompt_tokens = Column(BigInteger, nullable=False, default=0)
+    completion_tokens = Column(BigInteger, nullable=False, default=0)
+    total_tokens = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "agent_id", "bucket_start", name="uq_chat_usage_rollup_key"),
+        Index("ix_chat_usage_rollup_agent_time", "agent_id", "bucket_start"),
+    )
+
+
+class CacheEpoch(Base):
+    # One write counter per source table of a per-process cache; see app.services.cache_epochs.
+    __tablename__ = "cache_epochs"
+
+    # Name of the table whose writes the counter tracks.
+    name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+
+
 class AuthProviderConfig(Base):
     __tablename__ = "auth_provider_configs"
 
@@ -1,2 +1,4 @@
+from .decision_cache import *  # noqa: F401,F403
 from .engine import *  # noqa: F401,F403
+from .index import *  # noqa: F401,F403
 from .permissions import *  # noqa: F401,F403
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..config import settings
+from ..services.cache_epochs import track_cache_epoch
+from .index import (
+    PERMISSION_INDEX_DIRTY_KEY,
+    PERMISSION_INDEX_TABLES,
+    bump_permission_epoch,
+)
+
+# Writes to these tables can change who may open which agent.
+PERMISSION_SOURCE_TABLES = frozenset(
+    {
+        "users",
+        "roles",
+        "user_roles",
+        "permission_grants",
+        "policies",
+        "agents",
+        "agent_groups",
+        "chat_users",
+        "user_chat_bindings",
+        "agent_chat_user_accesses",
+    }
+)
+_DIRTY_INFO_KEY = "permission_decisions_dirty"
+
+
+def hash_auth_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class PermissionDecisionCache:
+    """Short-lived cross-request cache of allowed decisions keyed by (token hash, resource id, action).
+
+    Only positive decisions are stored; the value is the authenticated user id so callers can
+    skip token decoding and user lookups on a hit.
+    """
+
+    def __init__(self, *, max_entries: int, ttl: float) -> None:
+        self._max_entries = max(0, max_entries)
+        self._ttl = max(0.0, ttl)
+        self._entries: OrderedDict[tuple[str, str, str], tuple[float, int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0 and self._ttl > 0
+
+    def get(self, token: str, resource_id: str, action: str) -> int | None:
+        if not self.enabled or not token:
+            return None
+        key = (hash_auth_token(token), resource_id, action)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, user_id = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user_id
+
+    def put(
+        self,
+        token: str,
+        resource_id: str,
+        action: str,
+        user_id: int,
+        *,
+        max_age: float | None = None,
+    ) -> None:
+        if not self.enabled or not token:
+            return
+        ttl = self._ttl if max_age is None else min(self._ttl, max_age)
+        if ttl <= 0:
+            return
+        key = (hash_auth_token(token), resource_id, action)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, int(user_id))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_decision_cache = PermissionDecisionCache(
+    max_entries=settings.PERMISSION_DECISION_CACHE_SIZE,
+    ttl=settings.PERMISSION_DECISION_CACHE_TTL,
+)
+
+
+def get_permission_decision_cache() -> PermissionDecisionCache:
+    return _decision_cache
+
+
+def invalidate_permission_decisions() -> None:
+    _decision_cache.clear()
+
+
+# Commits from other processes (the sync worker, other API workers) evict this worker's decisions
+# and compiled index entries within CACHE_EPOCH_POLL_INTERVAL; the after_commit hook below covers
+# this process at once.
+track_cache_epoch("permission_decisions", PERMISSION_SOURCE_TABLES, invalidate_permission_decisions)
+track_cache_epoch("permission_index", PERMISSION_INDEX_TABLES, bump_permission_epoch)
+
+
+def _mark_permission_writes(session: Session, tables: Iterable[str]) -> None:
+    info = session.info
+    for table in tables:
+        if table in PERMISSION_INDEX_TABLES:
+            info[_DIRTY_INFO_KEY] = True
+            info[PERMISSION_INDEX_DIRTY_KEY] = True
+            return
+        if table in PERMISSION_SOURCE_TABLES:
+            info[_DIRTY_INFO_KEY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _track_permission_flush(session: Session, flush_context) -> None:
+    if session.info.get(PERMISSION_INDEX_DIRTY_KEY):
+        return
+    _mark_permission_writes(
+        session,
+        (
+            getattr(obj, "__tablename__", None)
+            for obj in chain(session.new, session.dirty, session.deleted)
+        ),
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_permission_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_select:
+        return
+    _mark_permission_writes(
+        orm_execute_state.session,
+        (mapper.local_table.name for mapper in orm_execute_state.all_mappers),
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _flush_decisions_on_commit(session: Session) -> None:
+    if session.info.pop(PERMISSION_INDEX_DIRTY_KEY, False):
+        bump_permission_epoch()
+    if session.info.pop(_DIRTY_INFO_KEY, False):
+        invalidate_permission_decisions()
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_decisions_on_rollback(session: Session) -> None:
+    session.info.pop(_DIRTY_INFO_KEY, None)
+    session.info.pop(PERMISSION_INDEX_DIRTY_KEY, None)
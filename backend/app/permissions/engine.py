@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import os
 from dataclasses import dataclass, field
-from typing import Any, Iterable, Mapping, Protocol
+from typing import Any, Iterable, Mapping, Protocol, Sequence
 
 ACTION_ORDER = {
     "view": 1,
@@ -25,6 +25,12 @@ IMPLIED_ACTION_MASK = {
 PermissionAccess = dict[tuple[str, str, str | None], int]
 
 
+def actions_implying(action: str) -> list[str]:
+    """Grant actions that satisfy a check for ``action`` (``view`` is implied by all three)."""
+    required = ACTION_BITS.get(action, 0)
+    return [name for name, mask in IMPLIED_ACTION_MASK.items() if mask & required]
+
+
 class GrantLike(Protocol):
     scope: str
     resource_type: str
@@ -95,6 +101,87 @@ def access_allows(access: PermissionAccess, request: PermissionRequest) -> Permi
     return PermissionDecision(allowed=False, reason="no matching permission grant")
 
 
+class ResourceBatch:
+    """N resources of one type evaluated together; the result of a batch check is an int bitset
+    where bit ``i`` stands for ``resource_ids[i]``.
+
+    Group memberships are folded into one bitset per group up front, so a group grant costs a
+    single OR instead of a membership test per resource.
+    """
+
+    __slots__ = ("resource_ids", "size", "full", "grouped", "group_bits", "_positions")
+
+    def __init__(
+        self,
+        resource_ids: Sequence[str],
+        groups: Sequence[Iterable[str]] | None = None,
+    ) -> None:
+        self.resource_ids = list(resource_ids)
+        self.size = len(self.resource_ids)
+        self.full = (1 << self.size) - 1
+        self.grouped = groups is not None
+        self._positions: dict[str, int] | None = None
+        width = (self.size + 7) // 8
+        members: dict[str, bytearray] = {}
+        for position, names in enumerate(groups or ()):
+            for name in names:
+                bits = members.get(name)
+                if bits is None:
+                    bits = members[name] = bytearray(width)
+                bits[position >> 3] |= 1 << (position & 7)
+        self.group_bits = {name: int.from_bytes(bits, "little") for name, bits in members.items()}
+
+    def bits_for(self, resource_ids: Iterable[str]) -> int:
+        if self._positions is None:
+            self._positions = {resource_id: index for index, resource_id in enumerate(self.resource_ids)}
+        bits = bytearray((self.size + 7) // 8)
+        for resource_id in resource_ids:
+            position = self._positions.get(resource_id)
+            if position is not None:
+                bits[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(bits, "little")
+
+    def select(self, items: Sequence, mask: int) -> list:
+        """The entries of ``items`` (parallel to ``resource_ids``) whose bit is set in ``mask``."""
+        if mask == self.full:
+            return list(items)
+        bits = mask.to_bytes((self.size + 7) // 8, "little")
+        return [item for index, item in enumerate(items) if bits[index >> 3] >> (index & 7) & 1]
+
+
+def access_allows_many(
+    access: Mapping[tuple[str, str, str | None], int],
+    batch: ResourceBatch,
+    *,
+    action: str,
+    scope: str,
+    resource_type: str,
+) -> int:
+    """Batch form of ``access_allows``: the bitset of ``batch`` resources the grants allow."""
+    required = ACTION_BITS.get(action)
+    if required is None or not batch.size:
+        return 0
+    if access.get((scope, resource_type, None), 0) & required:
+        return batch.full
+
+    bridge_groups = scope == "resource" and resource_type == "agent" and batch.grouped
+    if bridge_groups and access.get(("resource", "agent_group", None), 0) & required:
+        return batch.full
+
+    direct: list[str] = []
+    mask = 0
+    for (grant_scope, grant_type, resource_id), granted in access.items():
+        if resource_id is None or not granted & required:
+            continue
+        if grant_scope == scope and grant_type == resource_type:
+            direct.append(resource_id)
+        elif bridge_groups and grant_scope == "resource" and grant_type == "agent_group":
+            mask |= batch.group_bits.get(resource_id, 0)
+    if direct:
+        mask |= batch.bits_for(direct)
+    return mask
+
+
 class PermissionEngine(Protocol):
     name: str
 
@@ -108,6 +195,18 @@ class PermissionEngine(Protocol):
     ) -> PermissionDecision:
         ...
 
+    def evaluate_many(
+        self,
+        *,
+        action: str,
+        scope: str,
+        resource_type: str,
+        batch: ResourceBatch,
+        access: PermissionAccess,
+        super_admin: bool = False,
+    ) -> int:
+        ...
+
 
 class RbacAclPermissionEngine:
     name = "rbac_acl"
@@ -125,6 +224,22 @@ class RbacAclPermissionEngine:
         resolved_access = access or build_access_map(grants)
         return access_allows(resolved_access, request)
 
+    def evaluate_many(
+        self,
+        *,
+        action: str,
+        scope: str,
+        resource_type: str,
+        batch: ResourceBatch,
+        access: PermissionAccess,
+        super_admin: bool = False,
+    ) -> int:
+        if super_admin:
+            return batch.full
+        return access_allows_many(
+            access, batch, action=action, scope=scope, resource_type=resource_type
+        )
+
 
 class HybridAbacBridgeEngine(RbacAclPermissionEngine):
     # Placeholder engine to make future ABAC migration a drop-in replacement.
@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass
+
+from ..config import settings
+from ..services.metrics import REGISTRY
+from .engine import GrantLike, build_access_map
+
+# Writes to these tables change a user's role set or compiled grants.
+PERMISSION_INDEX_TABLES = frozenset({"users", "roles", "user_roles", "permission_grants"})
+PERMISSION_INDEX_DIRTY_KEY = "permission_index_dirty"
+
+PERMISSION_INDEX_LOOKUPS = REGISTRY.counter(
+    "agent_ui_permission_index_lookups_total",
+    "Compiled permission index lookups by kind (roles, access) and result (hit, miss, stale).",
+    ("kind", "result"),
+)
+
+_epoch = 0
+_epoch_lock = threading.Lock()
+
+
+def current_permission_epoch() -> int:
+    return _epoch
+
+
+def bump_permission_epoch() -> int:
+    """Invalidate every compiled permission entry in this process."""
+    global _epoch
+    with _epoch_lock:
+        _epoch += 1
+        return _epoch
+
+
+@dataclass(frozen=True, slots=True)
+class GrantRecord:
+    """Session-independent copy of a PermissionGrant row, safe to share across requests."""
+
+    subject_type: str
+    subject_id: str
+    scope: str
+    resource_type: str
+    resource_id: str | None
+    action: str
+
+    @classmethod
+    def from_grant(cls, grant) -> GrantRecord:
+        return cls(
+            subject_type=grant.subject_type,
+            subject_id=grant.subject_id,
+            scope=grant.scope,
+            resource_type=grant.resource_type,
+            resource_id=grant.resource_id,
+            action=grant.action,
+        )
+
+
+ResourceKey = tuple[str, str, str | None]
+
+
+class ResourceKeyTable:
+    """Interns (scope, resource_type, resource_id) keys to small ints shared by all compiled entries."""
+
+    def __init__(self) -> None:
+        self._ids: dict[ResourceKey, int] = {}
+        self._keys: list[ResourceKey] = []
+        self._lock = threading.Lock()
+
+    def intern(self, key: ResourceKey) -> int:
+        index = self._ids.get(key)
+        if index is not None:
+            return index
+        with self._lock:
+            index = self._ids.get(key)
+            if index is None:
+                index = self._ids[key] = len(self._keys)
+                self._keys.append(key)
+            return index
+
+    def lookup(self, key: ResourceKey) -> int | None:
+        return self._ids.get(key)
+
+    def key(self, index: int) -> ResourceKey:
+        return self._keys[index]
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+class CompiledAccess(Mapping):
+    """Read-only ``PermissionAccess`` backed by an interned-key -> action bitmask table."""
+
+    __slots__ = ("_masks", "_keys")
+
+    def __init__(self, masks: dict[int, int], keys: ResourceKeyTable) -> None:
+        self._masks = masks
+        self._keys = keys
+
+    @classmethod
+    def compile(cls, grants: Iterable[GrantLike], keys: ResourceKeyTable) -> CompiledAccess:
+        masks = {keys.intern(key): mask for key, mask in build_access_map(grants).items()}
+        return cls(masks, keys)
+
+    def get(self, key, default=None):
+        index = self._keys.lookup(key)
+        if index is None:
+            return default
+        return self._masks.get(index, default)
+
+    def __getitem__(self, key) -> int:
+        index = self._keys.lookup(key)
+        if index is None or index not in self._masks:
+            raise KeyError(key)
+        return self._masks[index]
+
+    def __contains__(self, key) -> bool:
+        index = self._keys.lookup(key)
+        return index is not None and index in self._masks
+
+    def __iter__(self) -> Iterator[ResourceKey]:
+        return (self._keys.key(index) for index in self._masks)
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+
+class PermissionIndex:
+    """Process-wide cache of role sets per user and compiled access per (user, role set).
+
+    Every entry records the permission epoch read before its rows were loaded and is ignored once
+    the epoch moves on, so a grant, role or user-role commit in this process takes effect on the
+    next check. Commits from other processes bump it through the cache epoch watcher; the TTL
+    remains the bound when that watcher is disabled.
+    """
+
+    def __init__(self, *, max_entries: int, ttl: float) -> None:
+        self._max_entries = max(0, max_entries)
+        self._ttl = max(0.0, ttl)
+        self._entries: OrderedDict[tuple, tuple[int, float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.keys = ResourceKeyTable()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0 and self._ttl > 0
+
+    def _get(self, key: tuple):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                PERMISSION_INDEX_LOOKUPS.labels(key[0], "miss").inc()
+                return None
+            epoch, expires_at, value = entry
+            if epoch != _epoch or expires_at <= time.monotonic():
+                del self._entries[key]
+                PERMISSION_INDEX_LOOKUPS.labels(key[0], "stale").inc()
+                return None
+            self._entries.move_to_end(key)
+        PERMISSION_INDEX_LOOKUPS.labels(key[0], "hit").inc()
+        return value
+
+    def _put(self, key: tuple, value, epoch: int) -> None:
+        if not self.enabled or epoch != _epoch:
+            return
+        with self._lock:
+            self._entries[key] = (epoch, time.monotonic() + self._ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def roles(self, user_id: int) -> tuple[str, ...] | None:
+        return self._get(("roles", user_id))
+
+    def put_roles(self, user_id: int, roles: Iterable[str], *, epoch: int) -> None:
+        self._put(("roles", user_id), tuple(roles), epoch)
+
+    def access(
+        self, user_id: int, roles: tuple[str, ...]
+    ) -> tuple[CompiledAccess, tuple[GrantRecord, ...]] | None:
+        return self._get(("access", user_id, roles))
+
+    def compile_access(
+        self,
+        user_id: int,
+        roles: tuple[str, ...],
+        grants: Iterable,
+        *,
+        epoch: int,
+    ) -> tuple[CompiledAccess, tuple[GrantRecord, ...]]:
+        records = tuple(GrantRecord.from_grant(grant) for grant in grants)
+        compiled = (CompiledAccess.compile(records, self.keys), records)
+        self._put(("access", user_id, roles), compiled, epoch)
+        return compiled
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_permission_index = PermissionIndex(
+    max_entries=settings.PERMISSION_INDEX_SIZE,
+    ttl=settings.PERMISSION_INDEX_TTL,
+)
+
+
+def get_permission_index() -> PermissionIndex:
+    return _permission_index
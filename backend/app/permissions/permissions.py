@@ -1,22 +1,44 @@
 from __future__ import annotations
 
 from collections.abc import Iterable
+from time import perf_counter
 
 from fastapi import HTTPException, status
 from sqlalchemy import or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..models import Agent, AgentGroup, Model, PermissionGrant, User, UserRole
+from ..models import (
+    Agent,
+    AgentGroup,
+    AgentGroupMember,
+    Model,
+    PermissionGrant,
+    User,
+    UserRole,
+)
+from ..services.metrics import PERMISSION_EVALUATION_SECONDS
 from .engine import (
     ACTION_BITS,
     ACTION_ORDER,
     PermissionAccess,
     PermissionDecision,
     PermissionRequest,
+    ResourceBatch,
+    get_permission_engine,
+)
+from .engine import (
     access_allows as engine_access_allows,
+)
+from .engine import (
     build_access_map as engine_build_access_map,
-    get_permission_engine,
+)
+from .index import (
+    PERMISSION_INDEX_DIRTY_KEY,
+    CompiledAccess,
+    GrantRecord,
+    current_permission_epoch,
+    get_permission_index,
 )
 
 MENU_IDS = {"agents", "models", "admin"}
@@ -46,45 +68,72 @@ def _normalize_role_names(items: Iterable[str]) -> list[str]:
     return cleaned
 
 
-def get_user_role_names(db: Session, user: User) -> list[str]:
-    cache_key = f"user_roles:{user.id}"
-    cached = _session_info(db).get(cache_key)
-    if cached is not None:
-        return cached
+def _index_usable(db: Session | AsyncSession) -> bool:
+    # Uncommitted permission writes in this session must be read back from the database.
+    session = getattr(db, "sync_session", db)
+    return not session.info.get(PERMISSION_INDEX_DIRTY_KEY) and not session.new
 
-    rows = (
-        db.query(UserRole.role_name)
-        .filter(UserRole.user_id == user.id)
-        .order_by(UserRole.role_name.asc())
-        .all()
-    )
+
+def _role_names_from_rows(user: User, rows) -> list[str]:
     role_names = _normalize_role_names(name for (name,) in rows)
     if not role_names:
         fallback = (user.role or "user").strip() or "user"
         role_names = [fallback]
-
-    _session_info(db)[cache_key] = role_names
     return role_names
 
 
-async def get_user_role_names_async(db: AsyncSession, user: User) -> list[str]:
+def get_user_role_names(db: Session, user: User) -> list[str]:
     cache_key = f"user_roles:{user.id}"
     info = _session_info(db)
     cached = info.get(cache_key)
     if cached is not None:
         return cached
 
-    rows = (
-        await db.execute(
-            select(UserRole.role_name)
-            .where(UserRole.user_id == user.id)
+    index = get_permission_index()
+    usable = _index_usable(db)
+    indexed = index.roles(user.id) if usable else None
+    if indexed is not None:
+        role_names = list(indexed)
+    else:
+        epoch = current_permission_epoch()
+        rows = (
+            db.query(UserRole.role_name)
+            .filter(UserRole.user_id == user.id)
             .order_by(UserRole.role_name.asc())
+            .all()
         )
-    ).all()
-    role_names = _normalize_role_names(name for (name,) in rows)
-    if not role_names:
-        fallback = (user.role or "user").strip() or "user"
-        role_names = [fallback]
+        role_names = _role_names_from_rows(user, rows)
+        if usable:
+            index.put_roles(user.id, role_names, epoch=epoch)
+
+    info[cache_key] = role_names
+    return role_names
+
+
+async def get_user_role_names_async(db: AsyncSession, user: User) -> list[str]:
+    cache_key = f"user_roles:{user.id}"
+    info = _session_info(db)
+    cached = info.get(cache_key)
+    if cached is not None:
+        return cached
+
+    index = get_permission_index()
+    usable = _index_usable(db)
+    indexed = index.roles(user.id) if usable else None
+    if indexed is not None:
+        role_names = list(indexed)
+    else:
+        epoch = current_permission_epoch()
+        rows = (
+            await db.execute(
+                select(UserRole.role_name)
+                .where(UserRole.user_id == user.id)
+                .order_by(UserRole.role_name.asc())
+            )
+        ).all()
+        role_names = _role_names_from_rows(user, rows)
+        if usable:
+            index.put_roles(user.id, role_names, epoch=epoch)
 
     info[cache_key] = role_names
     return role_names
@@ -231,78 +280,79 @@ def can_view_model(access: PermissionAccess, model_id: str) -> bool:
     )
 
 
-def get_user_grants(db: Session, user: User) -> list[PermissionGrant]:
-    role_names = get_user_role_names(db, user)
-    role_key = ",".join(sorted(role_names))
-    cache_key = f"perm_grants:{user.id}:{role_key}"
-    cached = _session_info(db).get(cache_key)
-    if cached is not None:
-        return cached
-
+def grant_subject_filter(user: User, role_names: list[str]):
+    """WHERE clause for the grants held by ``user`` directly or through ``role_names``."""
     user_clause = (PermissionGrant.subject_type == "user") & (
         PermissionGrant.subject_id == str(user.id)
     )
     role_clause = (PermissionGrant.subject_type == "role") & (
         PermissionGrant.subject_id.in_(role_names)
     )
-    grants = db.query(PermissionGrant).filter(or_(user_clause, role_clause)).all()
-    _session_info(db)[cache_key] = grants
-    return grants
+    return or_(user_clause, role_clause)
 
 
-async def get_user_grants_async(db: AsyncSession, user: User) -> list[PermissionGrant]:
-    role_names = await get_user_role_names_async(db, user)
-    role_key = ",".join(sorted(role_names))
-    cache_key = f"perm_grants:{user.id}:{role_key}"
+def _compiled_access(db: Session, user: User) -> tuple[CompiledAccess, tuple[GrantRecord, ...]]:
+    role_names = get_user_role_names(db, user)
+    roles = tuple(sorted(role_names))
+    cache_key = f"perm_compiled:{user.id}:{','.join(roles)}"
     info = _session_info(db)
     cached = info.get(cache_key)
     if cached is not None:
         return cached
 
-    user_clause = (PermissionGrant.subject_type == "user") & (
-        PermissionGrant.subject_id == str(user.id)
-    )
-    role_clause = (PermissionGrant.subject_type == "role") & (
-        PermissionGrant.subject_id.in_(role_names)
-    )
-    grants = (await db.execute(select(PermissionGrant).where(or_(user_clause, role_clause)))).scalars().all()
-    info[cache_key] = grants
-    return grants
+    index = get_permission_index()
+    usable = _index_usable(db)
+    compiled = index.access(user.id, roles) if usable else None
+    if compiled is None:
+        epoch = current_permission_epoch() if usable else -1
+        grants = db.query(PermissionGrant).filter(grant_subject_filter(user, role_names)).all()
+        compiled = index.compile_access(user.id, roles, grants, epoch=epoch)
+    info[cache_key] = compiled
+    return compiled
 
 
-def get_user_access(db: Session, user: User) -> PermissionAccess:
-    if is_super_admin(user):
-        return {}
-
-    role_names = get_user_role_names(db, user)
-    role_key = ",".join(sorted(role_names))
-    cache_key = f"perm_access:{user.id}:{role_key}"
-    cached = _session_info(db).get(cache_key)
+async def _compiled_access_async(
+    db: AsyncSession, user: User
+) -> tuple[CompiledAccess, tuple[GrantRecord, ...]]:
+    role_names = await get_user_role_names_async(db, user)
+    roles = tuple(sorted(role_names))
+    cache_key = f"perm_compiled:{user.id}:{','.join(roles)}"
+    info = _session_info(db)
+    cached = info.get(cache_key)
     if cached is not None:
         return cached
 
-    grants = get_user_grants(db, user)
-    access = _build_access_map(grants)
-    _session_info(db)[cache_key] = access
-    return access
+    index = get_permission_index()
+    usable = _index_usable(db)
+    compiled = index.access(user.id, roles) if usable else None
+    if compiled is None:
+        epoch = current_permission_epoch() if usable else -1
+        grants = (
+            await db.execute(select(PermissionGrant).where(grant_subject_filter(user, role_names)))
+        ).scalars().all()
+        compiled = index.compile_access(user.id, roles, grants, epoch=epoch)
+    info[cache_key] = compiled
+    return compiled
 
 
-async def get_user_access_async(db: AsyncSession, user: User) -> PermissionAccess:
+def get_user_grants(db: Session, user: User) -> list[GrantRecord]:
+    return list(_compiled_access(db, user)[1])
+
+
+async def get_user_grants_async(db: AsyncSession, user: User) -> list[GrantRecord]:
+    return list((await _compiled_access_async(db, user))[1])
+
+
+def get_user_access(db: Session, user: User) -> PermissionAccess:
     if is_super_admin(user):
         return {}
+    return _compiled_access(db, user)[0]
 
-    role_names = await get_user_role_names_async(db, user)
-    role_key = ",".join(sorted(role_names))
-    cache_key = f"perm_access:{user.id}:{role_key}"
-    info = _session_info(db)
-    cached = info.get(cache_key)
-    if cached is not None:
-        return cached
 
-    grants = await get_user_grants_async(db, user)
-    access = _build_access_map(grants)
-    info[cache_key] = access
-    return access
+async def get_user_access_async(db: AsyncSession, user: User) -> PermissionAccess:
+    if is_super_admin(user):
+        return {}
+    return (await _compiled_access_async(db, user))[0]
 
 
 def evaluate_permission(
@@ -316,6 +366,7 @@ def evaluate_permission(
     resource_attrs: dict | None = None,
     subject_attrs: dict | None = None,
 ) -> PermissionDecision:
+    started = perf_counter()
     request = PermissionRequest(
         action=action,
         scope=scope,
@@ -327,12 +378,14 @@ def evaluate_permission(
         resource_attrs=resource_attrs or {},
     )
     engine = get_permission_engine()
-    return engine.evaluate(
+    decision = engine.evaluate(
         request=request,
         grants=get_user_grants(db, user),
         access=get_user_access(db, user),
         super_admin=is_super_admin(user),
     )
+    PERMISSION_EVALUATION_SECONDS.labels(action).observe(perf_counter() - started)
+    return decision
 
 
 async def evaluate_permission_async(
@@ -346,6 +399,7 @@ async def evaluate_permission_async(
     resource_attrs: dict | None = None,
     subject_attrs: dict | None = None,
 ) -> PermissionDecision:
+    started = perf_counter()
     request = PermissionRequest(
         action=action,
         scope=scope,
@@ -357,12 +411,61 @@ async def evaluate_permission_async(
         resource_attrs=resource_attrs or {},
     )
     engine = get_permission_engine()
-    return engine.evaluate(
+    decision = engine.evaluate(
         request=request,
         grants=await get_user_grants_async(db, user),
         access=await get_user_access_async(db, user),
         super_admin=is_super_admin(user),
     )
+    PERMISSION_EVALUATION_SECONDS.labels(action).observe(perf_counter() - started)
+    return decision
+
+
+def evaluate_many(
+    db: Session,
+    user: User,
+    batch: ResourceBatch,
+    *,
+    action: str,
+    resource_type: str,
+    scope: str = "resource",
+) -> int:
+    """Bitset of the ``batch`` resources ``user`` may ``action``, evaluated in one pass."""
+    started = perf_counter()
+    super_admin = is_super_admin(user)
+    mask = get_permission_engine().evaluate_many(
+        action=action,
+        scope=scope,
+        resource_type=resource_type,
+        batch=batch,
+        access={} if super_admin else get_user_access(db, user),
+        super_admin=super_admin,
+    )
+    PERMISSION_EVALUATION_SECONDS.labels(action).observe(perf_counter() - started)
+    return mask
+
+
+async def evaluate_many_async(
+    db: AsyncSession,
+    user: User,
+    batch: ResourceBatch,
+    *,
+    action: str,
+    resource_type: str,
+    scope: str = "resource",
+) -> int:
+    started = perf_counter()
+    super_admin = is_super_admin(user)
+    mask = get_permission_engine().evaluate_many(
+        action=action,
+        scope=scope,
+        resource_type=resource_type,
+        batch=batch,
+        access={} if super_admin else await get_user_access_async(db, user),
+        super_admin=super_admin,
+    )
+    PERMISSION_EVALUATION_SECONDS.labels(action).observe(perf_counter() - started)
+    return mask
 
 
 def has_permission(
@@ -541,7 +644,8 @@ async def summarize_permissions_async(db: AsyncSession, user: User) -> dict:
         return {
             "roles": role_names,
             "is_super_admin": True,
-            "synced_agent_ids": await _resource_ids_async(db, "agent"),
+            # Every agent is reachable; ``is_super_admin`` stands in for the full id list.
+            "synced_agent_ids": [],
             "menus": [
                 {"menu_id": menu_id, "actions": ["view", "edit", "manage"]}
                 for menu_id in sorted(MENU_IDS)
@@ -612,91 +716,118 @@ async def summarize_permissions_async(db: AsyncSession, user: User) -> dict:
     }
 
 
-async def _resource_ids_async(db: AsyncSession, resource_type: str) -> list[str]:
-    cache_key = f"resource_ids:{resource_type}"
-    info = _session_info(db)
-    cached = info.get(cache_key)
-    if cached is not None:
-        return cached
+_RESOURCE_ID_COLUMNS = {"agent": Agent.id, "model": Model.id, "agent_group": AgentGroup.name}
+
+ActionMap = dict[tuple[str, str | None], set[str]]
+
 
+def _wildcard_actions(action_map: ActionMap, resource_type: str) -> set[str]:
+    """Actions ``action_map`` grants on every resource of ``resource_type``."""
+    actions = set(action_map.get((resource_type, None), ()))
     if resource_type == "agent":
-        rows = (await db.execute(select(Agent.id))).scalars().all()
-    elif resource_type == "model":
-        rows = (await db.execute(select(Model.id))).scalars().all()
-    elif resource_type == "agent_group":
-        rows = (await db.execute(select(AgentGroup.name))).scalars().all()
-    else:
-        rows = []
-    values = [str(item) for item in rows if item]
-    info[cache_key] = values
-    return values
+        actions.update(action_map.get(("agent_group", None), ()))
+    return actions
 
 
-async def _agent_group_map_async(db: AsyncSession) -> list[tuple[str, list[str]]]:
-    cache_key = "agent_group_map"
-    info = _session_info(db)
-    cached = info.get(cache_key)
-    if cached is not None:
-        return cached
+def _named_group_actions(action_map: ActionMap) -> dict[str, set[str]]:
+    return {
+        resource_id: actions
+        for (resource_type, resource_id), actions in action_map.items()
+        if resource_type == "agent_group" and resource_id is not None and actions
+    }
 
-    rows = (await db.execute(select(Agent.id, Agent.groups, Agent.group_name))).all()
-    result: list[tuple[str, list[str]]] = []
-    for agent_id, groups, group_name in rows:
-        normalized: list[str] = []
-        seen: set[str] = set()
-        for item in list(groups or []) + ([group_name] if group_name else []):
-            name = str(item or "").strip()
-            if not name or name in seen:
-                continue
-            seen.add(name)
-            normalized.append(name)
-        result.append((str(agent_id), normalized))
-    info[cache_key] = result
-    return result
+
+async def _agent_group_actions_async(
+    db: AsyncSession, action_map: ActionMap, agent_ids: Iterable[str]
+) -> dict[str, set[str]]:
+    """Actions each of ``agent_ids`` receives through the named agent_group grants in ``action_map``."""
+    group_actions = _named_group_actions(action_map)
+    agent_ids = list(agent_ids)
+    derived: dict[str, set[str]] = {}
+    if not group_actions or not agent_ids:
+        return derived
+    rows = await db.execute(
+        select(AgentGroupMember.agent_id, AgentGroupMember.group_name).where(
+            AgentGroupMember.agent_id.in_(agent_ids),
+            AgentGroupMember.group_name.in_(list(group_actions)),
+        )
+    )
+    for agent_id, group in rows:
+        derived.setdefault(str(agent_id), set()).update(group_actions[group])
+    return derived
 
 
-async def expand_resource_wildcards_async(
+async def covered_actions_async(
     db: AsyncSession,
-    action_map: dict[tuple[str, str | None], set[str]],
-) -> dict[tuple[str, str | None], set[str]]:
-    expanded: dict[tuple[str, str | None], set[str]] = {
-        key: set(actions) for key, actions in action_map.items()
-    }
-    for resource_type in ("agent", "model", "agent_group"):
-        wildcard_actions = expanded.pop((resource_type, None), None)
-        if not wildcard_actions:
-            continue
-        ids = await _resource_ids_async(db, resource_type)
-        if not ids:
-            expanded[(resource_type, None)] = set(wildcard_actions)
-            continue
-        for resource_id in ids:
-            expanded.setdefault((resource_type, resource_id), set()).update(wildcard_actions)
-    return expanded
+    action_map: ActionMap,
+    keys: Iterable[tuple[str, str | None]],
+) -> ActionMap:
+    """Actions ``action_map`` grants on each concrete key in ``keys`` through wildcard and
+    agent group entries, i.e. without an entry for that exact resource.
+
+    Costs one membership query for the agent keys, however large the catalog is.
+    """
+    keys = [key for key in keys if key[1] is not None]
+    derived = await _agent_group_actions_async(
+        db, action_map, (resource_id for resource_type, resource_id in keys if resource_type == "agent")
+    )
+    covered: ActionMap = {}
+    for resource_type, resource_id in keys:
+        actions = _wildcard_actions(action_map, resource_type)
+        if resource_type == "agent":
+            actions.update(derived.get(resource_id, ()))
+        if actions:
+            covered[(resource_type, resource_id)] = actions
+    return covered
 
 
-async def expand_agent_group_permissions_async(
+async def effective_resources_async(
     db: AsyncSession,
-    action_map: dict[tuple[str, str | None], set[str]],
-) -> dict[tuple[str, str | None], set[str]]:
-    group_actions: dict[str | None, set[str]] = {}
-    for (resource_type, resource_id), actions in action_map.items():
-        if resource_type == "agent_group":
-            group_actions[resource_id] = set(actions)
-
-    if not group_actions:
-        return {}
-
-    all_group_actions = group_actions.get(None, set())
-    derived: dict[tuple[str, str | None], set[str]] = {}
-    for agent_id, groups in await _agent_group_map_async(db):
-        actions_for_agent: set[str] = set(all_group_actions)
-        for group in groups:
-            if group in group_actions:
-                actions_for_agent.update(group_actions[group])
-        if actions_for_agent:
-            derived[("agent", agent_id)] = actions_for_agent
-    return derived
+    action_map: ActionMap,
+    resource_type: str,
+    *,
+    cursor: str | None = None,
+    limit: int = 100,
+) -> tuple[list[tuple[str, set[str]]], str | None]:
+    """One page of the concrete resources ``action_map`` reaches, ordered by id.
+
+    ``action_map`` is in the symbolic form the permission summaries use: wildcard keys carry a
+    ``None`` resource id and agent group grants are not folded into their members. Returns
+    ``(resource_id, actions)`` pairs and the cursor of the next page (the last id returned).
+    """
+    column = _RESOURCE_ID_COLUMNS[resource_type]
+    statement = select(column)
+    if not _wildcard_actions(action_map, resource_type):
+        direct_ids = [
+            resource_id
+            for (key_type, resource_id), actions in action_map.items()
+            if key_type == resource_type and resource_id is not None and actions
+        ]
+        clauses = [column.in_(direct_ids)] if direct_ids else []
+        group_names = list(_named_group_actions(action_map)) if resource_type == "agent" else []
+        if group_names:
+            clauses.append(
+                select(AgentGroupMember.agent_id)
+                .where(AgentGroupMember.agent_id == column, AgentGroupMember.group_name.in_(group_names))
+                .exists()
+            )
+        if not clauses:
+            return [], None
+        statement = statement.where(or_(*clauses))
+    if cursor:
+        statement = statement.where(column > cursor)
+    statement = statement.order_by(column.asc()).limit(limit + 1)
+
+    ids = [str(item) for item in (await db.execute(statement)).scalars().all()]
+    next_cursor = ids[limit - 1] if len(ids) > limit else None
+    ids = ids[:limit]
+    covered = await covered_actions_async(db, action_map, ((resource_type, item) for item in ids))
+    page = []
+    for resource_id in ids:
+        actions = set(action_map.get((resource_type, resource_id), ()))
+        actions.update(covered.get((resource_type, resource_id), ()))
+        page.append((resource_id, actions))
+    return page, next_cursor
 
 
 def _sorted_actions(actions: set[str]) -> list[str]:
@@ -378,6 +378,85 @@ class SyncTaskOut(BaseModel):
     finished_at: datetime | None = None
 
 
+class UpstreamPoolStats(BaseModel):
+    base_url: str
+    http2: bool = False
+    open: int = 0
+    idle: int = 0
+    active: int = 0
+    waiting: int = 0
+    max_connections: int = 0
+    max_keepalive_connections: int = 0
+
+
+class UpstreamWebSocketStats(BaseModel):
+    agent_id: str
+    open: int = 0
+
+
+class UpstreamBreakerStats(BaseModel):
+    base_url: str
+    state: str
+    window_calls: int = 0
+    window_failure_rate: float = 0.0
+    consecutive_failures: int = 0
+    total_calls: int = 0
+    total_failures: int = 0
+    rejected: int = 0
+    last_latency_ms: float = 0.0
+    last_error: str = ""
+    last_check_at: float | None = None
+    last_check_ok: bool | None = None
+    health_url: str = ""
+
+
+class UpstreamTargetItem(BaseModel):
+    base_url: str = Field(min_length=1, max_length=255)
+    weight: int = Field(default=1, ge=1, le=1000)
+    health_path: str = Field(default="", max_length=255)
+
+
+class AgentUpstreamTargets(BaseModel):
+    agent_id: str
+    targets: list[UpstreamTargetItem] = Field(default_factory=list)
+
+
+class AgentUpstreamTargetsUpdate(BaseModel):
+    targets: list[UpstreamTargetItem] = Field(default_factory=list, max_length=32)
+
+
+class UpstreamBalancerStats(BaseModel):
+    base_url: str
+    outstanding: int = 0
+    ewma_ms: float = 0.0
+    requests: int = 0
+    failovers: int = 0
+
+
+class ChatAccessBucket(BaseModel):
+    bucket_start: datetime
+    requests: int = 0
+    errors: int = 0
+    users: int = 0
+    bytes_sent: int = 0
+    avg_duration_ms: float = 0.0
+    max_duration_ms: int = 0
+
+
+class ChatAccessLogOut(BaseModel):
+    id: int
+    occurred_at: datetime
+    user_id: int | None = None
+    agent_id: str = ""
+    proxy_id: str = ""
+    transport: str = ""
+    method: str = ""
+    path: str = ""
+    status_code: int = 0
+    bytes_sent: int = 0
+    duration_ms: int = 0
+
+
 class ModuleSummary(BaseModel):
     id: str
     title: str
@@ -387,6 +466,23 @@ class ModuleSummary(BaseModel):
     description: str
 
 
+class UsageBucket(BaseModel):
+    bucket_start: datetime
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+
+class UsageRanking(BaseModel):
+    key: str
+    name: str = ""
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+
 class AgentSummary(BaseModel):
     id: str
     name: str
@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+_REDIS_POLL_SECONDS = 0.05
+_BUCKET_SWEEP_SECONDS = 60.0
+
+
+@dataclass(frozen=True, slots=True)
+class AdmissionScope:
+    """One limit dimension (user, agent or upstream); zero rate/in-flight disables that half."""
+
+    name: str
+    key: str
+    rate: float = 0.0
+    burst: int = 0
+    max_in_flight: int = 0
+    # Status returned when this scope rejects: 429 for caller-side limits, 503 for shared capacity.
+    status_code: int = 429
+
+    @property
+    def limited(self) -> bool:
+        return self.rate > 0 or self.max_in_flight > 0
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, scope: AdmissionScope, retry_after: float, reason: str) -> None:
+        super().__init__(f"{scope.name} {reason}")
+        self.scope = scope
+        self.retry_after = max(1, int(retry_after + 0.999))
+        self.reason = reason
+
+    @property
+    def status_code(self) -> int:
+        return self.scope.status_code
+
+
+class MemoryAdmissionBackend:
+    """Per-process token buckets and in-flight counters.
+
+    A bucket that has refilled to capacity is indistinguishable from a missing one, so buckets are
+    dropped once full (swept every ``sweep_interval`` seconds), like the Redis keys' EXPIRE.
+    """
+
+    def __init__(self, *, sweep_interval: float = _BUCKET_SWEEP_SECONDS) -> None:
+        # key -> (tokens, updated, monotonic time at which the bucket is full again)
+        self._buckets: dict[str, tuple[float, float, float]] = {}
+        self._sweep_interval = max(0.0, sweep_interval)
+        self._next_sweep = time.monotonic() + self._sweep_interval
+        self._in_flight: dict[str, int] = {}
+        self._waiters: set[asyncio.Future] = set()
+        self._lock = threading.Lock()
+
+    async def take_tokens(self, scopes: list[AdmissionScope]) -> tuple[AdmissionScope | None, float]:
+        """Take one token from every rated scope, or none; returns the blocking scope and its wait."""
+        now = time.monotonic()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            refilled: list[tuple[AdmissionScope, float, float]] = []
+            for scope in scopes:
+                if scope.rate <= 0:
+                    continue
+                capacity = float(max(1, scope.burst))
+                tokens, updated, _ = self._buckets.get(scope.key, (capacity, now, now))
+                tokens = min(capacity, tokens + (now - updated) * scope.rate)
+                if tokens < 1.0:
+                    self._buckets[scope.key] = (tokens, now, now + (capacity - tokens) / scope.rate)
+                    return scope, (1.0 - tokens) / scope.rate
+                refilled.append((scope, tokens, capacity))
+            for scope, tokens, capacity in refilled:
+                tokens -= 1.0
+                self._buckets[scope.key] = (tokens, now, now + (capacity - tokens) / scope.rate)
+        return None, 0.0
+
+    def _sweep(self, now: float) -> None:
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+        self._next_sweep = now + self._sweep_interval
+
+    async def try_acquire(self, scopes: list[AdmissionScope]) -> AdmissionScope | None:
+        with self._lock:
+            for scope in scopes:
+                if scope.max_in_flight > 0 and self._in_flight.get(scope.key, 0) >= scope.max_in_flight:
+                    return scope
+            for scope in scopes:
+                if scope.max_in_flight > 0:
+                    self._in_flight[scope.key] = self._in_flight.get(scope.key, 0) + 1
+        return None
+
+    def release(self, scopes: list[AdmissionScope]) -> None:
+        with self._lock:
+            for scope in scopes:
+                if scope.max_in_flight <= 0:
+                    continue
+                remaining = self._in_flight.get(scope.key, 0) - 1
+                if remaining > 0:
+                    self._in_flight[scope.key] = remaining
+                else:
+                    self._in_flight.pop(scope.key, None)
+            waiters, self._waiters = self._waiters, set()
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.get_loop().call_soon_threadsafe(_resolve_waiter, waiter)
+
+    async def wait_for_release(self, timeout: float) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        with self._lock:
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters.discard(waiter)
+
+    def in_flight(self, key: str) -> int:
+        return self._in_flight.get(key, 0)
+
+
+def _resolve_waiter(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+# KEYS: bucket keys; ARGV: now, then (rate, burst) per key. Returns "<index>:<wait>" or "0".
+_TAKE_TOKENS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local state = {}
+for i, key in ipairs(KEYS) do
+  local rate = tonumber(ARGV[i * 2])
+  local capacity = math.max(1, tonumber(ARGV[i * 2 + 1]))
+  local stored = redis.call('HMGET', key, 'tokens', 'updated')
+  local tokens = tonumber(stored[1]) or capacity
+  local updated = tonumber(stored[2]) or now
+  tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+  if tokens < 1 then
+    return i .. ':' .. tostring((1 - tokens) / rate)
+  end
+  state[i] = {tokens, math.ceil(capacity / rate) + 1}
+end
+for i, key in ipairs(KEYS) do
+  redis.call('HSET', key, 'tokens', state[i][1] - 1, 'updated', now)
+  redis.call('EXPIRE', key, state[i][2])
+end
+return '0'
+"""
+
+# KEYS: in-flight keys; ARGV: lease seconds, then the limit per key. Returns the blocking index or 0.
+_ACQUIRE_SCRIPT = """
+for i, key in ipairs(KEYS) do
+  if (tonumber(redis.call('GET', key)) or 0) >= tonumber(ARGV[i + 1]) then
+    return i
+  end
+end
+for _, key in ipairs(KEYS) do
+  redis.call('INCR', key)
+  redis.call('EXPIRE', key, ARGV[1])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+for _, key in ipairs(KEYS) do
+  if redis.call('DECR', key) <= 0 then
+    redis.call('DEL', key)
+  end
+end
+return 0
+"""
+
+
+class RedisAdmissionBackend:
+    """Token buckets and in-flight counters shared by all workers through Redis.
+
+    In-flight keys carry a lease TTL so a crashed worker cannot pin a slot forever. Redis errors
+    admit the request: a limiter outage must not take the chat proxy down with it.
+    """
+
+    def __init__(self, url: str, *, prefix: str, lease_seconds: int) -> None:
+        from redis.asyncio import Redis
+
+        self._redis = Redis.from_url(url)
+        self._prefix = prefix
+        self._lease_seconds = max(1, lease_seconds)
+        self._take = self._redis.register_script(_TAKE_TOKENS_SCRIPT)
+        self._acquire = self._redis.register_script(_ACQUIRE_SCRIPT)
+        self._release = self._redis.register_script(_RELEASE_SCRIPT)
+        self._pending: set[asyncio.Task] = set()
+
+    def _key(self, kind: str, scope: AdmissionScope) -> str:
+        return f"{self._prefix}:{kind}:{scope.key}"
+
+    async def take_tokens(self, scopes: list[AdmissionScope]) -> tuple[AdmissionScope | None, float]:
+        rated = [scope for scope in scopes if scope.rate > 0]
+        if not rated:
+            return None, 0.0
+        args: list[float] = [time.time()]
+        for scope in rated:
+            args.extend((scope.rate, max(1, scope.burst)))
+        try:
+            result = await self._take(keys=[self._key("rate", scope) for scope in rated], args=args)
+        except Exception:
+            logger.warning("admission.redis_unavailable op=take_tokens", exc_info=True)
+            return None, 0.0
+        if isinstance(result, bytes):
+            result = result.decode()
+        if result == "0":
+            return None, 0.0
+        index, _, wait = str(result).partition(":")
+        return rated[int(index) - 1], float(wait)
+
+    async def try_acquire(self, scopes: list[AdmissionScope]) -> AdmissionScope | None:
+        capped = [scope for scope in scopes if scope.max_in_flight > 0]
+        if not capped:
+            return None
+        try:
+            result = await self._acquire(
+                keys=[self._key("inflight", scope) for scope in capped],
+                args=[self._lease_seconds, *(scope.max_in_flight for scope in capped)],
+            )
+        except Exception:
+            logger.warning("admission.redis_unavailable op=acquire", exc_info=True)
+            return None
+        return capped[int(result) - 1] if int(result) else None
+
+    def release(self, scopes: list[AdmissionScope]) -> None:
+        capped = [scope for scope in scopes if scope.max_in_flight > 0]
+        if not capped:
+            return
+        # Called from response teardown, which may already be cancelled; release in the background.
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Garbage-collected permit outside the loop: the lease TTL frees the slot.
+            return
+        task = loop.create_task(self._release_now(capped))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _release_now(self, scopes: list[AdmissionScope]) -> None:
+        try:
+            await self._release(keys=[self._key("inflight", scope) for scope in scopes])
+        except Exception:
+            logger.warning("admission.redis_unavailable op=release", exc_info=True)
+
+    async def wait_for_release(self, timeout: float) -> None:
+        await asyncio.sleep(min(timeout, _REDIS_POLL_SECONDS))
+
+    async def close(self) -> None:
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        await self._redis.aclose()
+
+
+class AdmissionPermit:
+    def __init__(self, backend, scopes: list[AdmissionScope]) -> None:
+        self._backend = backend
+        self._scopes = scopes
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._backend.release(self._scopes)
+
+
+class AdmissionController:
+    """In-flight caps first, then rate limits; both may wait up to ``max_wait`` before rejecting.
+
+    Tokens are only taken once a slot is held, so requests turned away while the upstream is
+    saturated do not drain the rate budget for the ones that follow.
+    """
+
+    def __init__(self, backend, *, max_wait: float) -> None:
+        self.backend = backend
+        self._max_wait = max(0.0, max_wait)
+
+    async def admit(self, scopes: list[AdmissionScope]) -> AdmissionPermit:
+        scopes = [scope for scope in scopes if scope.limited]
+        deadline = time.monotonic() + self._max_wait
+        while True:
+            blocking = await self.backend.try_acquire(scopes)
+            if blocking is None:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AdmissionRejected(blocking, max(1.0, self._max_wait), "too many requests in flight")
+            await self.backend.wait_for_release(remaining)
+        permit = AdmissionPermit(self.backend, scopes)
+        try:
+            while True:
+                blocking, wait = await self.backend.take_tokens(scopes)
+                if blocking is None:
+                    return permit
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    raise AdmissionRejected(blocking, wait, "rate limit exceeded")
+                await asyncio.sleep(wait)
+        except BaseException:
+            permit.release()
+            raise
+
+
+def chat_admission_scopes(user_id: int, agent_key: str, upstream_key: str) -> list[AdmissionScope]:
+    return [
+        AdmissionScope(
+            name="user",
+            key=f"user:{user_id}",
+            rate=settings.CHAT_PROXY_USER_RATE,
+            burst=settings.CHAT_PROXY_USER_BURST,
+            max_in_flight=settings.CHAT_PROXY_USER_MAX_IN_FLIGHT,
+            status_code=429,
+        ),
+        AdmissionScope(
+            name="agent",
+            key=f"agent:{agent_key}",
+            rate=settings.CHAT_PROXY_AGENT_RATE,
+            burst=settings.CHAT_PROXY_AGENT_BURST,
+            max_in_flight=settings.CHAT_PROXY_AGENT_MAX_IN_FLIGHT,
+            status_code=503,
+        ),
+        AdmissionScope(
+            name="upstream",
+            key=f"upstream:{upstream_key}",
+            rate=settings.CHAT_PROXY_UPSTREAM_RATE,
+            burst=settings.CHAT_PROXY_UPSTREAM_BURST,
+            max_in_flight=settings.CHAT_PROXY_UPSTREAM_MAX_IN_FLIGHT,
+            status_code=503,
+        ),
+    ]
+
+
+_controller: AdmissionController | None = None
+
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        backend = None
+        if settings.CHAT_PROXY_ADMISSION_BACKEND == "redis":
+            try:
+                backend = RedisAdmissionBackend(
+                    settings.CHAT_PROXY_ADMISSION_REDIS_URL,
+                    prefix="agent-ui:admission",
+                    lease_seconds=settings.CHAT_PROXY_ADMISSION_LEASE_SECONDS,
+                )
+            except ImportError:
+                logger.warning("admission.redis_missing falling back to in-memory limits")
+        _controller = AdmissionController(
+            backend or MemoryAdmissionBackend(),
+            max_wait=settings.CHAT_PROXY_ADMISSION_MAX_WAIT,
+        )
+    return _controller
+
+
+async def close_admission_controller() -> None:
+    global _controller
+    if _controller is not None and isinstance(_controller.backend, RedisAdmissionBackend):
+        await _controller.backend.close()
+    _controller = None
+
+
+__all__ = [
+    "AdmissionController",
+    "AdmissionPermit",
+    "AdmissionRejected",
+    "AdmissionScope",
+    "MemoryAdmissionBackend",
+    "RedisAdmissionBackend",
+    "chat_admission_scopes",
+    "close_admission_controller",
+    "get_admission_controller",
+]
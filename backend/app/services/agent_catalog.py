@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import base64
+import json
+from collections.abc import Iterable
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..permissions import (
+    actions_implying,
+    get_user_access_async,
+    get_user_role_names_async,
+    grant_subject_filter,
+    is_super_admin,
+)
+from ..permissions.engine import ACTION_BITS
+
+# Columns each AgentSummary field is computed from (see serializers.agent_summary).
+AGENT_SUMMARY_COLUMNS: dict[str, tuple[str, ...]] = {
+    "id": ("id",),
+    "name": ("name",),
+    "status": ("status",),
+    "owner": ("owner",),
+    "last_run": ("last_run",),
+    "description": ("description",),
+    "url": ("url",),
+    "groups": ("groups", "group_name"),
+    "editable": (),
+    "source_type": ("source_type",),
+    "status_editable_only": ("is_synced",),
+    "sync_task_status": (),
+    "can_sync_users": ("is_synced", "sync_config_id", "external_id"),
+}
+# Stand-ins for columns a sparse listing did not load; they never reach the response.
+_COLUMN_DEFAULTS = {
+    "id": "",
+    "name": "",
+    "status": "",
+    "owner": "",
+    "last_run": "",
+    "description": "",
+    "url": "",
+    "groups": [],
+    "group_name": "",
+    "source_type": "",
+    "is_synced": False,
+    "sync_config_id": None,
+    "external_id": None,
+}
+
+
+async def visible_agents_filter(db: AsyncSession, user: models.User, *, action: str = "view"):
+    """SQL condition selecting the agents ``user`` may ``action``, or None when that is every agent.
+
+    Mirrors the RBAC engine: direct agent grants, agent_group grants through group membership and,
+    for ``view``, synced agents reachable through the user's bound chat users.
+    """
+    if is_super_admin(user):
+        return None
+    required = ACTION_BITS.get(action, 0)
+    access = await get_user_access_async(db, user)
+    if (access.get(("resource", "agent", None), 0) | access.get(("resource", "agent_group", None), 0)) & required:
+        return None
+
+    role_names = await get_user_role_names_async(db, user)
+    agent = models.Agent
+    grant = models.PermissionGrant
+    members = models.AgentGroupMember
+    granted = select(grant.resource_id).where(
+        grant_subject_filter(user, role_names),
+        grant.scope == "resource",
+        grant.action.in_(actions_implying(action)),
+    )
+    # Correlated probes rather than IN lists, so a keyset page can walk ix_agents_created_at_id
+    # and stop after ``limit`` visible rows instead of collecting and sorting every visible agent.
+    clauses = [
+        granted.where(grant.resource_type == "agent", grant.resource_id == agent.id).exists(),
+        select(members.agent_id)
+        .where(
+            members.agent_id == agent.id,
+            members.group_name.in_(
+                granted.where(grant.resource_type == "agent_group", grant.resource_id.is_not(None))
+            ),
+        )
+        .exists(),
+    ]
+    if action == "view":
+        from .chat_user_sync import authorized_chat_access_query
+
+        # Test is_synced on the outer row: joining agents inside the probe would make it a FROM of
+        # its own, leaving the EXISTS uncorrelated and true for every agent.
+        clauses.append(
+            and_(
+                agent.is_synced.is_(True),
+                authorized_chat_access_query(user.id)
+                .where(models.AgentChatUserAccess.agent_id == agent.id)
+                .exists(),
+            )
+        )
+    return or_(*clauses)
+
+
+def encode_agent_cursor(created_at: datetime | str, agent_id: str) -> str:
+    value = created_at.isoformat() if isinstance(created_at, datetime) else str(created_at)
+    raw = json.dumps([value, agent_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_agent_cursor(cursor: str) -> tuple[datetime, str]:
+    """Inverse of ``encode_agent_cursor``; raises ValueError for anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, agent_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(agent_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def _after_cursor(cursor: str):
+    created_at, agent_id = decode_agent_cursor(cursor)
+    agent = models.Agent
+    # Compare against the stored timestamp so driver-side datetime formatting cannot skip or repeat
+    # rows; the decoded value only matters if the cursor's agent has been deleted since.
+    anchor = func.coalesce(
+        select(agent.created_at).where(agent.id == agent_id).scalar_subquery(), created_at
+    )
+    return or_(agent.created_at < anchor, and_(agent.created_at == anchor, agent.id < agent_id))
+
+
+def _search_clause(search: str):
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    pattern = f"%{escaped}%"
+    return or_(
+        models.Agent.name.ilike(pattern, escape="\\"),
+        models.Agent.description.ilike(pattern, escape="\\"),
+    )
+
+
+async def list_agent_rows(
+    db: AsyncSession,
+    user: models.User,
+    *,
+    fields: Iterable[str],
+    search: str = "",
+    cursor: str | None = None,
+    limit: int | None = None,
+) -> tuple[list[SimpleNamespace], str | None]:
+    """Visible agents, newest first, loading only the columns ``fields`` need.
+
+    Returns the rows (attribute access like an Agent, unloaded columns defaulted) and the cursor
+    of the next page, if any.
+    """
+    agent = models.Agent
+    names = {"id", "created_at"}
+    for field in fields:
+        names.update(AGENT_SUMMARY_COLUMNS[field])
+    statement = select(*(getattr(agent, name) for name in sorted(names)))
+
+    visibility = await visible_agents_filter(db, user)
+    if visibility is not None:
+        statement = statement.where(visibility)
+    if search:
+        statement = statement.where(_search_clause(search))
+    if cursor:
+        statement = statement.where(_after_cursor(cursor))
+    statement = statement.order_by(agent.created_at.desc(), agent.id.desc())
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+
+    rows = (await db.execute(statement)).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_agent_cursor(rows[-1].created_at, rows[-1].id)
+    return [SimpleNamespace(**{**_COLUMN_DEFAULTS, **row._mapping}) for row in rows], next_cursor
+
+
+__all__ = [
+    "AGENT_SUMMARY_COLUMNS",
+    "decode_agent_cursor",
+    "encode_agent_cursor",
+    "list_agent_rows",
+    "visible_agents_filter",
+]
@@ -11,6 +11,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from .. import models
 from ..db import AsyncSessionLocal
 from ..services.chat_user_sync import create_agent_chat_user_sync_task
+from ..services.metrics import observe_sync_task
+from ..services.proxy_routes import invalidate_proxy_routes
 from ..tasks.chat_user_sync import enqueue_agent_chat_user_sync
 from ..api.admin_modules.common import (
     compact_fit2cloud_source_payload,
@@ -61,6 +63,7 @@ async def _mark_task_failed(db: AsyncSession, task: models.SyncTask, detail: str
     task.finished_at = _now()
     task.updated_at = _now()
     await db.commit()
+    observe_sync_task(task)
 
 
 async def _ensure_agent_group(db: AsyncSession, group_name: str) -> None:
@@ -217,6 +220,7 @@ async def run_fit2cloud_agent_sync_task(task_id: str) -> None:
             task.message = f"智能体已{ '新增' if result == 'imported' else '更新' }"
             task.updated_at = _now()
             await db.commit()
+            invalidate_proxy_routes(agent.proxy_id)
 
             if bool((task.payload or {}).get("sync_chat_users")):
                 chat_task = await create_agent_chat_user_sync_task(
@@ -246,5 +250,6 @@ async def run_fit2cloud_agent_sync_task(task_id: str) -> None:
             task.finished_at = _now()
             task.updated_at = _now()
             await db.commit()
+            observe_sync_task(task)
         except Exception as exc:  # pragma: no cover - task failure path
             await _mark_task_failed(db, task, str(exc))
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Mapping
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from uuid import uuid4
+
+import anyio
+from anyio import AsyncFile
+
+from ..config import settings
+
+STATIC_ASSET_EXTENSIONS = frozenset(
+    {
+        ".avif",
+        ".css",
+        ".eot",
+        ".gif",
+        ".ico",
+        ".jpeg",
+        ".jpg",
+        ".js",
+        ".map",
+        ".mjs",
+        ".otf",
+        ".png",
+        ".svg",
+        ".ttf",
+        ".wasm",
+        ".webp",
+        ".woff",
+        ".woff2",
+    }
+)
+_UNCACHEABLE_DIRECTIVES = {"no-store", "no-cache", "private"}
+
+
+def asset_cache_key(base_url: str, path: str, query: str, variant: str = "") -> str:
+    return f"{base_url.rstrip('/')}|{path}|{query}|{variant}"
+
+
+def is_cacheable_asset_request(method: str, path: str, headers: Mapping[str, str]) -> bool:
+    """Only plain GETs for static files are shared; API routes never enter the cache."""
+    if method.upper() != "GET" or "range" in headers:
+        return False
+    segments = [item for item in path.split("/") if item]
+    if not segments or "api" in segments:
+        return False
+    return os.path.splitext(segments[-1])[1].lower() in STATIC_ASSET_EXTENSIONS
+
+
+def _cache_control(headers: Mapping[str, str]) -> dict[str, str]:
+    directives: dict[str, str] = {}
+    for item in (headers.get("cache-control") or "").split(","):
+        name, _, value = item.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip().strip('"')
+    return directives
+
+
+def freshness_lifetime(headers: Mapping[str, str]) -> float | None:
+    """Seconds a response may be served without revalidation, or None when it must not be stored."""
+    if "set-cookie" in headers:
+        return None
+    vary = (headers.get("vary") or "").lower()
+    if vary and any(item.strip() not in {"", "accept-encoding"} for item in vary.split(",")):
+        return None
+    directives = _cache_control(headers)
+    if _UNCACHEABLE_DIRECTIVES & directives.keys():
+        return None
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                return max(0.0, float(directives[name]))
+            except ValueError:
+                return None
+    if headers.get("expires"):
+        try:
+            expires = parsedate_to_datetime(headers["expires"]).timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+        return max(0.0, expires - time.time())
+    if headers.get("etag") or headers.get("last-modified"):
+        # Storable, but every reuse is revalidated upstream.
+        return 0.0
+    return None
+
+
+@dataclass(frozen=True, slots=True)
+class CachedAsset:
+    key: str
+    path: Path
+    size: int
+    headers: tuple[tuple[str, str], ...]
+    etag: str
+    last_modified: str
+    expires_at: float
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.expires_at
+
+    def header_dict(self) -> dict[str, str]:
+        return dict(self.headers)
+
+    def validators(self) -> dict[str, str]:
+        validators: dict[str, str] = {}
+        if self.etag:
+            validators["if-none-match"] = self.etag
+        if self.last_modified:
+            validators["if-modified-since"] = self.last_modified
+        return validators
+
+    def matches_conditional(self, headers: Mapping[str, str]) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            if not self.etag:
+                return False
+            wanted = {item.strip().removeprefix("W/") for item in if_none_match.split(",")}
+            return "*" in wanted or self.etag.removeprefix("W/") in wanted
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since and self.last_modified:
+            try:
+                return parsedate_to_datetime(self.last_modified) <= parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class AssetCache:
+    """Disk-backed, size-bounded LRU of static upstream responses shared by all users.
+
+    The index lives in memory, so each process keeps its own directory and starts empty.
+    """
+
+    def __init__(self, *, directory: str, max_bytes: int, max_entry_bytes: int) -> None:
+        self._max_bytes = max(0, max_bytes)
+        self._max_entry_bytes = max(0, min(max_entry_bytes, self._max_bytes))
+        self._directory = Path(directory) / str(os.getpid())
+        self._entries: OrderedDict[str, CachedAsset] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._prepared = False
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entry_bytes > 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _prepare(self) -> None:
+        if self._prepared:
+            return
+        shutil.rmtree(self._directory, ignore_errors=True)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._prepared = True
+
+    def lookup(self, key: str) -> CachedAsset | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    async def open(self, entry: CachedAsset) -> AsyncFile[bytes] | None:
+        # Opening before the response starts keeps the body readable even if it is evicted meanwhile.
+        try:
+            return await anyio.open_file(entry.path, "rb")
+        except OSError:
+            await anyio.to_thread.run_sync(self.discard, entry.key)
+            return None
+
+    def revalidated(self, key: str, response_headers: Mapping[str, str]) -> CachedAsset | None:
+        lifetime = freshness_lifetime(response_headers)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if lifetime is None:
+                lifetime = 0.0
+            headers = entry.header_dict()
+            for name in ("cache-control", "expires", "etag", "last-modified"):
+                if response_headers.get(name):
+                    headers[name] = response_headers[name]
+            entry = replace(
+                entry,
+                headers=tuple(headers.items()),
+                etag=headers.get("etag", ""),
+                last_modified=headers.get("last-modified", ""),
+                expires_at=time.monotonic() + lifetime,
+            )
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            return entry
+
+    async def tee(
+        self,
+        key: str,
+        headers: Mapping[str, str],
+        lifetime: float,
+        body: AsyncIterator[bytes],
+    ) -> AsyncIterator[bytes]:
+        """Yield ``body`` unchanged while writing it to disk; the entry is kept only if it completes.
+
+        File operations run in worker threads so a slow disk never stalls the event loop.
+        """
+        await anyio.to_thread.run_sync(self._prepare)
+        temp_path = self._directory / f".{uuid4().hex}.part"
+        handle: AsyncFile[bytes] | None = await anyio.open_file(temp_path, "wb")
+        written = 0
+        completed = False
+        try:
+            async for chunk in body:
+                if handle is not None:
+                    written += len(chunk)
+                    if written > self._max_entry_bytes:
+                        await handle.aclose()
+                        handle = None
+                        await anyio.to_thread.run_sync(_remove, temp_path)
+                    else:
+                        await handle.write(chunk)
+                yield chunk
+            completed = True
+        finally:
+            if handle is not None:
+                # Shielded so a client disconnect cannot leave the part file behind.
+                with anyio.CancelScope(shield=True):
+                    await handle.aclose()
+                    if completed:
+                        await anyio.to_thread.run_sync(self._commit, key, temp_path, written, headers, lifetime)
+                    else:
+                        await anyio.to_thread.run_sync(_remove, temp_path)
+
+    def _commit(
+        self,
+        key: str,
+        temp_path: Path,
+        size: int,
+        headers: Mapping[str, str],
+        lifetime: float,
+    ) -> None:
+        final_path = self._directory / hashlib.sha256(key.encode("utf-8")).hexdigest()
+        stored_headers = {name.lower(): value for name, value in headers.items()}
+        entry = CachedAsset(
+            key=key,
+            path=final_path,
+            size=size,
+            headers=tuple(stored_headers.items()),
+            etag=stored_headers.get("etag", ""),
+            last_modified=stored_headers.get("last-modified", ""),
+            expires_at=time.monotonic() + lifetime,
+        )
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.size
+            os.replace(temp_path, final_path)
+            self._entries[key] = entry
+            self._total_bytes += size
+            while self._total_bytes > self._max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size
+                if evicted.path != final_path:
+                    evicted.path.unlink(missing_ok=True)
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self._total_bytes -= entry.size
+        _remove(entry.path)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+            if self._prepared:
+                shutil.rmtree(self._directory, ignore_errors=True)
+                self._prepared = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _remove(path: Path) -> None:
+    path.unlink(missing_ok=True)
+
+
+_asset_cache: AssetCache | None = None
+
+
+def get_asset_cache() -> AssetCache | None:
+    global _asset_cache
+    if not settings.CHAT_PROXY_ASSET_CACHE_ENABLED:
+        return None
+    if _asset_cache is None:
+        _asset_cache = AssetCache(
+            directory=settings.CHAT_PROXY_ASSET_CACHE_DIR,
+            max_bytes=settings.CHAT_PROXY_ASSET_CACHE_MAX_BYTES,
+            max_entry_bytes=settings.CHAT_PROXY_ASSET_CACHE_MAX_ENTRY_BYTES,
+        )
+    return _asset_cache
+
+
+async def close_asset_cache() -> None:
+    global _asset_cache
+    if _asset_cache is not None:
+        cache, _asset_cache = _asset_cache, None
+        await anyio.to_thread.run_sync(cache.clear)
+
+
+__all__ = [
+    "AssetCache",
+    "CachedAsset",
+    "asset_cache_key",
+    "close_asset_cache",
+    "freshness_lifetime",
+    "get_asset_cache",
+    "is_cacheable_asset_request",
+]
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections.abc import Callable, Iterable
+from itertools import chain
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+
+from .. import models
+from ..config import settings
+from ..db import async_engine
+
+logger = logging.getLogger(__name__)
+
+_PENDING_INFO_KEY = "cache_epochs_pending"
+_TABLE = models.CacheEpoch.__table__
+# A missing cache_epochs table (migrations not run yet) is rechecked after this many seconds.
+_TABLE_RECHECK_SECONDS = 30.0
+
+# name -> (tables whose writes invalidate it, callbacks run when another process wrote one of them)
+_tracked: dict[str, tuple[frozenset[str], list[Callable[[], None]]]] = {}
+_tracked_lock = threading.Lock()
+_watched_tables: frozenset[str] = frozenset()
+# Engine -> (table exists, monotonic time of the check).
+_table_ready: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def track_cache_epoch(name: str, tables: Iterable[str], on_change: Callable[[], None]) -> None:
+    """Share invalidation of a process-local cache through the ``cache_epochs`` table.
+
+    ``cache_epochs`` holds one counter per source table. Every commit that writes one of ``tables``
+    increments that table's counter in the same transaction, whichever process (API worker, Celery
+    worker, CLI) made it. The watcher started with the app polls the counters and calls
+    ``on_change`` when one of ``tables`` moved, so cached state is stale for at most
+    ``CACHE_EPOCH_POLL_INTERVAL`` seconds instead of the cache's own TTL.
+    """
+    global _watched_tables
+    with _tracked_lock:
+        existing = _tracked.get(name)
+        callbacks = existing[1] if existing else []
+        callbacks.append(on_change)
+        _tracked[name] = (frozenset(tables) | (existing[0] if existing else frozenset()), callbacks)
+        _watched_tables = frozenset().union(*(watched for watched, _ in _tracked.values()))
+
+
+def mark_cache_epoch(session: Session, *tables: str) -> None:
+    """Bump the counters of ``tables`` when ``session`` commits, e.g. after a raw SQL write."""
+    session.info.setdefault(_PENDING_INFO_KEY, set()).update(tables)
+
+
+def _mark_tables(session: Session, tables: Iterable[str | None]) -> None:
+    written = _watched_tables.intersection(tables)
+    if written:
+        mark_cache_epoch(session, *written)
+
+
+def _epoch_table_exists(session: Session) -> bool:
+    connection = session.connection()
+    engine = connection.engine
+    now = time.monotonic()
+    ready, checked_at = _table_ready.get(engine, (False, None))
+    if not ready and (checked_at is None or now - checked_at >= _TABLE_RECHECK_SECONDS):
+        ready = inspect(connection).has_table(_TABLE.name)
+        _table_ready[engine] = (ready, now)
+    return ready
+
+
+def _bump_statement(dialect: str):
+    """INSERT .. ON CONFLICT that creates a missing counter, so no process depends on seeded rows."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Cache epochs are not supported on {dialect}")
+    stmt = insert(_TABLE)
+    return stmt.on_conflict_do_update(index_elements=["name"], set_={"value": _TABLE.c.value + 1})
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context) -> None:
+    # Dirty objects whose attributes were set back to the loaded values were not written.
+    dirty = (obj for obj in session.dirty if session.is_modified(obj, include_collections=False))
+    _mark_tables(
+        session,
+        (getattr(obj, "__tablename__", None) for obj in chain(session.new, dirty, session.deleted)),
+    )
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_write(orm_execute_state) -> None:
+    if orm_execute_state.is_select:
+        return
+    _mark_tables(
+        orm_execute_state.session,
+        (mapper.local_table.name for mapper in orm_execute_state.all_mappers),
+    )
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_on_commit(session: Session) -> None:
+    # Pending objects are flushed after this hook runs; flush now so their writes are tracked.
+    session.flush()
+    tables = session.info.pop(_PENDING_INFO_KEY, None)
+    if not tables or not _epoch_table_exists(session):
+        return
+    connection = session.connection()
+    # Sorted so two transactions bumping the same counters lock them in the same order.
+    connection.execute(
+        _bump_statement(connection.dialect.name),
+        [{"name": table, "value": 1} for table in sorted(tables)],
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_on_rollback(session: Session) -> None:
+    session.info.pop(_PENDING_INFO_KEY, None)
+
+
+class CacheEpochWatcher:
+    """Polls ``cache_epochs`` and runs the callbacks of every cache whose tables were written."""
+
+    def __init__(self, *, interval: float, engine: AsyncEngine | None = None) -> None:
+        self._interval = max(0.0, interval)
+        self._engine = engine or async_engine
+        self._seen: dict[str, int] | None = None
+
+    async def poll(self) -> list[str]:
+        """Run the callbacks of caches whose tables were written since the last poll; returns their
+        names. The first poll only records the counters."""
+        async with self._engine.connect() as conn:
+            rows = (await conn.execute(select(_TABLE.c.name, _TABLE.c.value))).all()
+        written: set[str] = set()
+        first = self._seen is None
+        seen = self._seen or {}
+        for table, value in rows:
+            if not first and seen.get(table) != value:
+                written.add(table)
+            seen[table] = value
+        self._seen = seen
+        changed = [name for name, (tables, _) in list(_tracked.items()) if tables & written]
+        for name in changed:
+            for callback in _tracked[name][1]:
+                callback()
+        return changed
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                logger.warning("cache_epochs.poll_failed", exc_info=True)
+            await asyncio.sleep(self._interval)
+
+
+def start_cache_epoch_watcher() -> asyncio.Task | None:
+    if settings.CACHE_EPOCH_POLL_INTERVAL <= 0:
+        return None
+    watcher = CacheEpochWatcher(interval=settings.CACHE_EPOCH_POLL_INTERVAL)
+    return asyncio.create_task(watcher.run(), name="cache-epoch-watcher")
+
+
+async def stop_cache_epoch_watcher(task: asyncio.Task | None) -> None:
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+__all__ = [
+    "CacheEpochWatcher",
+    "mark_cache_epoch",
+    "start_cache_epoch_watcher",
+    "stop_cache_epoch_watcher",
+    "track_cache_epoch",
+]
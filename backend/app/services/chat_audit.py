@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from datetime import UTC, datetime, timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import case, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..config import settings
+from ..db import async_engine
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SIZES = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+_SQLITE_BUCKET_FORMATS = {
+    "minute": "%Y-%m-%d %H:%M:00",
+    "hour": "%Y-%m-%d %H:00:00",
+    "day": "%Y-%m-%d 00:00:00",
+}
+_COLUMNS = (
+    "occurred_at",
+    "user_id",
+    "agent_id",
+    "proxy_id",
+    "transport",
+    "method",
+    "path",
+    "status_code",
+    "bytes_sent",
+    "duration_ms",
+)
+_PATH_MAX_LENGTH = 512
+
+_DROPPED = REGISTRY.counter(
+    "agent_ui_chat_audit_dropped_total",
+    "Chat access records dropped because the buffer was full or a flush failed.",
+    ("reason",),
+)
+_DROPPED_OVERFLOW = _DROPPED.labels("overflow")
+_DROPPED_FLUSH_ERROR = _DROPPED.labels("flush_error")
+_WRITTEN = REGISTRY.counter(
+    "agent_ui_chat_audit_written_total",
+    "Chat access records written to chat_access_logs.",
+)
+
+
+class ChatAuditLog:
+    """Bounded in-memory buffer of chat access records, bulk-inserted by a background flusher.
+
+    ``record`` only appends a tuple, so the proxy never waits on the database. When the buffer is
+    full the oldest record is overwritten and counted as dropped. A batch that fails to insert is
+    put back at the front of the buffer for the next flush, as far as there is room for it.
+    """
+
+    def __init__(self, *, capacity: int, batch_size: int, flush_interval: float) -> None:
+        self._capacity = max(1, capacity)
+        self._batch_size = max(1, batch_size)
+        self._flush_interval = max(0.01, flush_interval)
+        self._buffer: deque[tuple] = deque(maxlen=self._capacity)
+        self._wakeup: asyncio.Event | None = None
+        self.dropped = 0
+        self.written = 0
+
+    def record(
+        self,
+        *,
+        user_id: int | None,
+        agent_id: str,
+        proxy_id: str,
+        transport: str,
+        method: str,
+        path: str,
+        status_code: int,
+        bytes_sent: int,
+        duration: float,
+    ) -> None:
+        if len(self._buffer) >= self._capacity:
+            self.dropped += 1
+            _DROPPED_OVERFLOW.inc()
+        self._buffer.append(
+            (
+                datetime.now(UTC),
+                user_id,
+                agent_id,
+                proxy_id,
+                transport,
+                method,
+                path[:_PATH_MAX_LENGTH],
+                status_code,
+                bytes_sent,
+                int(duration * 1000),
+            )
+        )
+        if self._wakeup is not None and len(self._buffer) >= self._batch_size:
+            self._wakeup.set()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def _drain(self) -> list[tuple]:
+        records: list[tuple] = []
+        while self._buffer and len(records) < self._batch_size:
+            records.append(self._buffer.popleft())
+        return records
+
+    def _requeue(self, records: list[tuple]) -> None:
+        # Records appended while the insert was running are newer; the oldest failed ones give way.
+        room = self._capacity - len(self._buffer)
+        lost = max(0, len(records) - room)
+        if lost:
+            self.dropped += lost
+            _DROPPED_FLUSH_ERROR.inc(lost)
+        self._buffer.extendleft(reversed(records[lost:]))
+
+    async def flush(self) -> int:
+        """Write everything buffered so far in batches of ``batch_size`` rows; returns rows written."""
+        total = 0
+        while self._buffer:
+            records = self._drain()
+            rows = [dict(zip(_COLUMNS, record)) for record in records]
+            try:
+                async with async_engine.begin() as conn:
+                    # executemany of one INSERT is sent as multi-row VALUES batches by SQLAlchemy.
+                    await conn.execute(insert(models.ChatAccessLog.__table__), rows)
+            except Exception:
+                logger.warning("chat_audit.flush_failed rows=%s", len(rows), exc_info=True)
+                self._requeue(records)
+                return total
+            total += len(rows)
+            self.written += len(rows)
+            _WRITTEN.inc(len(rows))
+        return total
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._flush_interval)
+            except TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+
+_audit_log = ChatAuditLog(
+    capacity=settings.CHAT_AUDIT_BUFFER_SIZE,
+    batch_size=settings.CHAT_AUDIT_BATCH_SIZE,
+    flush_interval=settings.CHAT_AUDIT_FLUSH_INTERVAL_MS / 1000,
+)
+
+REGISTRY.gauge_callback(
+    "agent_ui_chat_audit_buffered",
+    "Chat access records waiting to be flushed.",
+    (),
+    lambda: [((), float(len(_audit_log)))],
+)
+
+
+def get_chat_audit_log() -> ChatAuditLog | None:
+    return _audit_log if settings.CHAT_AUDIT_ENABLED else None
+
+
+def start_chat_audit_flusher() -> asyncio.Task | None:
+    if not settings.CHAT_AUDIT_ENABLED:
+        return None
+    return asyncio.create_task(_audit_log.run(), name="chat-audit-flusher")
+
+
+async def stop_chat_audit_flusher(task: asyncio.Task | None) -> None:
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await _audit_log.flush()
+
+
+def time_bucket(db: AsyncSession, column, bucket: str):
+    """SQL expression truncating ``column`` to the start of its minute/hour/day bucket."""
+    if db.bind.dialect.name == "sqlite":
+        return func.strftime(_SQLITE_BUCKET_FORMATS[bucket], column)
+    return func.date_trunc(bucket, column)
+
+
+def resolve_time_range(
+    start: datetime | None, end: datetime | None, *, default_span: timedelta
+) -> tuple[datetime, datetime]:
+    """Fill in an open-ended query range (ending now by default) and treat naive datetimes as UTC."""
+    end = end or datetime.now(UTC)
+    start = start or end - default_span
+    if end.tzinfo is None:
+        end = end.replace(tzinfo=UTC)
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=UTC)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+
+def as_utc_datetime(value) -> datetime:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value
+
+
+def _apply_filters(stmt, *, start: datetime, end: datetime, agent_id: str | None, user_id: int | None):
+    stmt = stmt.where(models.ChatAccessLog.occurred_at >= start, models.ChatAccessLog.occurred_at < end)
+    if agent_id:
+        stmt = stmt.where(models.ChatAccessLog.agent_id == agent_id)
+    if user_id is not None:
+        stmt = stmt.where(models.ChatAccessLog.user_id == user_id)
+    return stmt
+
+
+async def summarize_chat_access(
+    db: AsyncSession,
+    *,
+    start: datetime,
+    end: datetime,
+    bucket: str,
+    agent_id: str | None = None,
+    user_id: int | None = None,
+) -> list[dict]:
+    bucket_start = time_bucket(db, models.ChatAccessLog.occurred_at, bucket).label("bucket_start")
+    log = models.ChatAccessLog
+    stmt = select(
+        bucket_start,
+        func.count().label("requests"),
+        func.sum(case((log.status_code >= 400, 1), else_=0)).label("errors"),
+        func.count(func.distinct(log.user_id)).label("users"),
+        func.coalesce(func.sum(log.bytes_sent), 0).label("bytes_sent"),
+        func.coalesce(func.avg(log.duration_ms), 0).label("avg_duration_ms"),
+        func.coalesce(func.max(log.duration_ms), 0).label("max_duration_ms"),
+    )
+    stmt = _apply_filters(stmt, start=start, end=end, agent_id=agent_id, user_id=user_id)
+    rows = (await db.execute(stmt.group_by(bucket_start).order_by(bucket_start))).all()
+    return [
+        {
+            "bucket_start": as_utc_datetime(row.bucket_start),
+            "requests": int(row.requests or 0),
+            "errors": int(row.errors or 0),
+            "users": int(row.users or 0),
+            "bytes_sent": int(row.bytes_sent or 0),
+            "avg_duration_ms": float(row.avg_duration_ms or 0),
+            "max_duration_ms": int(row.max_duration_ms or 0),
+        }
+        for row in rows
+    ]
+
+
+async def list_chat_access(
+    db: AsyncSession,
+    *,
+    start: datetime,
+    end: datetime,
+    agent_id: str | None = None,
+    user_id: int | None = None,
+    before_id: int | None = None,
+    limit: int = 100,
+) -> list[models.ChatAccessLog]:
+    stmt = _apply_filters(
+        select(models.ChatAccessLog), start=start, end=end, agent_id=agent_id, user_id=user_id
+    )
+    if before_id is not None:
+        stmt = stmt.where(models.ChatAccessLog.id < before_id)
+    stmt = stmt.order_by(models.ChatAccessLog.id.desc()).limit(limit)
+    return list((await db.execute(stmt)).scalars().all())
+
+
+__all__ = [
+    "BUCKET_SIZES",
+    "ChatAuditLog",
+    "as_utc_datetime",
+    "get_chat_audit_log",
+    "list_chat_access",
+    "resolve_time_range",
+    "start_chat_audit_flusher",
+    "stop_chat_audit_flusher",
+    "summarize_chat_access",
+    "time_bucket",
+]
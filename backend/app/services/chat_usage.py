@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+from datetime import UTC, datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..config import settings
+from ..db import async_engine
+from .chat_audit import as_utc_datetime, time_bucket
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Field names used by OpenAI-compatible APIs, Anthropic-style APIs and MaxKB message frames.
+_USAGE_FIELDS = {
+    "prompt_tokens": "prompt",
+    "input_tokens": "prompt",
+    "message_tokens": "prompt",
+    "completion_tokens": "completion",
+    "output_tokens": "completion",
+    "answer_tokens": "completion",
+    "total_tokens": "total",
+}
+_USAGE_MARKER = b"_tokens"
+_MAX_SEARCH_DEPTH = 4
+_TAPPED_CONTENT_TYPES = ("text/event-stream", "application/json", "application/x-ndjson")
+_COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "total_tokens")
+
+_DROPPED = REGISTRY.counter(
+    "agent_ui_chat_usage_dropped_total",
+    "Usage samples dropped because the in-memory rollup reached CHAT_USAGE_MAX_KEYS.",
+)
+_TOKENS = REGISTRY.counter(
+    "agent_ui_chat_usage_tokens_total",
+    "Tokens reported by upstream chat responses.",
+    ("kind",),
+)
+
+
+def _collect_usage(payload, found: dict[str, int], depth: int = 0) -> None:
+    if depth > _MAX_SEARCH_DEPTH:
+        return
+    if isinstance(payload, dict):
+        for key, value in payload.items():
+            kind = _USAGE_FIELDS.get(key)
+            if kind is not None:
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and value > found[kind]:
+                    found[kind] = int(value)
+            elif isinstance(value, (dict, list)):
+                _collect_usage(value, found, depth + 1)
+    elif isinstance(payload, list):
+        for item in payload:
+            _collect_usage(item, found, depth + 1)
+
+
+def extract_usage(payload) -> dict[str, int]:
+    """Largest prompt/completion/total token counts found in one decoded JSON frame."""
+    found = {"prompt": 0, "completion": 0, "total": 0}
+    _collect_usage(payload, found)
+    return found
+
+
+class UsageTap:
+    """Pick token counts out of a chat response body as it streams past, without holding it.
+
+    Only complete lines containing ``_tokens`` are parsed (SSE ``data:`` frames, NDJSON rows or a
+    one-line JSON body); a partial line is kept until its newline and abandoned once it grows past
+    ``max_line_bytes``. Upstreams report cumulative usage, so the largest value seen per field wins.
+    """
+
+    def __init__(self, aggregator: UsageAggregator, user_id: int, agent_id: str, *, max_line_bytes: int) -> None:
+        self._aggregator = aggregator
+        self._user_id = user_id
+        self._agent_id = agent_id
+        self._max_line_bytes = max(1024, max_line_bytes)
+        self._pending = b""
+        self._skipping = False
+        self._usage = {"prompt": 0, "completion": 0, "total": 0}
+        self._finished = False
+
+    def feed(self, chunk: bytes) -> None:
+        if self._skipping:
+            newline = chunk.find(b"\n")
+            if newline < 0:
+                return
+            chunk = chunk[newline + 1 :]
+            self._skipping = False
+        if not self._pending and _USAGE_MARKER not in chunk and b"\n" in chunk:
+            # Common case: nothing to parse; only the tail after the last newline may matter.
+            tail = chunk[chunk.rfind(b"\n") + 1 :]
+            self._hold(tail)
+            return
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = b""
+        for line in lines[:-1]:
+            if _USAGE_MARKER in line:
+                self._parse(line)
+        self._hold(lines[-1])
+
+    def _hold(self, tail: bytes) -> None:
+        if len(tail) > self._max_line_bytes:
+            self._pending = b""
+            self._skipping = True
+        else:
+            self._pending = tail
+
+    def _parse(self, line: bytes) -> None:
+        line = line.strip()
+        if line.startswith(b"data:"):
+            line = line[5:].lstrip()
+        try:
+            payload = json.loads(line)
+        except ValueError:
+            return
+        for kind, value in extract_usage(payload).items():
+            if value > self._usage[kind]:
+                self._usage[kind] = value
+
+    def finish(self) -> None:
+        """Account the response once its body has ended (completed, failed or abandoned)."""
+        if self._finished:
+            return
+        self._finished = True
+        if self._pending and not self._skipping and _USAGE_MARKER in self._pending:
+            self._parse(self._pending)
+        self._pending = b""
+        usage = self._usage
+        total = max(usage["total"], usage["prompt"] + usage["completion"])
+        self._aggregator.add(
+            self._user_id,
+            self._agent_id,
+            prompt_tokens=usage["prompt"],
+            completion_tokens=usage["completion"],
+            total_tokens=total,
+        )
+
+
+class UsageAggregator:
+    """Per-(user, agent, minute) request and token counters, periodically upserted into chat_usage_rollups."""
+
+    def __init__(self, *, max_keys: int, flush_interval: float) -> None:
+        self._max_keys = max(1, max_keys)
+        self._flush_interval = max(0.1, flush_interval)
+        self._counts: dict[tuple[int, str, datetime], list[int]] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def add(
+        self,
+        user_id: int,
+        agent_id: str,
+        *,
+        requests: int = 1,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        total_tokens: int = 0,
+        at: datetime | None = None,
+    ) -> None:
+        minute = (at or datetime.now(UTC)).replace(second=0, microsecond=0)
+        key = (user_id, agent_id, minute)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                if len(self._counts) >= self._max_keys:
+                    self.dropped += 1
+                    _DROPPED.inc()
+                    return
+                counts = self._counts[key] = [0, 0, 0, 0]
+            counts[0] += requests
+            counts[1] += prompt_tokens
+            counts[2] += completion_tokens
+            counts[3] += total_tokens
+        if prompt_tokens:
+            _TOKENS.labels("prompt").inc(prompt_tokens)
+        if completion_tokens:
+            _TOKENS.labels("completion").inc(completion_tokens)
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def drain(self) -> dict[tuple[int, str, datetime], list[int]]:
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def _restore(self, counts: dict[tuple[int, str, datetime], list[int]]) -> None:
+        # A failed flush is retried with the next one instead of losing the counts. The token
+        # counters were incremented when the counts were first added, so they are not touched here.
+        with self._lock:
+            for key, values in counts.items():
+                current = self._counts.get(key)
+                if current is None:
+                    if len(self._counts) >= self._max_keys:
+                        self.dropped += 1
+                        _DROPPED.inc()
+                        continue
+                    self._counts[key] = values
+                else:
+                    for index, value in enumerate(values):
+                        current[index] += value
+
+    async def flush(self) -> int:
+        counts = self.drain()
+        if not counts:
+            return 0
+        rows = [
+            {
+                "user_id": user_id,
+                "agent_id": agent_id,
+                "bucket_start": minute,
+                **dict(zip(_COUNTERS, values)),
+            }
+            for (user_id, agent_id, minute), values in counts.items()
+        ]
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(_upsert_statement(conn.dialect.name), rows)
+        except Exception:
+            logger.warning("chat_usage.flush_failed rows=%s", len(rows), exc_info=True)
+            self._restore(counts)
+            return 0
+        return len(rows)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval)
+            await self.flush()
+
+
+def _upsert_statement(dialect: str):
+    """INSERT .. ON CONFLICT that adds to an existing minute row, since every worker flushes its own counts."""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"Usage rollups are not supported on {dialect}")
+    table = models.ChatUsageRollup.__table__
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "agent_id", "bucket_start"],
+        set_={name: table.c[name] + stmt.excluded[name] for name in _COUNTERS},
+    )
+
+
+_aggregator = UsageAggregator(
+    max_keys=settings.CHAT_USAGE_MAX_KEYS,
+    flush_interval=settings.CHAT_USAGE_FLUSH_INTERVAL,
+)
+
+
+def get_usage_aggregator() -> UsageAggregator:
+    return _aggregator
+
+
+def usage_tap_for(method: str, content_type: str, user_id: int, agent_id: str) -> UsageTap | None:
+    """A tap for chat message responses; GETs (history, assets) are not metered."""
+    if not settings.CHAT_USAGE_ENABLED or method != "POST":
+        return None
+    content_type = content_type.lower()
+    if not any(item in content_type for item in _TAPPED_CONTENT_TYPES):
+        return None
+    return UsageTap(_aggregator, user_id, agent_id, max_line_bytes=settings.CHAT_USAGE_MAX_LINE_BYTES)
+
+
+def start_usage_flusher() -> asyncio.Task | None:
+    if not settings.CHAT_USAGE_ENABLED:
+        return None
+    return asyncio.create_task(_aggregator.run(), name="chat-usage-flusher")
+
+
+async def stop_usage_flusher(task: asyncio.Task | None) -> None:
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await _aggregator.flush()
+
+
+def _usage_columns():
+    rollup = models.ChatUsageRollup
+    return (
+        func.coalesce(func.sum(rollup.requests), 0).label("requests"),
+        func.coalesce(func.sum(rollup.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(rollup.completion_tokens), 0).label("completion_tokens"),
+        func.coalesce(func.sum(rollup.total_tokens), 0).label("total_tokens"),
+    )
+
+
+def _usage_counts(row) -> dict[str, int]:
+    return {name: int(getattr(row, name) or 0) for name in _COUNTERS}
+
+
+def _apply_filters(stmt, *, start: datetime, end: datetime, user_id: int | None, agent_id: str | None):
+    rollup = models.ChatUsageRollup
+    stmt = stmt.where(rollup.bucket_start >= start, rollup.bucket_start < end)
+    if user_id is not None:
+        stmt = stmt.where(rollup.user_id == user_id)
+    if agent_id:
+        stmt = stmt.where(rollup.agent_id == agent_id)
+    return stmt
+
+
+async def usage_series(
+    db: AsyncSession,
+    *,
+    start: datetime,
+    end: datetime,
+    bucket: str,
+    user_id: int | None = None,
+    agent_id: str | None = None,
+) -> list[dict]:
+    bucket_start = time_bucket(db, models.ChatUsageRollup.bucket_start, bucket).label("bucket_start")
+    stmt = _apply_filters(
+        select(bucket_start, *_usage_columns()), start=start, end=end, user_id=user_id, agent_id=agent_id
+    )
+    rows = (await db.execute(stmt.group_by(bucket_start).order_by(bucket_start))).all()
+    return [{"bucket_start": as_utc_datetime(row.bucket_start), **_usage_counts(row)} for row in rows]
+
+
+async def usage_ranking(
+    db: AsyncSession,
+    *,
+    start: datetime,
+    end: datetime,
+    group_by: str,
+    limit: int,
+    user_id: int | None = None,
+    agent_id: str | None = None,
+) -> list[dict]:
+    rollup = models.ChatUsageRollup
+    if group_by == "user":
+        key, name, target = rollup.user_id, models.User.username, models.User
+        on = models.User.id == rollup.user_id
+    else:
+        key, name, target = rollup.agent_id, models.Agent.name, models.Agent
+        on = models.Agent.id == rollup.agent_id
+    columns = _usage_columns()
+    stmt = select(key.label("key"), func.max(name).label("name"), *columns).outerjoin(target, on)
+    stmt = _apply_filters(stmt, start=start, end=end, user_id=user_id, agent_id=agent_id)
+    stmt = stmt.group_by(key).order_by(columns[3].desc(), columns[0].desc()).limit(limit)
+    rows = (await db.execute(stmt)).all()
+    return [{"key": str(row.key), "name": row.name or "", **_usage_counts(row)} for row in rows]
+
+
+__all__ = [
+    "UsageAggregator",
+    "UsageTap",
+    "extract_usage",
+    "get_usage_aggregator",
+    "start_usage_flusher",
+    "stop_usage_flusher",
+    "usage_ranking",
+    "usage_series",
+    "usage_tap_for",
+]
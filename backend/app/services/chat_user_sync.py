@@ -10,6 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models, schemas
 from ..db import AsyncSessionLocal
+from ..services.metrics import observe_sync_task
 from ..services.serializers import agent_detail
 from ..api.admin_modules.common import fit2cloud_fetch_async, fit2cloud_request_async
 
@@ -386,6 +387,7 @@ async def _mark_task_failed(db: AsyncSession, task: models.SyncTask, detail: str
     task.finished_at = _now()
     task.updated_at = _now()
     await db.commit()
+    observe_sync_task(task)
 
 
 async def run_agent_chat_user_sync_task(task_id: str) -> None:
@@ -440,6 +442,7 @@ async def run_agent_chat_user_sync_task(task_id: str) -> None:
             task.finished_at = _now()
             task.updated_at = _now()
             await db.commit()
+            observe_sync_task(task)
         except Exception as exc:  # pragma: no cover - task failure path
             await _mark_task_failed(db, task, str(exc))
 
@@ -724,25 +727,34 @@ async def sync_user_chat_bindings(
     return matched_count
 
 
+def authorized_chat_access_query(user_id: int):
+    """SELECT of the agent ids granted to a user's bound chat users, whether or not still synced."""
+    return (
+        select(models.AgentChatUserAccess.agent_id)
+        .join(models.UserChatBinding, models.UserChatBinding.chat_user_id == models.AgentChatUserAccess.chat_user_id)
+        .where(
+            models.UserChatBinding.user_id == user_id,
+            models.AgentChatUserAccess.is_auth.is_(True),
+        )
+    )
+
+
+def synced_agent_ids_query(user_id: int):
+    """SELECT of the synced agent ids a user may open through a bound, authorized chat user."""
+    return (
+        authorized_chat_access_query(user_id)
+        .join(models.Agent, models.Agent.id == models.AgentChatUserAccess.agent_id)
+        .where(models.Agent.is_synced.is_(True))
+    )
+
+
 async def list_user_synced_agent_ids_async(db: AsyncSession, *, user: models.User) -> list[str]:
     cache_key = f"chat_visible_agent_ids:{user.id}"
     cached = db.info.get(cache_key)
     if cached is not None:
         return cached
 
-    rows = (
-        await db.execute(
-            select(models.AgentChatUserAccess.agent_id)
-            .join(models.UserChatBinding, models.UserChatBinding.chat_user_id == models.AgentChatUserAccess.chat_user_id)
-            .join(models.Agent, models.Agent.id == models.AgentChatUserAccess.agent_id)
-            .where(
-                models.UserChatBinding.user_id == user.id,
-                models.AgentChatUserAccess.is_auth.is_(True),
-                models.Agent.is_synced.is_(True),
-            )
-            .distinct()
-        )
-    ).scalars().all()
+    rows = (await db.execute(synced_agent_ids_query(user.id).distinct())).scalars().all()
     values = [str(item) for item in rows if item]
     db.info[cache_key] = values
     return values
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass
+
+import httpx
+
+
+@dataclass(frozen=True, slots=True)
+class SharedResponse:
+    """A fully read upstream response; the body is already decoded, so no content-encoding."""
+
+    status_code: int
+    headers: tuple[tuple[str, str], ...]
+    body: bytes
+
+    def to_response(self) -> httpx.Response:
+        # Built from bytes, the response counts as consumed and is rendered like a buffered one.
+        return httpx.Response(self.status_code, headers=list(self.headers), content=self.body)
+
+
+class Flight:
+    """One in-flight upstream request; the leader sends it, followers await its result."""
+
+    def __init__(self, coalescer: RequestCoalescer, key: str, future: asyncio.Future, *, leader: bool) -> None:
+        self._coalescer = coalescer
+        self.key = key
+        self._future = future
+        self.leader = leader
+
+    async def wait(self, timeout: float) -> SharedResponse | None:
+        """The leader's response, or None when it could not be shared (followers then fetch alone)."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except TimeoutError:
+            return None
+
+    def publish(self, shared: SharedResponse | None) -> None:
+        self._coalescer._forget(self)
+        if not self._future.done():
+            self._future.set_result(shared)
+
+    def finish(self) -> None:
+        """Release followers if the leader ended without publishing (error, cancellation, unshareable)."""
+        self.publish(None)
+
+
+class RequestCoalescer:
+    """Single-flight registry for identical concurrent upstream GETs within one worker."""
+
+    def __init__(self) -> None:
+        self._flights: dict[str, Flight] = {}
+        self.coalesced = 0
+
+    def join(self, key: str) -> Flight:
+        leader = self._flights.get(key)
+        if leader is not None:
+            self.coalesced += 1
+            return Flight(self, key, leader._future, leader=False)
+        flight = Flight(self, key, asyncio.get_running_loop().create_future(), leader=True)
+        self._flights[key] = flight
+        return flight
+
+    def _forget(self, flight: Flight) -> None:
+        if flight.leader and self._flights.get(flight.key) is flight:
+            del self._flights[flight.key]
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+
+_coalescer = RequestCoalescer()
+
+
+def get_request_coalescer() -> RequestCoalescer:
+    return _coalescer
+
+
+__all__ = [
+    "Flight",
+    "RequestCoalescer",
+    "SharedResponse",
+    "get_request_coalescer",
+]
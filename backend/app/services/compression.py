@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import importlib.util
+import zlib
+from collections.abc import AsyncIterator
+
+_GZIP_LEVEL = 6
+_BROTLI_QUALITY = 5
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "json",
+    "javascript",
+    "ecmascript",
+    "xml",
+    "svg",
+    "wasm",
+    "font/ttf",
+    "font/otf",
+    "application/vnd.ms-fontobject",
+)
+
+
+def brotli_available() -> bool:
+    return importlib.util.find_spec("brotli") is not None
+
+
+def supported_encodings() -> tuple[str, ...]:
+    return ("br", "gzip") if brotli_available() else ("gzip",)
+
+
+def upstream_accept_encoding() -> str:
+    return ", ".join(supported_encodings())
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    """Content codings the client accepts with a non-zero quality ("*" expands to all we support)."""
+    accepted: set[str] = set()
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality <= 0:
+            continue
+        if name == "*":
+            accepted.update(supported_encodings())
+        else:
+            accepted.add(name)
+    return accepted
+
+
+def negotiate_encoding(accept_encoding: str) -> str:
+    accepted = accepted_encodings(accept_encoding)
+    for name in supported_encodings():
+        if name in accepted:
+            return name
+    return "identity"
+
+
+def is_compressible(content_type: str) -> bool:
+    lowered = (content_type or "").lower()
+    return any(item in lowered for item in _COMPRESSIBLE_TYPES)
+
+
+class StreamEncoder:
+    """Incremental gzip/brotli encoder that flushes per chunk so SSE frames are not delayed."""
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._gzip = zlib.compressobj(_GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._brotli = None
+        elif encoding == "br":
+            import brotli
+
+            self._gzip = None
+            self._brotli = brotli.Compressor(quality=_BROTLI_QUALITY)
+        else:
+            raise ValueError(f"Unsupported content encoding: {encoding}")
+
+    def encode(self, chunk: bytes) -> bytes:
+        if self._gzip is not None:
+            return self._gzip.compress(chunk) + self._gzip.flush(zlib.Z_SYNC_FLUSH)
+        return self._brotli.process(chunk) + self._brotli.flush()
+
+    def finish(self) -> bytes:
+        if self._gzip is not None:
+            return self._gzip.flush(zlib.Z_FINISH)
+        return self._brotli.finish()
+
+
+def compress_bytes(data: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        compressor = zlib.compressobj(_GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(data, quality=_BROTLI_QUALITY)
+    return data
+
+
+async def encode_stream(body: AsyncIterator[bytes], encoding: str) -> AsyncIterator[bytes]:
+    encoder = StreamEncoder(encoding)
+    async for chunk in body:
+        if not chunk:
+            continue
+        encoded = encoder.encode(chunk)
+        if encoded:
+            yield encoded
+    tail = encoder.finish()
+    if tail:
+        yield tail
+
+
+__all__ = [
+    "StreamEncoder",
+    "accepted_encodings",
+    "brotli_available",
+    "compress_bytes",
+    "encode_stream",
+    "is_compressible",
+    "negotiate_encoding",
+    "supported_encodings",
+    "upstream_accept_encoding",
+]
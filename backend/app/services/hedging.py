@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict, deque
+
+from ..config import settings
+from .metrics import REGISTRY
+
+HEDGEABLE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+CHAT_PROXY_HEDGES = REGISTRY.counter(
+    "agent_ui_chat_proxy_hedges_total",
+    "Hedged upstream requests by outcome (won, lost, failed) and hedges skipped for lack of budget.",
+    ("agent", "outcome"),
+)
+
+
+class LatencyWindow:
+    """Recent upstream latencies of one agent; the percentile is recomputed every ``refresh`` samples."""
+
+    __slots__ = ("_samples", "_refresh", "_since_refresh", "_cached")
+
+    def __init__(self, size: int, refresh: int = 16) -> None:
+        self._samples: deque[float] = deque(maxlen=max(1, size))
+        self._refresh = max(1, refresh)
+        self._since_refresh = 0
+        self._cached: float | None = None
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+        self._since_refresh += 1
+        if self._since_refresh >= self._refresh:
+            self._cached = None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, quantile: float) -> float:
+        if self._cached is None:
+            ordered = sorted(self._samples)
+            self._cached = ordered[min(len(ordered) - 1, int(quantile * len(ordered)))] if ordered else 0.0
+            self._since_refresh = 0
+        return self._cached
+
+
+class HedgeBudget:
+    """Token bucket where every request earns ``ratio`` of a hedge, capping hedges at that share of traffic."""
+
+    def __init__(self, *, ratio: float, burst: float) -> None:
+        self._ratio = max(0.0, ratio)
+        self._burst = max(1.0, burst)
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def earn(self) -> None:
+        with self._lock:
+            self._tokens = min(self._burst, self._tokens + self._ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+class HedgePolicy:
+    """When to send a second copy of an idempotent chat proxy request.
+
+    The delay is the agent's running p95 time to first byte (never below ``min_delay``) once
+    ``min_samples`` have been seen; the budget bounds the extra upstream load.
+    """
+
+    def __init__(
+        self,
+        *,
+        enabled: bool,
+        quantile: float,
+        window: int,
+        min_samples: int,
+        min_delay: float,
+        budget: HedgeBudget,
+        max_agents: int = 1024,
+    ) -> None:
+        self.enabled = enabled
+        self._quantile = min(0.999, max(0.5, quantile))
+        self._window = max(1, window)
+        self._min_samples = max(1, min_samples)
+        self._min_delay = max(0.0, min_delay)
+        self._budget = budget
+        self._max_agents = max(1, max_agents)
+        self._windows: OrderedDict[str, LatencyWindow] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, proxy_id: str, latency: float) -> None:
+        with self._lock:
+            window = self._windows.get(proxy_id)
+            if window is None:
+                window = self._windows[proxy_id] = LatencyWindow(self._window)
+                while len(self._windows) > self._max_agents:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(proxy_id)
+            window.add(latency)
+
+    def delay(self, proxy_id: str, method: str) -> float | None:
+        """Seconds to wait before hedging this request, or None when it must not be hedged."""
+        if not self.enabled or method not in HEDGEABLE_METHODS:
+            return None
+        self._budget.earn()
+        with self._lock:
+            window = self._windows.get(proxy_id)
+            if window is None or len(window) < self._min_samples:
+                return None
+            return max(self._min_delay, window.percentile(self._quantile))
+
+    def try_hedge(self) -> bool:
+        return self._budget.try_spend()
+
+
+_policy = HedgePolicy(
+    enabled=settings.CHAT_PROXY_HEDGE_ENABLED,
+    quantile=settings.CHAT_PROXY_HEDGE_QUANTILE,
+    window=settings.CHAT_PROXY_HEDGE_WINDOW,
+    min_samples=settings.CHAT_PROXY_HEDGE_MIN_SAMPLES,
+    min_delay=settings.CHAT_PROXY_HEDGE_MIN_DELAY,
+    budget=HedgeBudget(ratio=settings.CHAT_PROXY_HEDGE_BUDGET, burst=settings.CHAT_PROXY_HEDGE_BURST),
+)
+
+
+def get_hedge_policy() -> HedgePolicy:
+    return _policy
+
+
+__all__ = [
+    "CHAT_PROXY_HEDGES",
+    "HEDGEABLE_METHODS",
+    "HedgeBudget",
+    "HedgePolicy",
+    "LatencyWindow",
+    "get_hedge_policy",
+]
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import importlib.util
+from urllib.parse import urlparse
+
 import httpx
 
+from ..config import settings
+
 _shared_async_client: httpx.AsyncClient | None = None
 
 
@@ -22,4 +27,163 @@ async def close_shared_async_client() -> None:
         _shared_async_client = None
 
 
-__all__ = ["close_shared_async_client", "get_shared_async_client"]
+def _http2_available() -> bool:
+    return importlib.util.find_spec("h2") is not None
+
+
+def upstream_pool_key(base_url: str) -> str:
+    parsed = urlparse((base_url or "").strip())
+    if parsed.scheme and parsed.netloc:
+        return f"{parsed.scheme.lower()}://{parsed.netloc.lower()}"
+    return (base_url or "").strip().rstrip("/").lower()
+
+
+class UpstreamClientPool:
+    """Keep-alive httpx clients for chat upstreams, one connection pool per origin."""
+
+    def __init__(
+        self,
+        *,
+        max_connections: int,
+        max_keepalive_connections: int,
+        keepalive_expiry: float,
+        timeout: float,
+        http2: bool,
+    ) -> None:
+        self._limits = httpx.Limits(
+            max_connections=max(1, max_connections),
+            max_keepalive_connections=max(0, max_keepalive_connections),
+            keepalive_expiry=max(1.0, keepalive_expiry),
+        )
+        self._timeout = httpx.Timeout(timeout)
+        # HTTP/2 is negotiated through ALPN, so plain-http or h1-only upstreams keep using HTTP/1.1.
+        self._http2 = bool(http2) and _http2_available()
+        self._clients: dict[str, httpx.AsyncClient] = {}
+
+    def get(self, base_url: str) -> httpx.AsyncClient:
+        key = upstream_pool_key(base_url)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                follow_redirects=False,
+                timeout=self._timeout,
+                limits=self._limits,
+                http2=self._http2,
+            )
+            self._clients[key] = client
+        return client
+
+    async def aclose(self) -> None:
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+    def stats(self) -> list[dict]:
+        items: list[dict] = []
+        for key, client in sorted(self._clients.items()):
+            pool = getattr(getattr(client, "_transport", None), "_pool", None)
+            connections = list(getattr(pool, "connections", []) or [])
+            # httpcore does not expose queued requests publicly; read them defensively.
+            requests = list(getattr(pool, "_requests", []) or [])
+            idle = sum(1 for connection in connections if connection.is_idle())
+            waiting = sum(1 for item in requests if item.is_queued())
+            items.append(
+                {
+                    "base_url": key,
+                    "http2": self._http2,
+                    "open": len(connections),
+                    "idle": idle,
+                    "active": len(connections) - idle,
+                    "waiting": waiting,
+                    "max_connections": self._limits.max_connections,
+                    "max_keepalive_connections": self._limits.max_keepalive_connections,
+                }
+            )
+        return items
+
+
+_upstream_client_pool: UpstreamClientPool | None = None
+
+
+def get_upstream_client_pool() -> UpstreamClientPool:
+    global _upstream_client_pool
+    if _upstream_client_pool is None:
+        _upstream_client_pool = UpstreamClientPool(
+            max_connections=settings.CHAT_PROXY_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.CHAT_PROXY_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.CHAT_PROXY_KEEPALIVE_EXPIRY,
+            timeout=settings.CHAT_PROXY_TIMEOUT,
+            http2=settings.CHAT_PROXY_HTTP2,
+        )
+    return _upstream_client_pool
+
+
+def get_upstream_client(base_url: str) -> httpx.AsyncClient:
+    return get_upstream_client_pool().get(base_url)
+
+
+def upstream_pool_stats() -> list[dict]:
+    if _upstream_client_pool is None:
+        return []
+    return _upstream_client_pool.stats()
+
+
+class WebSocketTracker:
+    """Counts proxied WebSocket connections per agent (single event loop, no locking needed)."""
+
+    def __init__(self) -> None:
+        self._open: dict[str, int] = {}
+
+    def try_acquire(self, agent_id: str, limit: int = 0) -> bool:
+        current = self._open.get(agent_id, 0)
+        if limit > 0 and current >= limit:
+            return False
+        self._open[agent_id] = current + 1
+        return True
+
+    def release(self, agent_id: str) -> None:
+        current = self._open.get(agent_id, 0) - 1
+        if current > 0:
+            self._open[agent_id] = current
+        else:
+            self._open.pop(agent_id, None)
+
+    def count(self, agent_id: str) -> int:
+        return self._open.get(agent_id, 0)
+
+    def stats(self) -> list[dict]:
+        return [{"agent_id": agent_id, "open": count} for agent_id, count in sorted(self._open.items())]
+
+
+_websocket_tracker = WebSocketTracker()
+
+
+def get_websocket_tracker() -> WebSocketTracker:
+    return _websocket_tracker
+
+
+def websocket_stats() -> list[dict]:
+    return _websocket_tracker.stats()
+
+
+async def close_upstream_clients() -> None:
+    global _upstream_client_pool
+    if _upstream_client_pool is not None:
+        await _upstream_client_pool.aclose()
+        _upstream_client_pool = None
+
+
+__all__ = [
+    "UpstreamClientPool",
+    "WebSocketTracker",
+    "close_shared_async_client",
+    "close_upstream_clients",
+    "get_shared_async_client",
+    "get_upstream_client",
+    "get_upstream_client_pool",
+    "get_websocket_tracker",
+    "upstream_pool_key",
+    "upstream_pool_stats",
+    "websocket_stats",
+]
@@ -0,0 +1,282 @@
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+
+# Updates are plain attribute increments with no lock: under the GIL an increment from a
+# threadpool worker can very rarely be lost, which is an acceptable trade for staying on the hot path.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+SYNC_TASK_BUCKETS = (1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 1800.0, 3600.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]) -> None:
+        self._bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self._bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """The series for ``values``; callers on hot paths may keep the returned child."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        *,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._bounds = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self._bounds)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for values, child in list(self._children.items()):
+            counts = list(child.counts)
+            cumulative = 0
+            for bound, count in zip((*self._bounds, float("inf")), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, values, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class GaugeCallback(_Metric):
+    """Gauge whose samples are produced at scrape time by ``collect`` as (label values, value) pairs."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str],
+        collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def render(self) -> list[str]:
+        lines = self._header()
+        for values, value in self._collect():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        *,
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def gauge_callback(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str],
+        collect: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+    ) -> GaugeCallback:
+        return self.register(GaugeCallback(name, documentation, labelnames, collect))
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+CHAT_PROXY_REQUEST_SECONDS = REGISTRY.histogram(
+    "agent_ui_chat_proxy_request_duration_seconds",
+    "Chat proxy request latency until the response body is fully sent.",
+    ("agent", "status"),
+)
+CHAT_PROXY_TTFB_SECONDS = REGISTRY.histogram(
+    "agent_ui_chat_proxy_upstream_ttfb_seconds",
+    "Time until the upstream answered with response headers, fallback attempts included.",
+    ("agent", "status"),
+)
+CHAT_PROXY_FALLBACKS = REGISTRY.counter(
+    "agent_ui_chat_proxy_fallbacks_total",
+    "Upstream calls retried on the alternate /chat path style.",
+    ("agent", "transport"),
+)
+CHAT_PROXY_DB_HOLD_SECONDS = REGISTRY.histogram(
+    "agent_ui_chat_proxy_db_hold_seconds",
+    "Time a chat proxy request held its database connection.",
+    buckets=FAST_BUCKETS,
+)
+DB_POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "agent_ui_db_pool_wait_seconds",
+    "Time a session waited for a pooled database connection.",
+    ("engine",),
+    buckets=FAST_BUCKETS,
+)
+SYNC_TASK_SECONDS = REGISTRY.histogram(
+    "agent_ui_sync_task_duration_seconds",
+    "Sync task run time from start to completion or failure.",
+    ("task_type", "status"),
+    buckets=SYNC_TASK_BUCKETS,
+)
+SYNC_TASK_RECORDS = REGISTRY.counter(
+    "agent_ui_sync_task_records_total",
+    "Records processed by finished sync tasks.",
+    ("task_type", "status"),
+)
+PERMISSION_EVALUATION_SECONDS = REGISTRY.histogram(
+    "agent_ui_permission_evaluation_seconds",
+    "Permission evaluation latency, including grant and role lookups.",
+    ("action",),
+    buckets=FAST_BUCKETS,
+)
+
+
+def observe_sync_task(task) -> None:
+    """Record a finished ``SyncTask`` (completed or failed)."""
+    task_type = task.task_type or ""
+    status = task.status or ""
+    if task.started_at is not None and task.finished_at is not None:
+        duration = (task.finished_at - task.started_at).total_seconds()
+        SYNC_TASK_SECONDS.labels(task_type, status).observe(max(0.0, duration))
+    SYNC_TASK_RECORDS.labels(task_type, status).inc(task.processed_records or 0)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
+
+
+__all__ = [
+    "CHAT_PROXY_DB_HOLD_SECONDS",
+    "CHAT_PROXY_FALLBACKS",
+    "CHAT_PROXY_REQUEST_SECONDS",
+    "CHAT_PROXY_TTFB_SECONDS",
+    "CONTENT_TYPE",
+    "Counter",
+    "DB_POOL_WAIT_SECONDS",
+    "GaugeCallback",
+    "Histogram",
+    "MetricsRegistry",
+    "PERMISSION_EVALUATION_SECONDS",
+    "REGISTRY",
+    "SYNC_TASK_RECORDS",
+    "SYNC_TASK_SECONDS",
+    "observe_sync_task",
+    "render_metrics",
+]
@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass, replace
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..config import settings
+from .cache_epochs import track_cache_epoch
+from .upstream_balancer import UpstreamTarget, normalize_upstream_targets
+
+
+@dataclass(frozen=True, slots=True)
+class ProxyRoute:
+    """Immutable snapshot of the Agent columns the chat proxy needs to route a request."""
+
+    id: str
+    proxy_id: str
+    upstream_base_url: str
+    upstream_token: str
+    status: str
+    is_synced: bool
+    groups: tuple[str, ...] = ()
+    upstream_targets: tuple[UpstreamTarget, ...] = ()
+
+    @property
+    def group_name(self) -> str:
+        return self.groups[0] if self.groups else ""
+
+    def on_upstream(self, base_url: str) -> ProxyRoute:
+        """The same route bound to another of its upstream nodes."""
+        if base_url == self.upstream_base_url:
+            return self
+        return replace(self, upstream_base_url=base_url)
+
+    @classmethod
+    def from_agent(cls, agent: models.Agent) -> ProxyRoute:
+        return cls(
+            id=str(agent.id),
+            proxy_id=agent.proxy_id or "",
+            upstream_base_url=agent.upstream_base_url or "",
+            upstream_token=agent.upstream_token or "",
+            status=agent.status or "",
+            is_synced=bool(agent.is_synced),
+            groups=tuple(models.agent_group_names(agent)),
+            upstream_targets=normalize_upstream_targets(
+                agent.upstream_base_url or "", agent.upstream_targets
+            ),
+        )
+
+
+_MISSING = object()
+
+
+class ProxyRouteCache:
+    """Bounded LRU of proxy_id -> ProxyRoute with TTLs, including negative entries."""
+
+    def __init__(self, *, max_entries: int, ttl: float, negative_ttl: float) -> None:
+        self._max_entries = max(0, max_entries)
+        self._ttl = max(0.0, ttl)
+        self._negative_ttl = max(0.0, negative_ttl)
+        self._entries: OrderedDict[str, tuple[float, ProxyRoute | None]] = OrderedDict()
+        # Invalidation can come from sync code running in worker threads.
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0 and self._ttl > 0
+
+    def get(self, proxy_id: str) -> ProxyRoute | None | object:
+        if not self.enabled:
+            return _MISSING
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(proxy_id)
+            if entry is None:
+                return _MISSING
+            expires_at, route = entry
+            if expires_at <= now:
+                del self._entries[proxy_id]
+                return _MISSING
+            self._entries.move_to_end(proxy_id)
+            return route
+
+    def put(self, proxy_id: str, route: ProxyRoute | None) -> None:
+        if not self.enabled:
+            return
+        ttl = self._ttl if route is not None else self._negative_ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[proxy_id] = (time.monotonic() + ttl, route)
+            self._entries.move_to_end(proxy_id)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, proxy_ids: Iterable[str] | None = None) -> None:
+        with self._lock:
+            if proxy_ids is None:
+                self._entries.clear()
+                return
+            for proxy_id in proxy_ids:
+                self._entries.pop(proxy_id, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class UpstreamPathPreferences:
+    """Remembers which upstream path style answered for each proxy id and path prefix.
+
+    Styles are indexes into the candidate list built by the chat proxy (``0`` for
+    ``/chat/{rest}``, ``1`` for ``/chat/{token}/{rest}``). A learned non-default style is
+    tried first; once per ``reprobe_interval`` one request goes back to the default order
+    so the preference follows upstream upgrades.
+    """
+
+    def __init__(self, *, max_entries: int, reprobe_interval: float) -> None:
+        self._max_entries = max(0, max_entries)
+        self._reprobe_interval = max(0.0, reprobe_interval)
+        self._entries: OrderedDict[tuple[str, str], tuple[int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def order(self, proxy_id: str, prefix: str, count: int) -> list[int]:
+        default = list(range(count))
+        if count < 2 or self._max_entries <= 0:
+            return default
+        key = (proxy_id, prefix)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            style, learned_at = entry
+            if style <= 0 or style >= count:
+                return default
+            if self._reprobe_interval and now - learned_at >= self._reprobe_interval:
+                # Let this request probe the default order; others keep the learned one.
+                self._entries[key] = (style, now)
+                return default
+            self._entries.move_to_end(key)
+        return [style, *[idx for idx in default if idx != style]]
+
+    def record(self, proxy_id: str, prefix: str, style: int) -> None:
+        if self._max_entries <= 0:
+            return
+        key = (proxy_id, prefix)
+        with self._lock:
+            if style <= 0:
+                self._entries.pop(key, None)
+                return
+            current = self._entries.get(key)
+            # Keep the original timestamp so confirmations do not postpone the re-probe.
+            if current is None or current[0] != style:
+                self._entries[key] = (style, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, proxy_ids: Iterable[str] | None = None) -> None:
+        with self._lock:
+            if proxy_ids is None:
+                self._entries.clear()
+                return
+            targets = set(proxy_ids)
+            for key in [key for key in self._entries if key[0] in targets]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_route_cache = ProxyRouteCache(
+    max_entries=settings.CHAT_PROXY_ROUTE_CACHE_SIZE,
+    ttl=settings.CHAT_PROXY_ROUTE_CACHE_TTL,
+    negative_ttl=settings.CHAT_PROXY_ROUTE_CACHE_NEGATIVE_TTL,
+)
+
+
+_path_preferences = UpstreamPathPreferences(
+    max_entries=settings.CHAT_PROXY_PATH_PREFERENCE_SIZE,
+    reprobe_interval=settings.CHAT_PROXY_PATH_REPROBE_INTERVAL,
+)
+
+
+def get_proxy_route_cache() -> ProxyRouteCache:
+    return _route_cache
+
+
+def get_upstream_path_preferences() -> UpstreamPathPreferences:
+    return _path_preferences
+
+
+def invalidate_proxy_routes(*proxy_ids: str) -> None:
+    """Drop cached routes for the given proxy ids, or every route when called without ids."""
+    if proxy_ids:
+        targets = [item for item in proxy_ids if item]
+        _route_cache.invalidate(targets)
+        _path_preferences.invalidate(targets)
+    else:
+        _route_cache.invalidate()
+        _path_preferences.invalidate()
+
+
+# Agent writes committed by other processes (sync worker, other API workers) clear this worker's
+# routes within CACHE_EPOCH_POLL_INTERVAL; local writes also call invalidate_proxy_routes directly.
+track_cache_epoch("proxy_routes", ("agents",), invalidate_proxy_routes)
+
+
+async def resolve_proxy_routes(db: AsyncSession, proxy_ids: Iterable[str]) -> dict[str, ProxyRoute]:
+    resolved: dict[str, ProxyRoute] = {}
+    missing: list[str] = []
+    for proxy_id in proxy_ids:
+        if not proxy_id or proxy_id in resolved or proxy_id in missing:
+            continue
+        cached = _route_cache.get(proxy_id)
+        if cached is _MISSING:
+            missing.append(proxy_id)
+        elif cached is not None:
+            resolved[proxy_id] = cached
+    if not missing:
+        return resolved
+
+    agents = (
+        await db.execute(select(models.Agent).where(models.Agent.proxy_id.in_(missing)))
+    ).scalars().all()
+    found = {agent.proxy_id: ProxyRoute.from_agent(agent) for agent in agents}
+    for proxy_id in missing:
+        route = found.get(proxy_id)
+        _route_cache.put(proxy_id, route)
+        if route is not None:
+            resolved[proxy_id] = route
+    return resolved
+
+
+async def resolve_proxy_route(db: AsyncSession, proxy_id: str) -> ProxyRoute | None:
+    if not proxy_id:
+        return None
+    return (await resolve_proxy_routes(db, [proxy_id])).get(proxy_id)
+
+
+__all__ = [
+    "ProxyRoute",
+    "ProxyRouteCache",
+    "UpstreamPathPreferences",
+    "get_proxy_route_cache",
+    "get_upstream_path_preferences",
+    "invalidate_proxy_routes",
+    "resolve_proxy_route",
+    "resolve_proxy_routes",
+]
@@ -13,9 +13,6 @@ def count_active(items: Iterable[object], key: str = "status") -> int:
 def agent_summary(agent: models.Agent, *, include_description: bool = True) -> schemas.AgentSummary:
     is_synced = bool(getattr(agent, "is_synced", False))
     editable = True
-    groups = list(agent.groups or [])
-    if not groups and agent.group_name:
-        groups = [agent.group_name]
     return schemas.AgentSummary(
         id=agent.id,
         name=agent.name,
@@ -24,7 +21,7 @@ def agent_summary(agent: models.Agent, *, include_description: bool = True) -> s
         last_run=agent.last_run,
         description=agent.description if include_description else "",
         url=agent.url,
-        groups=groups,
+        groups=models.agent_group_names(agent),
         editable=editable,
         source_type=agent.source_type or "",
         status_editable_only=is_synced,
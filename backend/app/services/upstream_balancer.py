@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import hashlib
+import random
+import threading
+from dataclasses import dataclass
+
+from ..config import settings
+from .upstream_health import STATE_OPEN, get_upstream_health
+
+STRATEGY_LEAST_OUTSTANDING = "least_outstanding"
+STRATEGY_EWMA = "ewma"
+# EWMA charged to a node whose connection failed, so an unmeasured dead node stops scoring 0.
+_FAILURE_PENALTY_SECONDS = 1.0
+
+
+@dataclass(frozen=True, slots=True)
+class UpstreamTarget:
+    base_url: str
+    weight: int = 1
+    # Path under ``base_url`` answered cheaply when the node is up; empty uses the global default.
+    health_path: str = ""
+
+    @property
+    def key(self) -> str:
+        """Opaque id for the sticky cookie, so node addresses are not exposed to browsers."""
+        return upstream_target_key(self.base_url)
+
+
+def upstream_target_key(base_url: str) -> str:
+    return hashlib.sha1(base_url.rstrip("/").encode("utf-8")).hexdigest()[:12]
+
+
+def normalize_upstream_targets(primary: str, raw) -> tuple[UpstreamTarget, ...]:
+    """The primary base URL plus any configured replicas, deduplicated, weights clamped to >= 1.
+
+    ``raw`` is the ``agents.upstream_targets`` JSON: a list of
+    ``{"base_url": ..., "weight": ..., "health_path": ...}``; ``health_path`` is optional.
+    """
+    targets: dict[str, UpstreamTarget] = {}
+    for item in raw or []:
+        if not isinstance(item, dict):
+            continue
+        base_url = str(item.get("base_url") or "").strip().rstrip("/")
+        if not base_url or base_url in targets:
+            continue
+        try:
+            weight = int(item.get("weight") or 1)
+        except (TypeError, ValueError):
+            weight = 1
+        health_path = str(item.get("health_path") or "").strip()
+        targets[base_url] = UpstreamTarget(base_url, max(1, weight), health_path)
+    primary = (primary or "").rstrip("/")
+    if primary and primary not in targets:
+        targets = {primary: UpstreamTarget(primary), **targets}
+    return tuple(targets.values())
+
+
+class _NodeStats:
+    __slots__ = ("outstanding", "ewma", "requests", "failovers")
+
+    def __init__(self) -> None:
+        self.outstanding = 0
+        self.ewma: float | None = None
+        self.requests = 0
+        self.failovers = 0
+
+
+class UpstreamLease:
+    """One request's claim on an upstream node; ``release`` is idempotent."""
+
+    __slots__ = ("_balancer", "base_url", "_released")
+
+    def __init__(self, balancer: UpstreamBalancer, base_url: str) -> None:
+        self._balancer = balancer
+        self.base_url = base_url
+        self._released = False
+
+    def observe(self, latency: float) -> None:
+        self._balancer._observe(self.base_url, latency)
+
+    def release(self, *, failed: bool = False) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._balancer._release(self.base_url, failed=failed)
+
+
+class UpstreamBalancer:
+    """Per-worker node selection for agents with several upstream targets.
+
+    ``least_outstanding`` picks the node with the fewest requests in flight per unit of weight;
+    ``ewma`` multiplies that by the node's smoothed time to first byte, so a slow node sheds load
+    before it piles up requests. Nodes whose circuit is open go last. Ties are broken at random.
+    """
+
+    def __init__(self, *, strategy: str, decay: float) -> None:
+        self._strategy = strategy if strategy in {STRATEGY_LEAST_OUTSTANDING, STRATEGY_EWMA} else STRATEGY_EWMA
+        self._decay = min(1.0, max(0.01, decay))
+        self._nodes: dict[str, _NodeStats] = {}
+        self._lock = threading.Lock()
+
+    def _node(self, base_url: str) -> _NodeStats:
+        node = self._nodes.get(base_url)
+        if node is None:
+            node = self._nodes.setdefault(base_url, _NodeStats())
+        return node
+
+    def _score(self, target: UpstreamTarget) -> float:
+        node = self._node(target.base_url)
+        load = (node.outstanding + 1) / target.weight
+        if self._strategy == STRATEGY_EWMA:
+            # Unmeasured nodes score 0 so they get sampled.
+            return load * (node.ewma or 0.0)
+        return load
+
+    def order(self, targets: tuple[UpstreamTarget, ...], *, sticky: str = "") -> list[UpstreamTarget]:
+        """Targets in the order to try them: the sticky node if healthy, then best score first."""
+        if len(targets) <= 1:
+            return list(targets)
+        health = get_upstream_health() if settings.UPSTREAM_BREAKER_ENABLED else None
+        healthy: list[UpstreamTarget] = []
+        tripped: list[UpstreamTarget] = []
+        for target in targets:
+            if health is not None and health.breaker(target.base_url).state == STATE_OPEN:
+                tripped.append(target)
+            else:
+                healthy.append(target)
+        with self._lock:
+            scored = [(self._score(target), random.random(), target) for target in healthy]
+        scored.sort(key=lambda item: (item[0], item[1]))
+        ordered = [item[2] for item in scored]
+        if sticky:
+            for index, target in enumerate(ordered):
+                if target.key == sticky:
+                    ordered.insert(0, ordered.pop(index))
+                    break
+        return ordered + tripped
+
+    def acquire(self, base_url: str) -> UpstreamLease:
+        with self._lock:
+            node = self._node(base_url)
+            node.outstanding += 1
+            node.requests += 1
+        return UpstreamLease(self, base_url)
+
+    def _observe(self, base_url: str, latency: float) -> None:
+        with self._lock:
+            node = self._node(base_url)
+            node.ewma = latency if node.ewma is None else node.ewma + self._decay * (latency - node.ewma)
+
+    def _release(self, base_url: str, *, failed: bool) -> None:
+        with self._lock:
+            node = self._node(base_url)
+            node.outstanding = max(0, node.outstanding - 1)
+            if failed:
+                node.failovers += 1
+                node.ewma = max((node.ewma or 0.0) * 2, _FAILURE_PENALTY_SECONDS)
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "base_url": base_url,
+                    "outstanding": node.outstanding,
+                    "ewma_ms": round((node.ewma or 0.0) * 1000, 1),
+                    "requests": node.requests,
+                    "failovers": node.failovers,
+                }
+                for base_url, node in sorted(self._nodes.items())
+            ]
+
+
+_balancer = UpstreamBalancer(
+    strategy=settings.CHAT_PROXY_BALANCER_STRATEGY,
+    decay=settings.CHAT_PROXY_BALANCER_EWMA_DECAY,
+)
+
+
+def get_upstream_balancer() -> UpstreamBalancer:
+    return _balancer
+
+
+__all__ = [
+    "STRATEGY_EWMA",
+    "STRATEGY_LEAST_OUTSTANDING",
+    "UpstreamBalancer",
+    "UpstreamLease",
+    "UpstreamTarget",
+    "get_upstream_balancer",
+    "normalize_upstream_targets",
+    "upstream_target_key",
+]
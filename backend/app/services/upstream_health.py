@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import deque
+
+import httpx
+
+from ..config import settings
+from .http_client import get_upstream_client, upstream_pool_key
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Failure-rate/latency circuit breaker for one upstream origin.
+
+    Outcomes land in a sliding window of the last ``window`` calls; a call recorded with
+    ``judge_latency`` (idempotent and asset requests, whose time to first byte does not include
+    generating a reply) counts as a failure when slower than ``slow_call_seconds``. The circuit
+    opens once the window holds at least ``min_calls`` outcomes and the failure rate reaches
+    ``failure_rate``, or after ``consecutive_failures`` failures in a row. After ``open_seconds``
+    one probe call is let through (half-open); its outcome closes or re-opens the circuit.
+
+    Active health checks of ``health_url`` never enter the window: a passing check moves an open
+    circuit to half-open early and a failing one keeps it open, but only live traffic opens it.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        *,
+        window: int,
+        min_calls: int,
+        failure_rate: float,
+        consecutive_failures: int,
+        slow_call_seconds: float,
+        open_seconds: float,
+    ) -> None:
+        self.base_url = base_url
+        self.health_url = ""
+        self._window: deque[bool] = deque(maxlen=max(1, window))
+        self._min_calls = max(1, min_calls)
+        self._failure_rate = min(1.0, max(0.0, failure_rate))
+        self._consecutive_limit = max(0, consecutive_failures)
+        self._slow_call_seconds = max(0.0, slow_call_seconds)
+        self._open_seconds = max(0.0, open_seconds)
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        self._probe_in_flight = False
+        self._total_calls = 0
+        self._total_failures = 0
+        self._rejected = 0
+        self._last_latency = 0.0
+        self._last_error = ""
+        self._last_check_at: float | None = None
+        self._last_check_ok: bool | None = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def _advance(self) -> None:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self._open_seconds:
+            self._state = STATE_HALF_OPEN
+            self._probe_in_flight = False
+
+    def _open(self) -> None:
+        self._state = STATE_OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def retry_after(self) -> int:
+        with self._lock:
+            if self._state != STATE_OPEN:
+                return 1
+            remaining = self._open_seconds - (time.monotonic() - self._opened_at)
+            return max(1, int(remaining + 0.999))
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            self._advance()
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record(
+        self, success: bool | None, latency: float = 0.0, *, error: str = "", judge_latency: bool = False
+    ) -> None:
+        """Record a call outcome; ``None`` releases a half-open probe without judging the upstream."""
+        with self._lock:
+            if success is None:
+                self._probe_in_flight = False
+                return
+            if success and judge_latency and self._slow_call_seconds and latency > self._slow_call_seconds:
+                success = False
+                error = error or f"slow call {latency:.1f}s"
+            self._total_calls += 1
+            self._last_latency = latency
+            self._window.append(success)
+            if success:
+                self._consecutive_failures = 0
+                if self._state == STATE_HALF_OPEN:
+                    self._state = STATE_CLOSED
+                    self._window.clear()
+                    self._window.append(True)
+                self._probe_in_flight = False
+                return
+            self._total_failures += 1
+            self._consecutive_failures += 1
+            self._last_error = error
+            if self._state == STATE_HALF_OPEN:
+                self._open()
+                return
+            if self._state != STATE_CLOSED:
+                return
+            failures = sum(1 for item in self._window if not item)
+            if len(self._window) >= self._min_calls and failures / len(self._window) >= self._failure_rate:
+                self._open()
+            elif self._consecutive_limit and self._consecutive_failures >= self._consecutive_limit:
+                self._open()
+
+    def record_health_check(self, ok: bool, latency: float, *, error: str = "") -> None:
+        with self._lock:
+            self._last_check_at = time.time()
+            self._last_check_ok = ok
+            if ok:
+                # A healthy probe lets live traffic test an open circuit without waiting out the timer.
+                if self._state == STATE_OPEN:
+                    self._state = STATE_HALF_OPEN
+                    self._probe_in_flight = False
+                return
+            self._last_error = error
+            if self._state == STATE_OPEN:
+                # Still down: hold live traffic back for another open period.
+                self._opened_at = time.monotonic()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._window.clear()
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._advance()
+            failures = sum(1 for item in self._window if not item)
+            return {
+                "base_url": self.base_url,
+                "state": self._state,
+                "window_calls": len(self._window),
+                "window_failure_rate": failures / len(self._window) if self._window else 0.0,
+                "consecutive_failures": self._consecutive_failures,
+                "total_calls": self._total_calls,
+                "total_failures": self._total_failures,
+                "rejected": self._rejected,
+                "last_latency_ms": round(self._last_latency * 1000, 1),
+                "last_error": self._last_error,
+                "last_check_at": self._last_check_at,
+                "last_check_ok": self._last_check_ok,
+                "health_url": self.health_url,
+            }
+
+
+class UpstreamHealthRegistry:
+    """Shared breakers keyed by upstream origin, used by the chat proxy and fit2cloud calls."""
+
+    def __init__(self) -> None:
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, base_url: str) -> CircuitBreaker:
+        key = upstream_pool_key(base_url)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    key,
+                    window=settings.UPSTREAM_BREAKER_WINDOW,
+                    min_calls=settings.UPSTREAM_BREAKER_MIN_CALLS,
+                    failure_rate=settings.UPSTREAM_BREAKER_FAILURE_RATE,
+                    consecutive_failures=settings.UPSTREAM_BREAKER_CONSECUTIVE_FAILURES,
+                    slow_call_seconds=settings.UPSTREAM_BREAKER_SLOW_CALL_SECONDS,
+                    open_seconds=settings.UPSTREAM_BREAKER_OPEN_SECONDS,
+                )
+                self._breakers[key] = breaker
+            return breaker
+
+    def breakers(self) -> list[CircuitBreaker]:
+        with self._lock:
+            return [self._breakers[key] for key in sorted(self._breakers)]
+
+    def snapshot(self) -> list[dict]:
+        return [breaker.snapshot() for breaker in self.breakers()]
+
+    def reset(self, base_url: str | None = None) -> None:
+        for breaker in self.breakers():
+            if base_url is None or breaker.base_url == upstream_pool_key(base_url):
+                breaker.reset()
+
+
+_registry = UpstreamHealthRegistry()
+
+
+def get_upstream_health() -> UpstreamHealthRegistry:
+    return _registry
+
+
+def upstream_circuit(base_url: str, *, health_path: str | None = None) -> CircuitBreaker | None:
+    """Breaker for the origin of ``base_url``.
+
+    Passing ``health_path`` ("" for UPSTREAM_HEALTH_CHECK_PATH) points the breaker's active checks
+    at that path under ``base_url``, so they hit the agent's API rather than the origin root.
+    """
+    if not settings.UPSTREAM_BREAKER_ENABLED or not base_url:
+        return None
+    breaker = _registry.breaker(base_url)
+    if health_path is not None:
+        path = health_path or settings.UPSTREAM_HEALTH_CHECK_PATH
+        if path:
+            breaker.health_url = f"{base_url.rstrip('/')}/{path.lstrip('/')}"
+    return breaker
+
+
+def is_upstream_failure_status(status_code: int) -> bool:
+    return status_code >= 500
+
+
+async def _check_upstream(breaker: CircuitBreaker) -> None:
+    client = get_upstream_client(breaker.base_url)
+    started = time.perf_counter()
+    try:
+        response = await client.get(
+            breaker.health_url,
+            timeout=max(0.5, settings.UPSTREAM_HEALTH_CHECK_TIMEOUT),
+        )
+        await response.aclose()
+    except httpx.HTTPError as exc:
+        breaker.record_health_check(False, time.perf_counter() - started, error=type(exc).__name__)
+        return
+    latency = time.perf_counter() - started
+    if is_upstream_failure_status(response.status_code):
+        breaker.record_health_check(False, latency, error=f"HTTP {response.status_code}")
+    else:
+        breaker.record_health_check(True, latency)
+
+
+async def run_upstream_health_checks() -> None:
+    interval = settings.UPSTREAM_HEALTH_CHECK_INTERVAL
+    while True:
+        await asyncio.sleep(interval)
+        breakers = [item for item in _registry.breakers() if item.health_url]
+        if breakers:
+            await asyncio.gather(*(_check_upstream(item) for item in breakers), return_exceptions=True)
+
+
+def start_upstream_health_checks() -> asyncio.Task | None:
+    if not settings.UPSTREAM_BREAKER_ENABLED or settings.UPSTREAM_HEALTH_CHECK_INTERVAL <= 0:
+        return None
+    return asyncio.create_task(run_upstream_health_checks(), name="upstream-health-checks")
+
+
+async def stop_upstream_health_checks(task: asyncio.Task | None) -> None:
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+__all__ = [
+    "CircuitBreaker",
+    "STATE_CLOSED",
+    "STATE_HALF_OPEN",
+    "STATE_OPEN",
+    "UpstreamHealthRegistry",
+    "get_upstream_health",
+    "is_upstream_failure_status",
+    "start_upstream_health_checks",
+    "stop_upstream_health_checks",
+    "upstream_circuit",
+]
@@ -0,0 +1,447 @@
+"""Load test for the chat proxy against a local fake fit2cloud upstream.
+
+Run from the backend directory::
+
+    uv run --group bench python -m benchmarks.chat_proxy_bench --requests 2000 --concurrency 64
+
+The harness starts a fake upstream on 127.0.0.1 (JSON, SSE, large static asset and slow
+endpoints), seeds agents, users and grants into a fresh SQLite database (or the database
+given with ``--database-url``), and drives concurrent requests through the real ASGI app.
+Each scenario reports RPS, p50/p95/p99 latency, traced memory per in-flight connection and
+database queries per request.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+UPSTREAM_TOKEN_PREFIX = "bench-token"
+LARGE_ASSET_BYTES = 2 * 1024 * 1024
+SSE_FRAMES = 32
+SLOW_DELAY_SECONDS = 0.2
+
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default="", help="Defaults to a temporary SQLite file")
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--upstream-port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--scenario", action="append", default=[], help="Run only the named scenarios")
+    parser.add_argument("--no-trace-memory", action="store_true", help="Skip tracemalloc for cleaner RPS")
+    parser.add_argument("--json", dest="json_path", default="", help="Also write results to this file")
+    return parser.parse_args(argv)
+
+
+# --- fake upstream -----------------------------------------------------------------------
+
+
+def _build_fake_upstream():
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import (
+        HTMLResponse,
+        JSONResponse,
+        Response,
+        StreamingResponse,
+    )
+    from starlette.routing import Route
+
+    large_asset = b"/* bench */" + b"x" * LARGE_ASSET_BYTES
+
+    async def chat_page(request: Request) -> Response:
+        token = request.path_params["token"]
+        return HTMLResponse(f"<html><body data-token='{token}'>chat</body></html>")
+
+    async def profile(request: Request) -> Response:
+        token = request.query_params.get("access_token") or UPSTREAM_TOKEN_PREFIX
+        return JSONResponse({"code": 200, "data": {"name": "bench", "access_token": token}})
+
+    async def chat_message(request: Request) -> Response:
+        body = await request.body()
+
+        async def frames():
+            for idx in range(SSE_FRAMES):
+                payload = json.dumps({"chunk": idx, "content": "token " * 8, "size": len(body)})
+                yield f"data: {payload}\n\n".encode()
+                await asyncio.sleep(0)
+
+        return StreamingResponse(frames(), media_type="text/event-stream")
+
+    async def static_asset(request: Request) -> Response:
+        return Response(
+            large_asset,
+            media_type="application/javascript",
+            headers={"cache-control": "public, max-age=300", "etag": '"bench-large-js"'},
+        )
+
+    async def token_profile(request: Request) -> Response:
+        # Only served under /chat/{token}/..., so the proxy has to fall back to this path style.
+        return JSONResponse({"code": 200, "data": {"token": request.path_params["token"]}})
+
+    async def slow(request: Request) -> Response:
+        await asyncio.sleep(SLOW_DELAY_SECONDS)
+        return JSONResponse({"code": 200, "data": "slow"})
+
+    return Starlette(
+        routes=[
+            Route("/chat/api/profile", profile),
+            Route("/chat/api/chat_message", chat_message, methods=["POST"]),
+            Route("/chat/api/slow", slow),
+            Route("/chat/assets/large.js", static_asset),
+            Route("/chat/{token}/api/application/profile", token_profile),
+            Route("/chat/{token}", chat_page),
+        ]
+    )
+
+
+class FakeUpstream:
+    """Runs the fake upstream with uvicorn on a background thread."""
+
+    def __init__(self, port: int) -> None:
+        import uvicorn
+
+        config = uvicorn.Config(
+            _build_fake_upstream(),
+            host="127.0.0.1",
+            port=port,
+            log_level="warning",
+            lifespan="off",
+        )
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="fake-upstream", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        sockets = [sock for server in self._server.servers for sock in server.sockets]
+        host, port = sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> FakeUpstream:
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake upstream did not start")
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+
+
+# --- database fixture --------------------------------------------------------------------
+
+
+@dataclass
+class Fixture:
+    proxy_ids: list[str]
+    tokens: list[str]
+
+
+async def _seed_database(args: argparse.Namespace, upstream_base_url: str) -> Fixture:
+    from sqlalchemy import delete
+
+    from app import models
+    from app.db import AsyncSessionLocal, Base, async_engine
+    from app.security import create_access_token
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    groups = [f"bench-group-{idx}" for idx in range(max(1, args.groups))]
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(models.Agent).where(models.Agent.id.like("bench-%")))
+        await db.execute(delete(models.User).where(models.User.account.like("bench-%")))
+        await db.execute(delete(models.PermissionGrant).where(models.PermissionGrant.subject_id == "bench"))
+        await db.execute(delete(models.UserRole).where(models.UserRole.role_name == "bench"))
+        await db.execute(delete(models.Role).where(models.Role.name == "bench"))
+        await db.commit()
+
+        db.add(models.Role(name="bench", description="benchmark users"))
+        db.add(
+            models.PermissionGrant(
+                subject_type="role",
+                subject_id="bench",
+                scope="menu",
+                resource_type="menu",
+                resource_id="agents",
+                action="view",
+            )
+        )
+        for group in groups:
+            db.add(
+                models.PermissionGrant(
+                    subject_type="role",
+                    subject_id="bench",
+                    scope="resource",
+                    resource_type="agent_group",
+                    resource_id=group,
+                    action="view",
+                )
+            )
+
+        proxy_ids: list[str] = []
+        for idx in range(max(1, args.agents)):
+            proxy_id = f"benchproxy{idx:05d}"
+            group = groups[idx % len(groups)]
+            db.add(
+                models.Agent(
+                    id=f"bench-agent-{idx:05d}",
+                    name=f"Bench agent {idx}",
+                    status="active",
+                    owner="bench",
+                    proxy_id=proxy_id,
+                    upstream_base_url=upstream_base_url,
+                    upstream_token=f"{UPSTREAM_TOKEN_PREFIX}-{idx:05d}",
+                    url=f"/chat/{proxy_id}",
+                    group_name=group,
+                    groups=[group],
+                    source_type="bench",
+                    is_synced=False,
+                )
+            )
+            proxy_ids.append(proxy_id)
+
+        users: list[models.User] = []
+        for idx in range(max(1, args.users)):
+            user = models.User(
+                account=f"bench-user-{idx:04d}",
+                username=f"bench-user-{idx:04d}",
+                email=f"bench-user-{idx:04d}@example.com",
+                password_hash="!",
+                role="bench",
+                status="active",
+            )
+            db.add(user)
+            users.append(user)
+        await db.flush()
+        for user in users:
+            db.add(models.UserRole(user_id=user.id, role_name="bench"))
+        await db.commit()
+        tokens = [create_access_token({"sub": str(user.id)}) for user in users]
+    return Fixture(proxy_ids=proxy_ids, tokens=tokens)
+
+
+# --- driver ------------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    method: str
+    path: str
+    body: bytes = b""
+    content_type: str = ""
+
+
+SCENARIOS = [
+    Scenario("json", "GET", "api/profile"),
+    Scenario("sse", "POST", "api/chat_message", b'{"message": "hello"}', "application/json"),
+    Scenario("static", "GET", "assets/large.js"),
+    Scenario("slow", "GET", "api/slow"),
+    Scenario("page", "GET", ""),
+    Scenario("fallback", "GET", "api/application/profile"),
+]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    requests: int
+    concurrency: int
+    errors: int
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    bytes_per_request: float
+    memory_per_connection_kb: float | None
+    db_queries_per_request: float
+    status_codes: dict[str, int] = field(default_factory=dict)
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *args, **kwargs) -> None:
+        self.count += 1
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[rank]
+
+
+async def _run_scenario(
+    client,
+    scenario: Scenario,
+    fixture: Fixture,
+    *,
+    total: int,
+    concurrency: int,
+    counter: QueryCounter,
+    trace_memory: bool,
+) -> ScenarioResult:
+    latencies: list[float] = []
+    status_codes: dict[str, int] = {}
+    received = 0
+    errors = 0
+    next_index = 0
+
+    async def worker() -> None:
+        nonlocal received, errors, next_index
+        while next_index < total:
+            idx = next_index
+            next_index += 1
+            proxy_id = fixture.proxy_ids[idx % len(fixture.proxy_ids)]
+            token = fixture.tokens[idx % len(fixture.tokens)]
+            headers = {"authorization": f"Bearer {token}"}
+            if scenario.content_type:
+                headers["content-type"] = scenario.content_type
+            path = f"/chat/{proxy_id}/{scenario.path}" if scenario.path else f"/chat/{proxy_id}"
+            started = time.perf_counter()
+            try:
+                async with client.stream(scenario.method, path, headers=headers, content=scenario.body) as response:
+                    async for chunk in response.aiter_raw():
+                        received += len(chunk)
+                    status = response.status_code
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+            if status >= 400:
+                errors += 1
+
+    queries_before = counter.count
+    if trace_memory:
+        tracemalloc.reset_peak()
+        baseline, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+    memory_per_connection = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        memory_per_connection = max(0, peak - baseline) / max(1, concurrency) / 1024
+
+    completed = max(1, len(latencies))
+    return ScenarioResult(
+        name=scenario.name,
+        requests=total,
+        concurrency=concurrency,
+        errors=errors,
+        rps=len(latencies) / elapsed if elapsed else 0.0,
+        p50_ms=_percentile(latencies, 50) * 1000,
+        p95_ms=_percentile(latencies, 95) * 1000,
+        p99_ms=_percentile(latencies, 99) * 1000,
+        bytes_per_request=received / completed,
+        memory_per_connection_kb=memory_per_connection,
+        db_queries_per_request=(counter.count - queries_before) / completed,
+        status_codes=status_codes,
+    )
+
+
+def _print_results(results: list[ScenarioResult]) -> None:
+    header = f"{'scenario':<10}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'KiB/conn':>10}{'q/req':>8}{'errors':>8}"
+    print(header)
+    print("-" * len(header))
+    for item in results:
+        memory = "-" if item.memory_per_connection_kb is None else f"{item.memory_per_connection_kb:.1f}"
+        print(
+            f"{item.name:<10}{item.rps:>10.1f}{item.p50_ms:>10.1f}{item.p95_ms:>10.1f}"
+            f"{item.p99_ms:>10.1f}{memory:>10}{item.db_queries_per_request:>8.2f}{item.errors:>8}"
+        )
+    latencies = [item.p50_ms for item in results]
+    if latencies:
+        print(f"\nmedian p50 across scenarios: {statistics.median(latencies):.1f} ms")
+
+
+async def _main(args: argparse.Namespace, upstream: FakeUpstream) -> list[ScenarioResult]:
+    import httpx
+    from sqlalchemy import event
+
+    from app.db import async_engine
+    from app.services.http_client import close_upstream_clients
+    from main import create_app
+
+    fixture = await _seed_database(args, upstream.base_url)
+    counter = QueryCounter()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", counter)
+
+    selected = [item for item in SCENARIOS if not args.scenario or item.name in args.scenario]
+    app = create_app()
+    transport = httpx.ASGITransport(app=app)
+    results: list[ScenarioResult] = []
+    trace_memory = not args.no_trace_memory
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench.local", timeout=60) as client:
+            for scenario in selected:
+                results.append(
+                    await _run_scenario(
+                        client,
+                        scenario,
+                        fixture,
+                        total=max(1, args.requests),
+                        concurrency=max(1, args.concurrency),
+                        counter=counter,
+                        trace_memory=trace_memory,
+                    )
+                )
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        event.remove(async_engine.sync_engine, "before_cursor_execute", counter)
+        await close_upstream_clients()
+        await async_engine.dispose()
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    workdir = tempfile.TemporaryDirectory(prefix="agent-ui-bench-")
+    database_url = args.database_url or f"sqlite+aiosqlite:///{Path(workdir.name) / 'bench.db'}"
+    # Settings are read at import time, so configure the app before importing it.
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("JWT_SECRET", "agent-ui-bench-secret")
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+    try:
+        with FakeUpstream(args.upstream_port) as upstream:
+            results = asyncio.run(_main(args, upstream))
+    finally:
+        workdir.cleanup()
+
+    _print_results(results)
+    if args.json_path:
+        Path(args.json_path).write_text(
+            json.dumps([asdict(item) for item in results], indent=2),
+            encoding="utf-8",
+        )
+    return 0 if all(item.errors == 0 for item in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
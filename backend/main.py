@@ -7,15 +7,38 @@ from starlette.concurrency import run_in_threadpool
 from app.api import register_routes
 from app.config import settings
 from app.migrations import ensure_schema
-from app.services.http_client import close_shared_async_client
+from app.services.admission import close_admission_controller
+from app.services.asset_cache import close_asset_cache
+from app.services.cache_epochs import (
+    start_cache_epoch_watcher,
+    stop_cache_epoch_watcher,
+)
+from app.services.chat_audit import start_chat_audit_flusher, stop_chat_audit_flusher
+from app.services.chat_usage import start_usage_flusher, stop_usage_flusher
+from app.services.http_client import close_shared_async_client, close_upstream_clients
+from app.services.upstream_health import (
+    start_upstream_health_checks,
+    stop_upstream_health_checks,
+)
 
 
 def create_app() -> FastAPI:
     @asynccontextmanager
     async def lifespan(_app: FastAPI):
         await run_in_threadpool(ensure_schema)
+        health_checks = start_upstream_health_checks()
+        audit_flusher = start_chat_audit_flusher()
+        usage_flusher = start_usage_flusher()
+        epoch_watcher = start_cache_epoch_watcher()
         yield
+        await stop_cache_epoch_watcher(epoch_watcher)
+        await stop_upstream_health_checks(health_checks)
+        await stop_chat_audit_flusher(audit_flusher)
+        await stop_usage_flusher(usage_flusher)
         await close_shared_async_client()
+        await close_upstream_clients()
+        await close_asset_cache()
+        await close_admission_controller()
 
     app = FastAPI(title="Agent-UI", lifespan=lifespan)
 
@@ -1,14 +1,45 @@
+import asyncio
 import json
+from datetime import UTC, datetime
 
 import httpx
+from fastapi.responses import StreamingResponse
 
 from app import models
+from app.api import chat_proxy
 from app.api.chat_proxy import (
+    _build_proxy_response,
     _build_upstream_paths,
+    _client_close_code,
+    _ReplayableRequestBody,
     _rewrite_payload_for_upstream,
     _rewrite_query_for_upstream,
+    _should_buffer_request_body,
     _should_try_fallback_path,
+    _TokenStreamRewriter,
+    _upstream_path_prefix,
+    _upstream_websocket_url,
 )
+from app.services import chat_audit, proxy_routes, upstream_health
+from app.services.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    AdmissionScope,
+    MemoryAdmissionBackend,
+)
+from app.services.chat_audit import ChatAuditLog
+from app.services.chat_usage import UsageAggregator, UsageTap
+from app.services.coalescing import RequestCoalescer, SharedResponse
+from app.services.hedging import HedgeBudget, HedgePolicy
+from app.services.http_client import WebSocketTracker
+from app.services.metrics import MetricsRegistry
+from app.services.proxy_routes import (
+    ProxyRoute,
+    ProxyRouteCache,
+    UpstreamPathPreferences,
+)
+from app.services.upstream_balancer import UpstreamBalancer, normalize_upstream_targets
+from app.services.upstream_health import CircuitBreaker
 
 
 class _RequestStub:
@@ -110,3 +141,669 @@ def test_should_not_try_fallback_path_for_json_success() -> None:
         json={"code": 200, "data": {}},
     )
     assert _should_try_fallback_path(response) is False
+
+
+def test_build_proxy_response_streams_sse_chunks() -> None:
+    agent = _agent()
+    frames = [b"data: hello\n\n", b"data: world\n\n"]
+
+    async def _stream():
+        for frame in frames:
+            yield frame
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=_stream())
+
+    async def _run() -> tuple[object, list[bytes], bool]:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(_handler)) as client:
+            upstream = await client.send(
+                client.build_request("GET", "https://mk-ee.fit2cloud.cn/chat/x"),
+                stream=True,
+            )
+            response = await _build_proxy_response(upstream, agent)
+            chunks = [chunk async for chunk in response.body_iterator]
+            return response, chunks, upstream.is_closed
+
+    response, chunks, upstream_closed = asyncio.run(_run())
+
+    assert isinstance(response, StreamingResponse)
+    assert chunks == frames
+    assert upstream_closed
+
+
+def test_proxy_route_snapshot_and_cache_invalidation() -> None:
+    agent = _agent()
+    agent.id = "agent-1"
+    agent.groups = ["ops", " ops ", "sales"]
+    route = ProxyRoute.from_agent(agent)
+    assert route.groups == ("ops", "sales")
+    assert route.group_name == "ops"
+
+    cache = ProxyRouteCache(max_entries=2, ttl=60.0, negative_ttl=60.0)
+    cache.put("proxy-123", route)
+    cache.put("missing", None)
+    assert cache.get("proxy-123") is route
+    assert cache.get("missing") is None
+    cache.put("proxy-456", route)
+    assert len(cache) == 2
+    cache.invalidate(["proxy-123"])
+    assert cache.get("proxy-123") is not route
+
+
+def test_agent_writes_from_another_process_clear_cached_routes(tmp_path) -> None:
+    from sqlalchemy import create_engine
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.orm import Session
+
+    from app.db import Base
+    from app.services.cache_epochs import CacheEpochWatcher
+
+    path = tmp_path / "epochs.db"
+    worker_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(
+        worker_engine,
+        tables=[models.Agent.__table__, models.AgentGroupMember.__table__, models.CacheEpoch.__table__],
+    )
+    with worker_engine.begin() as conn:
+        conn.execute(
+            models.Agent.__table__.insert(),
+            {"id": "agent-1", "name": "agent-1", "url": "", "proxy_id": "proxy-123"},
+        )
+
+    async def run() -> None:
+        api_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        watcher = CacheEpochWatcher(interval=1.0, engine=api_engine)
+        assert await watcher.poll() == []
+
+        cache = proxy_routes.get_proxy_route_cache()
+        route = ProxyRoute.from_agent(_agent())
+        cache.put("proxy-123", route)
+        assert await watcher.poll() == []
+        assert cache.get("proxy-123") is route
+
+        # The Celery sync worker commits through its own engine; only the shared counter reaches us.
+        # Nothing seeded cache_epochs: the worker's commit creates the counter row itself.
+        with Session(worker_engine) as session:
+            session.get(models.Agent, "agent-1").upstream_base_url = "https://moved.example.com"
+            session.commit()
+        assert "proxy_routes" in await watcher.poll()
+        assert cache.get("proxy-123") is proxy_routes._MISSING
+        assert await watcher.poll() == []
+
+        # Re-assigning the stored value writes nothing and must not bump the shared counter.
+        with Session(worker_engine) as session:
+            session.get(models.Agent, "agent-1").upstream_base_url = "https://moved.example.com"
+            session.commit()
+        assert await watcher.poll() == []
+        await api_engine.dispose()
+
+    asyncio.run(run())
+    worker_engine.dispose()
+
+
+def test_upstream_path_preferences_learn_and_reprobe(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(proxy_routes.time, "monotonic", lambda: now[0])
+    prefs = UpstreamPathPreferences(max_entries=8, reprobe_interval=60.0)
+    prefix = _upstream_path_prefix(["/chat/api/profile", "/chat/token-abc/api/profile"])
+    assert prefix == "api"
+    assert prefs.order("proxy-123", prefix, 2) == [0, 1]
+
+    prefs.record("proxy-123", prefix, 1)
+    assert prefs.order("proxy-123", prefix, 2) == [1, 0]
+    assert prefs.order("proxy-456", prefix, 2) == [0, 1]
+
+    now[0] += 30.0
+    prefs.record("proxy-123", prefix, 1)
+    now[0] += 31.0
+    assert prefs.order("proxy-123", prefix, 2) == [0, 1]
+    assert prefs.order("proxy-123", prefix, 2) == [1, 0]
+
+    prefs.record("proxy-123", prefix, 0)
+    assert prefs.order("proxy-123", prefix, 2) == [0, 1]
+
+
+class _HeadersStub:
+    def __init__(self, headers: dict[str, str]) -> None:
+        self.headers = headers
+
+
+def test_should_buffer_request_body_only_for_rewritable_payloads() -> None:
+    assert _should_buffer_request_body(_HeadersStub({}))
+    assert _should_buffer_request_body(
+        _HeadersStub({"content-type": "application/json", "content-length": "50000000"})
+    )
+    assert _should_buffer_request_body(_HeadersStub({"content-type": "text/plain", "content-length": "12"}))
+    assert not _should_buffer_request_body(
+        _HeadersStub({"content-type": "text/plain", "content-length": "50000000"})
+    )
+    assert not _should_buffer_request_body(
+        _HeadersStub({"content-type": "multipart/form-data; boundary=x", "content-length": "12"})
+    )
+
+
+def test_replayable_request_body_resends_spooled_chunks(monkeypatch) -> None:
+    async def source():
+        for chunk in (b"part-1,", b"part-2,", b"part-3"):
+            yield chunk
+
+    async def collect(stream) -> bytes:
+        return b"".join([chunk async for chunk in stream])
+
+    async def run() -> tuple[bytes, bytes]:
+        body = _ReplayableRequestBody(source(), replayable=True)
+        first = body.attempt()
+        head = await first.__anext__()
+        await first.aclose()
+        replayed = await collect(body.attempt())
+        body.close()
+        return head, replayed
+
+    head, replayed = asyncio.run(run())
+    assert head == b"part-1,"
+    assert replayed == b"part-1,part-2,part-3"
+
+    # Past the in-memory limit the spool is a file, written and read in worker threads.
+    monkeypatch.setattr(chat_proxy.settings, "CHAT_PROXY_BODY_SPOOL_BYTES", 8)
+    head, replayed = asyncio.run(run())
+    assert head == b"part-1,"
+    assert replayed == b"part-1,part-2,part-3"
+
+
+def test_token_stream_rewriter_handles_split_tokens() -> None:
+    rewriter = _TokenStreamRewriter("token-abc", "proxy-123")
+    chunks = [b'data: {"url": "/chat/tok', b'en-abc/x"}\n\n', b"data: token-", b"ab", b"c\n\n", b"tok"]
+    output = [rewriter.feed(chunk) for chunk in chunks]
+    output.append(rewriter.flush())
+    assert b"".join(output) == b'data: {"url": "/chat/proxy-123/x"}\n\ndata: proxy-123\n\ntok'
+    # Frame terminators are not held back waiting for more data.
+    assert output[1].endswith(b"\n\n")
+    assert output[4] == b"proxy-123\n\n"
+
+
+def test_upstream_websocket_url_and_per_agent_tracking() -> None:
+    agent = _agent()
+    assert (
+        _upstream_websocket_url(agent, "/chat/token-abc/ws", "a=1")
+        == "wss://mk-ee.fit2cloud.cn/chat/token-abc/ws?a=1"
+    )
+
+    tracker = WebSocketTracker()
+    assert tracker.try_acquire("agent-1", limit=2)
+    assert tracker.try_acquire("agent-1", limit=2)
+    assert not tracker.try_acquire("agent-1", limit=2)
+    tracker.release("agent-1")
+    assert tracker.stats() == [{"agent_id": "agent-1", "open": 1}]
+    tracker.release("agent-1")
+    assert tracker.stats() == []
+
+
+def test_client_close_code_never_relays_reserved_codes() -> None:
+    assert _client_close_code(None) == 1000
+    assert _client_close_code(1005) == 1000
+    assert _client_close_code(1001) == 1001
+    assert _client_close_code(4000) == 4000
+    assert _client_close_code(1006) == 1014
+    assert _client_close_code(1015) == 1014
+    assert _client_close_code(2000) == 1014
+
+
+def test_asset_cache_stores_completed_bodies_and_evicts_lru(tmp_path) -> None:
+    from app.services.asset_cache import (
+        AssetCache,
+        freshness_lifetime,
+        is_cacheable_asset_request,
+    )
+
+    assert is_cacheable_asset_request("GET", "/chat/assets/index.js", {})
+    assert not is_cacheable_asset_request("GET", "/chat/api/application/profile", {})
+    assert not is_cacheable_asset_request("POST", "/chat/assets/index.js", {})
+    assert freshness_lifetime({"cache-control": "public, max-age=60"}) == 60.0
+    assert freshness_lifetime({"cache-control": "private, max-age=60"}) is None
+    assert freshness_lifetime({"etag": '"v1"', "set-cookie": "a=b"}) is None
+
+    cache = AssetCache(directory=str(tmp_path), max_bytes=10, max_entry_bytes=8)
+
+    async def body(*chunks: bytes):
+        for chunk in chunks:
+            yield chunk
+
+    async def drain(stream) -> bytes:
+        return b"".join([chunk async for chunk in stream])
+
+    async def run() -> None:
+        assert await drain(cache.tee("a", {"ETag": '"v1"'}, 60.0, body(b"abc", b"def"))) == b"abcdef"
+        assert await drain(cache.tee("big", {}, 60.0, body(b"123456789"))) == b"123456789"
+        await drain(cache.tee("b", {}, 60.0, body(b"ghijk")))
+
+        async def broken():
+            yield b"xy"
+            raise ConnectionError("upstream reset")
+
+        try:
+            await drain(cache.tee("c", {}, 60.0, broken()))
+        except ConnectionError:
+            pass
+
+    asyncio.run(run())
+    assert cache.lookup("c") is None
+    assert not list(tmp_path.glob("*/.*.part"))
+    assert cache.lookup("big") is None
+    assert cache.lookup("a") is None
+    entry = cache.lookup("b")
+    assert entry is not None and entry.is_fresh()
+
+    async def read(entry) -> bytes | None:
+        handle = await cache.open(entry)
+        if handle is None:
+            return None
+        async with handle:
+            return await handle.read()
+
+    assert asyncio.run(read(entry)) == b"ghijk"
+    entry.path.unlink()
+    assert asyncio.run(read(entry)) is None  # a vanished file drops the entry
+    assert cache.lookup("b") is None
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_compression_negotiation_and_streaming_gzip() -> None:
+    import zlib
+
+    from app.services.compression import (
+        StreamEncoder,
+        accepted_encodings,
+        negotiate_encoding,
+    )
+
+    assert accepted_encodings("gzip;q=0, br;q=0.5, deflate") == {"br", "deflate"}
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("identity") == "identity"
+
+    encoder = StreamEncoder("gzip")
+    first = encoder.encode(b"data: one\n\n")
+    decoder = zlib.decompressobj(31)
+    # Each chunk is sync-flushed, so a frame can be decoded before the stream ends.
+    assert decoder.decompress(first) == b"data: one\n\n"
+    rest = encoder.encode(b"data: two\n\n") + encoder.finish()
+    assert decoder.decompress(rest) == b"data: two\n\n"
+
+
+def test_circuit_breaker_opens_probes_and_closes(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(upstream_health.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(
+        "https://mk-ee.fit2cloud.cn",
+        window=4,
+        min_calls=4,
+        failure_rate=0.5,
+        consecutive_failures=0,
+        slow_call_seconds=5.0,
+        open_seconds=30.0,
+    )
+    breaker.record(True, 0.1)
+    breaker.record(True, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == "closed"
+    breaker.record(True, 6.0)  # a slow chat completion is not judged by its latency
+    assert breaker.state == "closed"
+    breaker.record(True, 6.0, judge_latency=True)  # a slow idempotent call counts as a failure
+    assert breaker.state == "open"
+    assert not breaker.allow_request()
+    assert breaker.retry_after() == 30
+
+    now[0] += 31.0
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # only one half-open probe at a time
+    breaker.record(False, 0.1)
+    assert breaker.state == "open"
+
+    now[0] += 20.0
+    breaker.record_health_check(False, 0.05, error="HTTP 503")
+    now[0] += 20.0
+    assert breaker.state == "open"  # the failed check restarted the open period
+
+    breaker.record_health_check(True, 0.05)
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    breaker.record(True, 0.1)
+    assert breaker.state == "closed"
+    assert breaker.snapshot()["window_calls"] == 1
+
+    # Probes never count towards the failure rate of a closed circuit.
+    for _ in range(10):
+        breaker.record_health_check(False, 0.05, error="HTTP 404")
+    assert breaker.state == "closed"
+    assert breaker.snapshot()["window_calls"] == 1
+
+
+def test_health_checks_use_the_configured_path(monkeypatch) -> None:
+    monkeypatch.setattr(upstream_health.settings, "UPSTREAM_BREAKER_ENABLED", True)
+    monkeypatch.setattr(upstream_health.settings, "UPSTREAM_HEALTH_CHECK_PATH", "")
+    monkeypatch.setattr(upstream_health, "_registry", upstream_health.UpstreamHealthRegistry())
+
+    breaker = upstream_health.upstream_circuit("http://llm-a:8000/api/v1/", health_path="")
+    assert breaker.health_url == ""  # no path configured: the origin is not probed
+    (target,) = normalize_upstream_targets(
+        "http://llm-a:8000/api/v1", [{"base_url": "http://llm-a:8000/api/v1", "health_path": "/health"}]
+    )
+    upstream_health.upstream_circuit(target.base_url, health_path=target.health_path)
+    assert breaker.health_url == "http://llm-a:8000/api/v1/health"
+
+    monkeypatch.setattr(upstream_health.settings, "UPSTREAM_HEALTH_CHECK_PATH", "/ping")
+    other = upstream_health.upstream_circuit("http://llm-b:8000/base", health_path="")
+    assert other.health_url == "http://llm-b:8000/base/ping"
+
+
+def test_admission_controller_limits_rate_and_in_flight() -> None:
+    async def scenario() -> None:
+        controller = AdmissionController(MemoryAdmissionBackend(), max_wait=0.2)
+        user = AdmissionScope(name="user", key="user:1", rate=1.0, burst=2, status_code=429)
+        agent = AdmissionScope(name="agent", key="agent:a", max_in_flight=1, status_code=503)
+
+        first = await controller.admit([user, agent])
+        waiting = asyncio.create_task(controller.admit([user, agent]))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        first.release()
+        second = await waiting
+        second.release()
+
+        try:
+            await controller.admit([user])
+        except AdmissionRejected as exc:
+            assert exc.status_code == 429
+            assert exc.retry_after >= 1
+        else:
+            raise AssertionError("expected the token bucket to be empty")
+
+        held = await controller.admit([agent])
+        try:
+            await controller.admit([agent])
+        except AdmissionRejected as exc:
+            assert exc.status_code == 503
+        else:
+            raise AssertionError("expected the in-flight cap to reject")
+        held.release()
+        held.release()
+        assert controller.backend.in_flight("agent:a") == 0
+
+    asyncio.run(scenario())
+
+
+def test_admission_rejected_for_capacity_keeps_rate_tokens() -> None:
+    async def scenario() -> None:
+        controller = AdmissionController(MemoryAdmissionBackend(), max_wait=0.05)
+        user = AdmissionScope(name="user", key="user:1", rate=0.001, burst=2, status_code=429)
+        agent = AdmissionScope(name="agent", key="agent:a", max_in_flight=1, status_code=503)
+
+        held = await controller.admit([user, agent])
+        for _ in range(3):
+            try:
+                await controller.admit([user, agent])
+            except AdmissionRejected as exc:
+                assert exc.status_code == 503
+            else:
+                raise AssertionError("expected the in-flight cap to reject")
+        held.release()
+        # The rejected attempts spent nothing: the second token is still there.
+        (await controller.admit([user, agent])).release()
+        assert controller.backend.in_flight("agent:a") == 0
+
+    asyncio.run(scenario())
+
+
+def test_memory_admission_backend_drops_refilled_buckets() -> None:
+    async def scenario() -> None:
+        backend = MemoryAdmissionBackend(sweep_interval=0)
+        fast = AdmissionScope(name="user", key="user:1", rate=1000.0, burst=2)
+        slow = AdmissionScope(name="user", key="user:2", rate=0.001, burst=2)
+
+        assert await backend.take_tokens([fast, slow]) == (None, 0.0)
+        assert set(backend._buckets) == {"user:1", "user:2"}
+        await asyncio.sleep(0.01)
+        await backend.take_tokens([])
+        # user:1 refilled and is forgotten; user:2 still owes tokens and must be kept.
+        assert set(backend._buckets) == {"user:2"}
+
+    asyncio.run(scenario())
+
+
+def test_request_coalescer_shares_one_flight() -> None:
+    async def scenario() -> None:
+        coalescer = RequestCoalescer()
+        leader = coalescer.join("key")
+        followers = [coalescer.join("key") for _ in range(3)]
+        assert leader.leader and not any(item.leader for item in followers)
+        waits = [asyncio.create_task(item.wait(1.0)) for item in followers]
+        await asyncio.sleep(0)
+        shared = SharedResponse(200, (("content-type", "application/json"),), b'{"ok": true}')
+        leader.publish(shared)
+        results = await asyncio.gather(*waits)
+        assert all(item is shared for item in results)
+        response = results[0].to_response()
+        assert response.is_stream_consumed and response.json() == {"ok": True}
+        assert coalescer.coalesced == 3 and len(coalescer) == 0
+
+        second = coalescer.join("key")
+        follower = coalescer.join("key")
+        second.finish()
+        assert await follower.wait(1.0) is None
+
+    asyncio.run(scenario())
+
+
+def test_metrics_registry_renders_prometheus_text() -> None:
+    registry = MetricsRegistry()
+    latency = registry.histogram("proxy_seconds", "Latency.", ("agent", "status"), buckets=(0.1, 1.0))
+    fallbacks = registry.counter("fallbacks_total", "Fallbacks.", ("agent",))
+    series = latency.labels("proxy-123", "200")
+    series.observe(0.05)
+    series.observe(0.5)
+    series.observe(5.0)
+    fallbacks.labels('a"b').inc()
+
+    text = registry.render()
+    assert '# TYPE proxy_seconds histogram' in text
+    assert 'proxy_seconds_bucket{agent="proxy-123",status="200",le="0.1"} 1' in text
+    assert 'proxy_seconds_bucket{agent="proxy-123",status="200",le="1"} 2' in text
+    assert 'proxy_seconds_bucket{agent="proxy-123",status="200",le="+Inf"} 3' in text
+    assert 'proxy_seconds_count{agent="proxy-123",status="200"} 3' in text
+    assert 'fallbacks_total{agent="a\\"b"} 1' in text
+    assert latency.labels("proxy-123", "200") is series
+
+
+def test_metrics_endpoint_requires_a_token(monkeypatch) -> None:
+    from fastapi import HTTPException
+    from starlette.requests import Request
+
+    from app.api import metrics as metrics_api
+
+    def scrape(authorization: str | None = None) -> int:
+        headers = [(b"authorization", authorization.encode())] if authorization else []
+        request = Request({"type": "http", "method": "GET", "path": "/metrics", "headers": headers})
+        try:
+            return metrics_api.metrics(request).status_code
+        except HTTPException as exc:
+            return exc.status_code
+
+    monkeypatch.setattr(metrics_api.settings, "METRICS_ENABLED", True)
+    monkeypatch.setattr(metrics_api.settings, "METRICS_TOKEN", "")
+    assert scrape() == 404
+    monkeypatch.setattr(metrics_api.settings, "METRICS_TOKEN", "s3cret")
+    assert scrape() == 401
+    assert scrape("Bearer wrong") == 401
+    assert scrape("Bearer s3cret") == 200
+
+
+def test_chat_audit_log_drops_oldest_when_full() -> None:
+    audit_log = ChatAuditLog(capacity=3, batch_size=2, flush_interval=1.0)
+    for index in range(5):
+        audit_log.record(
+            user_id=index,
+            agent_id="agent-1",
+            proxy_id="proxy-123",
+            transport="http",
+            method="GET",
+            path="/chat/proxy-123/" + "x" * 600,
+            status_code=200,
+            bytes_sent=10,
+            duration=0.25,
+        )
+    assert len(audit_log) == 3 and audit_log.dropped == 2
+
+    batch = [dict(zip(chat_audit._COLUMNS, record)) for record in audit_log._drain()]
+    assert [row["user_id"] for row in batch] == [2, 3]
+    assert batch[0]["duration_ms"] == 250 and len(batch[0]["path"]) == 512
+    assert len(audit_log) == 1
+
+
+def test_chat_audit_log_requeues_a_failed_batch(monkeypatch) -> None:
+    class _DownEngine:
+        def begin(self):
+            raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(chat_audit, "async_engine", _DownEngine())
+    audit_log = ChatAuditLog(capacity=3, batch_size=2, flush_interval=1.0)
+
+    def record(user_id: int) -> None:
+        audit_log.record(
+            user_id=user_id,
+            agent_id="agent-1",
+            proxy_id="proxy-123",
+            transport="http",
+            method="GET",
+            path="/chat/proxy-123/",
+            status_code=200,
+            bytes_sent=10,
+            duration=0.1,
+        )
+
+    for user_id in range(3):
+        record(user_id)
+    assert asyncio.run(audit_log.flush()) == 0
+    assert [item[1] for item in audit_log._buffer] == [0, 1, 2]
+    assert audit_log.dropped == 0
+
+    # A record arriving while the batch is out leaves room for only one of the two failed rows.
+    batch = audit_log._drain()
+    record(3)
+    audit_log._requeue(batch)
+    assert [item[1] for item in audit_log._buffer] == [1, 2, 3]
+    assert audit_log.dropped == 1
+
+
+def test_usage_tap_reads_split_sse_frames() -> None:
+    aggregator = UsageAggregator(max_keys=10, flush_interval=60.0)
+    tap = UsageTap(aggregator, 7, "agent-1", max_line_bytes=1024)
+    frames = (
+        b'data: {"content": "hi", "usage": {"prompt_tokens": 12, "completion_tokens": 3}}\n\n'
+        b'data: {"content": "' + b"x" * 2048 + b'", "completion_tokens": 99}\n\n'
+        b'data: {"is_end": true, "usage": {"prompt_tokens": 12, "completion_tokens": 40, "total_tokens": 52}}\n\n'
+    )
+    for index in range(0, len(frames), 7):
+        tap.feed(frames[index : index + 7])
+    tap.finish()
+    tap.finish()
+
+    ((key, counts),) = aggregator.drain().items()
+    assert key[:2] == (7, "agent-1") and key[2].second == 0
+    # The oversized middle frame is skipped rather than buffered.
+    assert counts == [1, 12, 40, 52]
+
+    json_tap = UsageTap(aggregator, 7, "agent-1", max_line_bytes=1024)
+    json_tap.feed(b'{"data": {"message_tokens": 5, "answer_tokens": 6}}')
+    json_tap.finish()
+    assert list(aggregator.drain().values()) == [[1, 5, 6, 11]]
+
+
+def test_usage_aggregator_restore_merges_without_recounting_tokens() -> None:
+    from app.services import chat_usage
+
+    aggregator = UsageAggregator(max_keys=2, flush_interval=60.0)
+    minute = datetime(2026, 1, 1, 12, 30, tzinfo=UTC)
+    aggregator.add(7, "agent-1", prompt_tokens=10, completion_tokens=5, total_tokens=15, at=minute)
+    failed = aggregator.drain()
+    aggregator.add(7, "agent-1", prompt_tokens=1, completion_tokens=1, total_tokens=2, at=minute)
+    aggregator.add(8, "agent-1", at=minute)
+    prompt_tokens = chat_usage._TOKENS.labels("prompt").value
+
+    aggregator._restore(failed)
+    aggregator._restore({(9, "agent-1", minute): [1, 0, 0, 0]})
+
+    assert aggregator.drain() == {
+        (7, "agent-1", minute): [2, 11, 6, 17],
+        (8, "agent-1", minute): [1, 0, 0, 0],
+    }
+    assert aggregator.dropped == 1
+    assert chat_usage._TOKENS.labels("prompt").value == prompt_tokens
+
+
+def test_upstream_balancer_prefers_idle_fast_and_sticky_nodes(monkeypatch) -> None:
+    monkeypatch.setattr(upstream_health.settings, "UPSTREAM_BREAKER_ENABLED", False)
+    targets = normalize_upstream_targets(
+        "http://node-a/",
+        [{"base_url": "http://node-b", "weight": 2}, {"base_url": "http://node-a", "weight": 1}, {"base_url": ""}],
+    )
+    assert [(item.base_url, item.weight) for item in targets] == [("http://node-b", 2), ("http://node-a", 1)]
+    node_b, node_a = targets
+
+    balancer = UpstreamBalancer(strategy="least_outstanding", decay=0.5)
+    # Idle: the heavier node wins; once it carries two requests the other one does.
+    assert balancer.order(targets)[0] == node_b
+    leases = [balancer.acquire(node_b.base_url), balancer.acquire(node_b.base_url)]
+    assert balancer.order(targets)[0] == node_a
+    assert balancer.order(targets, sticky=node_b.key)[0] == node_b
+    for lease in leases:
+        lease.release()
+        lease.release()
+    assert all(item["outstanding"] == 0 for item in balancer.snapshot())
+
+    ewma = UpstreamBalancer(strategy="ewma", decay=0.5)
+    ewma.acquire(node_a.base_url).observe(0.01)
+    ewma.acquire(node_b.base_url).observe(0.5)
+    assert ewma.order(targets)[0] == node_a
+    ewma.acquire(node_a.base_url).release(failed=True)
+    assert ewma.order(targets)[0] == node_b
+
+
+def test_hedged_request_races_a_copy_within_budget(monkeypatch) -> None:
+    budget = HedgeBudget(ratio=0.5, burst=1)
+    policy = HedgePolicy(
+        enabled=True, quantile=0.95, window=20, min_samples=4, min_delay=0.01, budget=budget
+    )
+    monkeypatch.setattr(chat_proxy, "get_hedge_policy", lambda: policy)
+    assert policy.delay("proxy-123", "POST") is None
+    for latency in (0.01, 0.02, 0.03, 0.2):
+        policy.observe("proxy-123", latency)
+    assert policy.delay("proxy-123", "GET") == 0.2
+    assert policy.delay("proxy-123", "GET") == 0.2  # two requests earned one hedge
+
+    calls: list[int] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(len(calls))
+        if len(calls) == 1:
+            await asyncio.sleep(1.0)
+            return httpx.Response(200, text="slow")
+        return httpx.Response(200, text="fast")
+
+    async def scenario() -> tuple[str, bool, str]:
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            route = ProxyRoute("agent-1", "proxy-123", "http://node-a", "token", "active", False)
+
+            def build(target_client: httpx.AsyncClient, target: ProxyRoute) -> httpx.Request:
+                return target_client.build_request("GET", f"{target.upstream_base_url}/chat/api/profile")
+
+            response, hedged = await chat_proxy._send_hedged(build, client, route, None, [], 0.05)
+            await response.aread()
+            # The budget is spent, so the next slow request just waits for its answer.
+            calls.clear()
+            calls.append(-1)
+            second, _ = await chat_proxy._send_hedged(build, client, route, None, [], 0.01)
+            await second.aread()
+            return response.text, hedged is not None, second.text
+
+    assert asyncio.run(scenario()) == ("fast", True, "fast")
+    assert not budget.try_spend()
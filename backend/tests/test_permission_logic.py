@@ -86,3 +86,268 @@ def test_agent_group_permission_allows_group_members() -> None:
     assert can_view_agent(access, "agent-x", ["ops"])
     assert not can_view_agent(access, "agent-x", ["sales"])
 
+
+
+def test_permission_decision_cache_clears_after_grant_commit() -> None:
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from app.db import Base
+    from app.permissions.decision_cache import get_permission_decision_cache
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[models.PermissionGrant.__table__])
+    cache = get_permission_decision_cache()
+    cache.put("token-1", "agent-1", "chat", 7)
+    assert cache.get("token-1", "agent-1", "chat") == 7
+
+    with Session(engine) as session:
+        session.add(
+            _grant(scope="resource", resource_type="agent", resource_id="agent-1", action="view")
+        )
+        session.flush()
+        assert cache.get("token-1", "agent-1", "chat") == 7
+        session.commit()
+    assert cache.get("token-1", "agent-1", "chat") is None
+
+
+def test_permission_revocation_in_another_process_evicts_cached_decisions_and_index(tmp_path) -> None:
+    import asyncio
+
+    from sqlalchemy import create_engine, delete
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.orm import Session
+
+    from app.db import Base
+    from app.permissions.decision_cache import get_permission_decision_cache
+    from app.permissions.index import current_permission_epoch
+    from app.services.cache_epochs import CacheEpochWatcher
+
+    path = tmp_path / "epochs.db"
+    other_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(
+        other_engine, tables=[models.PermissionGrant.__table__, models.CacheEpoch.__table__]
+    )
+    with Session(other_engine) as session:
+        session.add(_grant(scope="resource", resource_type="agent", resource_id="agent-1", action="view"))
+        session.commit()
+    cache = get_permission_decision_cache()
+
+    async def run() -> None:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        watcher = CacheEpochWatcher(interval=1.0, engine=engine)
+        await watcher.poll()
+
+        with Session(other_engine) as session:
+            session.execute(delete(models.PermissionGrant))
+            session.commit()
+        # This test runs in one process, so the commit above also cleared the cache locally;
+        # cache the decision again to stand in for a worker that did not see the commit.
+        cache.put("token-1", "agent-1", "chat", 7)
+        assert cache.get("token-1", "agent-1", "chat") == 7
+        epoch = current_permission_epoch()
+        changed = await watcher.poll()
+        assert {"permission_decisions", "permission_index"} <= set(changed)
+        assert cache.get("token-1", "agent-1", "chat") is None
+        # Compiled index entries stamped with the old epoch are ignored from now on.
+        assert current_permission_epoch() > epoch
+        await engine.dispose()
+
+    asyncio.run(run())
+    other_engine.dispose()
+
+
+def test_permission_index_serves_checks_without_queries_until_a_grant_commit() -> None:
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import Session
+
+    from app.db import Base
+    from app.permissions.index import current_permission_epoch, get_permission_index
+    from app.permissions.permissions import get_user_access
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(
+        engine,
+        tables=[models.User.__table__, models.UserRole.__table__, models.PermissionGrant.__table__],
+    )
+    get_permission_index().clear()
+    with Session(engine) as session:
+        user = models.User(account="u1", username="u1", email="u1@example.com", password_hash="x")
+        session.add(user)
+        session.flush()
+        session.add(models.UserRole(user_id=user.id, role_name="user"))
+        session.add(_grant(scope="menu", resource_type="menu", resource_id="agents", action="view"))
+        session.commit()
+        user_id = user.id
+
+    statements: list[str] = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def menus(*, expect_queries: int) -> set[str]:
+        statements.clear()
+        with Session(engine) as session:
+            user = session.get(models.User, user_id)
+            statements.clear()
+            access = get_user_access(session, user)
+            visible = {menu for menu in ("agents", "admin") if can_view_menu(access, menu)}
+        assert len(statements) == expect_queries
+        return visible
+
+    assert menus(expect_queries=2) == {"agents"}
+    assert menus(expect_queries=0) == {"agents"}
+
+    epoch = current_permission_epoch()
+    with Session(engine) as session:
+        session.add(_grant(scope="menu", resource_type="menu", resource_id="admin", action="view"))
+        session.commit()
+    assert current_permission_epoch() > epoch
+    assert menus(expect_queries=2) == {"agents", "admin"}
+    assert menus(expect_queries=0) == {"agents", "admin"}
+
+
+def test_batch_agent_visibility_matches_per_agent_checks() -> None:
+    from app.permissions.engine import ResourceBatch, access_allows_many
+
+    agent_ids = [f"agent-{index}" for index in range(40)]
+    agent_groups = [["ops"] if index % 3 == 0 else ["sales"] if index % 5 == 0 else [] for index in range(40)]
+    batch = ResourceBatch(agent_ids, agent_groups)
+    grant_sets = [
+        [],
+        [_grant(scope="resource", resource_type="agent_group", resource_id="ops", action="view")],
+        [
+            _grant(scope="resource", resource_type="agent", resource_id="agent-7", action="manage"),
+            _grant(scope="resource", resource_type="agent_group", resource_id="sales", action="edit"),
+        ],
+        [_grant(scope="resource", resource_type="agent_group", resource_id=None, action="view")],
+    ]
+    for grants in grant_sets:
+        access = build_view_access(grants)
+        mask = access_allows_many(access, batch, action="view", scope="resource", resource_type="agent")
+        expected = [
+            agent_id
+            for agent_id, groups in zip(agent_ids, agent_groups)
+            if can_view_agent(access, agent_id, groups)
+        ]
+        assert batch.select(agent_ids, mask) == expected
+
+
+def test_agent_group_members_follow_agent_writes() -> None:
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+
+    from app.db import Base
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[models.Agent.__table__, models.AgentGroupMember.__table__])
+    member = models.AgentGroupMember
+
+    def memberships(session: Session) -> list[tuple[str, str]]:
+        rows = session.execute(select(member.agent_id, member.group_name).order_by(member.agent_id, member.position))
+        return [tuple(row) for row in rows]
+
+    with Session(engine) as session:
+        session.add(models.Agent(id="a1", name="a1", url="", groups=["ops", " sales", "ops"]))
+        session.add(models.Agent(id="a2", name="a2", url="", groups=[], group_name="legacy"))
+        session.commit()
+        assert memberships(session) == [("a1", "ops"), ("a1", "sales"), ("a2", "legacy")]
+
+        agent = session.get(models.Agent, "a1")
+        agent.groups = ["sales"]
+        session.commit()
+        assert memberships(session) == [("a1", "sales"), ("a2", "legacy")]
+
+        session.delete(session.get(models.Agent, "a2"))
+        session.commit()
+        assert memberships(session) == [("a1", "sales")]
+
+
+def test_effective_resources_page_symbolic_grants_like_per_agent_checks() -> None:
+    import asyncio
+
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import StaticPool
+
+    from app.db import Base
+    from app.permissions.permissions import effective_resources_async
+
+    agent_ids = [f"agent-{index:02d}" for index in range(12)]
+    agent_groups = [["ops"] if index % 3 == 0 else ["sales"] if index % 4 == 0 else [] for index in range(12)]
+    grant_sets = [
+        [
+            _grant(scope="resource", resource_type="agent", resource_id="agent-05", action="manage"),
+            _grant(scope="resource", resource_type="agent_group", resource_id="ops", action="view"),
+        ],
+        [_grant(scope="resource", resource_type="agent_group", resource_id=None, action="edit")],
+        [],
+    ]
+
+    async def run() -> None:
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(
+                lambda sync_conn: Base.metadata.create_all(
+                    sync_conn, tables=[models.Agent.__table__, models.AgentGroupMember.__table__]
+                )
+            )
+        async with AsyncSession(engine) as session:
+            for agent_id, groups in zip(agent_ids, agent_groups):
+                session.add(models.Agent(id=agent_id, name=agent_id, url="", groups=groups))
+            await session.commit()
+
+            for grants in grant_sets:
+                action_map: dict[tuple[str, str | None], set[str]] = {}
+                for grant in grants:
+                    action_map.setdefault((grant.resource_type, grant.resource_id), set()).add(grant.action)
+                access = build_view_access(grants)
+                pages, cursor = [], None
+                while True:
+                    page, cursor = await effective_resources_async(
+                        session, action_map, "agent", cursor=cursor, limit=5
+                    )
+                    pages.extend(resource_id for resource_id, _ in page)
+                    if cursor is None:
+                        break
+                expected = [
+                    agent_id
+                    for agent_id, groups in zip(agent_ids, agent_groups)
+                    if can_view_agent(access, agent_id, groups)
+                ]
+                assert pages == expected
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_synced_binding_does_not_reveal_other_agents() -> None:
+    import asyncio
+
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import StaticPool
+
+    import main  # noqa: F401  (resolves the chat_user_sync <-> api import cycle)
+    from app.db import Base
+    from app.services.agent_catalog import list_agent_rows
+
+    async def run() -> None:
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync_conn: Base.metadata.create_all(sync_conn))
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            user = models.User(account="u1", username="u1", email="u1@example.com", password_hash="x")
+            session.add(user)
+            await session.flush()
+            session.add(models.UserRole(user_id=user.id, role_name="user"))
+            session.add(models.Agent(id="synced", name="synced", url="", is_synced=True))
+            session.add(models.Agent(id="private", name="private", url=""))
+            session.add(models.Agent(id="synced-other", name="synced-other", url="", is_synced=True))
+            session.add(models.UserChatBinding(user_id=user.id, chat_user_id="chat-1"))
+            session.add(
+                models.AgentChatUserAccess(agent_id="synced", chat_user_id="chat-1", group_id="g1", is_auth=True)
+            )
+            await session.commit()
+
+            rows, _ = await list_agent_rows(session, user, fields=["id"])
+            assert [row.id for row in rows] == ["synced"]
+        await engine.dispose()
+
+    asyncio.run(run())